@@ -25,14 +25,26 @@ This module offers basic functionality for the Andor iDus ans iXon
 '''
 
 # Modules for Andor functionality
-from ctypes import windll, c_int, c_char, byref, c_long, \
-    pointer, c_float, c_char_p, cdll
-from PIL import Image
+from ctypes import c_int, c_char, byref, c_long, \
+    pointer, c_float, c_char_p, cdll, POINTER, c_ushort
+try:
+    from ctypes import windll
+except ImportError:
+    windll = None
+import numpy as np
+from bindings import PROTOTYPES, bind, set_verbose
+from export import save_image, save_text, save_npy, save_raw
+from profiler import traced
+from geometry import ReadoutGeometry
+from simulator import SimulatedSDK
+import logging
 import sys
 import time
 import platform
 import os
 
+log = logging.getLogger("pyandor.idus")
+
 #class AndorIdus(Instrument):
 class AndorIdus():
     """
@@ -41,17 +53,29 @@ class AndorIdus():
     on the functions used and error codes can be
     found in the Andor SDK Users Guide
     """
-    def __init__(self):
+    def __init__(self, backend=None):
         '''
         Loads and initializes the hardware driver.
         Initializes local parameters
 
         Input:
-            name (string)   : The name of the device
+            backend         : "sim" for the simulated SDK, the path of the
+                              SDK library, or an object implementing the
+                              SDK functions. Defaults to the PYANDOR_BACKEND
+                              environment variable, then to the installed
+                              SDK.
         '''
+        if backend is None:
+            backend = os.environ.get("PYANDOR_BACKEND")
 
         # Check operating system and load library
-        if platform.system() == "Linux":
+        if backend == "sim":
+            self._dll = SimulatedSDK()
+        elif isinstance(backend, str):
+            self._dll = cdll.LoadLibrary(backend)
+        elif backend is not None:
+            self._dll = backend
+        elif platform.system() == "Linux":
             dllname = "/usr/local/lib/libandor.so"
             self._dll = cdll.LoadLibrary(dllname)
         elif platform.system() == "Windows":
@@ -59,12 +83,12 @@ class AndorIdus():
             self._dll = windll.LoadLibrary(dllname)
         else:
             print "Cannot detect operating system, wil now stop"
-            raise
+            raise OSError("unsupported operating system")
+        self._dll = bind(self._dll, PROTOTYPES, ERROR_CODE, log)
 
         # Initialize the device
-        tekst = c_char()
-        error = self._dll.Initialize(byref(tekst))
-        print "Initializing: %s" % ( ERROR_CODE[error])
+        error = self._dll.Initialize("")
+        print "Initializing: %s" % ( error)
 
         cw = c_int()
         ch = c_int()
@@ -77,8 +101,8 @@ class AndorIdus():
         self._set_T        = None
         self._gain         = None
         self._gainRange    = None
-        self._status       = ERROR_CODE[error]
-        self._verbosity    = True
+        self._status       = error
+        self._verbosity    = log.isEnabledFor(logging.DEBUG)
         self._preampgain   = None
         self._channel      = None
         self._outamp       = None
@@ -87,6 +111,7 @@ class AndorIdus():
         self._serial       = None
         self._exposure     = None
         self._accumulate   = None
+        self._accumulations = 1
         self._kinetic      = None
         self._bitDepths    = []
         self._preAmpGain   = []
@@ -98,11 +123,30 @@ class AndorIdus():
         self._noADChannels = None
         self._noHSSpeeds   = None
         self._ReadMode     = None
+        self._AcquisitionMode = None
+        self._scans        = 1
+        self._hbin         = 1
+        self._vbin         = 1
+        self._hstart       = 1
+        self._hend         = self._width
+        self._vstart       = 1
+        self._vend         = self._height
+        self._rotate       = 0
+        self._numberTracks = 1
+        self._trackAreas   = None
+        self._geometry     = None
+        self._waitCancelled = False
+        self._cbuffer      = None
+        self._buffer       = None
+        self._bitDepth     = None
+        self._data16       = None
+        self._tracer       = None
+        self._spool        = None
+        self._shutter      = None
 
 
     def __del__(self):
        error = self._dll.ShutDown()
-       self._Verbose(ERROR_CODE[error] )
 
     def LINE( self, back = 0 ):
         '''
@@ -158,23 +202,26 @@ class AndorIdus():
         return "%s/%s %s()" % ( os.path.basename( frame.f_code.co_filename ),
                                 frame.f_lineno, frame.f_code.co_name )
 
-    def _Verbose(self, error):
+    def _Verbose(self, message, function=''):
         '''
-        Reports all error codes to stdout if self._verbosity=True
+        Logs a message of the wrapper at DEBUG level. The error codes of
+        the SDK calls are logged by the binding itself.
 
         Input:
-            error (string)  : The string resulted from the error code
-            name (string)   : The name of the function calling the device
+            message (string)  : The message
+            function (string) : The name of the function reporting it
 
         Output:
             None
         '''
-        if self._verbosity is True:
-            print "[%s]: %s" % (self.FUNC(1), error)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[%s]: %s", function, message)
 
     def SetVerbose(self, state=True):
         '''
-        Enable / disable printing error codes to stdout
+        Enable / disable logging the error codes of the SDK calls. They go
+        to the "pyandor.idus" logger, shared by all instances, and are
+        printed to stdout unless logging has been configured.
 
         Input:
             state (bool)  : toggle verbosity, default=True
@@ -183,6 +230,25 @@ class AndorIdus():
             None
         '''
         self._verbosity = state
+        set_verbose(log, state)
+
+    def SetTracer(self, tracer=None):
+        '''
+        Record the timing and result of every SDK call, data retrieval and
+        save in a tracer
+
+        Input:
+            tracer (CallTracer) : the profiler.CallTracer to record in, or
+                                  None (default) to stop recording
+
+        Output:
+            None
+        '''
+        if self._tracer is not None:
+            self._dll = self._dll.sdk
+        if tracer is not None:
+            self._dll = tracer.wrap(self._dll)
+        self._tracer = tracer
 
 # Get Camera properties
 
@@ -199,7 +265,6 @@ class AndorIdus():
         serial = c_int()
         error = self._dll.GetCameraSerialNumber(byref(serial))
         self._serial = serial.value
-        self._Verbose(ERROR_CODE[error] )
         return self._serial
 
     def GetNumberHSSpeeds(self):
@@ -213,10 +278,10 @@ class AndorIdus():
             (int) : the number of HS speeds
         '''
         noHSSpeeds = c_int()
-        error = self._dll.GetNumberHSSpeeds(self._channel, self._outamp,
+        error = self._dll.GetNumberHSSpeeds(self._channel or 0,
+                                            self._outamp or 0,
                                             byref(noHSSpeeds))
         self._noHSSpeeds = noHSSpeeds.value
-        self._Verbose(ERROR_CODE[error] )
         return self._noHSSpeeds
 
     def GetNumberVSSpeeds(self):
@@ -232,7 +297,6 @@ class AndorIdus():
         noVSSpeeds = c_int()
         error = self._dll.GetNumberVSSpeeds(byref(noVSSpeeds))
         self._noVSSpeeds = noVSSpeeds.value
-        self._Verbose(ERROR_CODE[error] )
         return self._noVSSpeeds
 
 # Cooler and temperature
@@ -247,7 +311,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.CoolerON()
-        self._Verbose(ERROR_CODE[error])
 
     def CoolerOFF(self):
         '''
@@ -260,7 +323,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.CoolerOFF()
-        self._Verbose(ERROR_CODE[error])
 
     def SetCoolerMode(self, mode):
         '''
@@ -273,7 +335,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetCoolerMode(mode)
-        self._Verbose(ERROR_CODE[error] )
 
     def IsCoolerOn(self):
         '''
@@ -287,7 +348,6 @@ class AndorIdus():
         '''
         iCoolerStatus = c_int()
         error = self._dll.IsCoolerOn(byref(iCoolerStatus))
-        self._Verbose(ERROR_CODE[error] )
         return iCoolerStatus.value
 
     def GetTemperature(self):
@@ -303,10 +363,9 @@ class AndorIdus():
         ctemperature = c_int()
         error = self._dll.GetTemperature(byref(ctemperature))
         self._temperature = ctemperature.value
-        self._Verbose(ERROR_CODE[error] )
-        print "Temperature is: %g [Set T: %g]" \
+        print "Temperature is: %g [Set T: %s]" \
             % (self._temperature, self._set_T)
-        return ERROR_CODE[error]
+        return error
 
     def SetTemperature(self, temperature): # Fixme:, see if this works
         '''
@@ -321,7 +380,6 @@ class AndorIdus():
 #        ctemperature = c_int(temperature)
         error = self._dll.SetTemperature(temperature)
         self._set_T = temperature
-        self._Verbose(ERROR_CODE[error] )
 
 
 ###### Single Parameters Set ######
@@ -335,8 +393,7 @@ class AndorIdus():
         Output:
             None
         '''
-        error = self._dll.SetAccumulationCycleTime(c_float(time_))
-        self._Verbose(ERROR_CODE[error] )
+        error = self._dll.SetAccumulationCycleTime(time_)
 
     def SetAcquisitionMode(self, mode):
         '''
@@ -349,7 +406,8 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetAcquisitionMode(mode)
-        self._Verbose(ERROR_CODE[error] )
+        self._AcquisitionMode = mode
+        self._geometry = None
 
     def SetADChannel(self, index):
         '''
@@ -362,8 +420,8 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetADChannel(index)
-        self._Verbose(ERROR_CODE[error] )
         self._channel = index
+        self._bitDepth = None
 
     def SetEMAdvanced(self, gainAdvanced):
         '''
@@ -376,7 +434,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetEMAdvanced(gainAdvanced)
-        self._Verbose(ERROR_CODE[error] )
 
     def SetEMCCDGainMode(self, gainMode):
         '''
@@ -389,7 +446,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetEMCCDGainMode(gainMode)
-        self._Verbose(ERROR_CODE[error] )
 
     def SetExposureTime(self, time_):
         '''
@@ -401,8 +457,9 @@ class AndorIdus():
         Output:
             None
         '''
-        error = self._dll.SetExposureTime(c_float(time_))
-        self._Verbose(ERROR_CODE[error] )
+        error = self._dll.SetExposureTime(time_)
+        if error == "DRV_SUCCESS":
+            self._exposure = time_
 
     def SetFrameTransferMode(self, frameTransfer):
         '''
@@ -415,7 +472,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetFrameTransferMode(frameTransfer)
-        self._Verbose(ERROR_CODE[error] )
 
     def SetImageRotate(self, iRotate):
         '''
@@ -428,7 +484,8 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetImageRotate(iRotate)
-        self._Verbose(ERROR_CODE[error] )
+        self._rotate = iRotate
+        self._geometry = None
 
     def SetKineticCycleTime(self, time_):
         '''
@@ -440,8 +497,7 @@ class AndorIdus():
         Output:
             None
         '''
-        error = self._dll.SetKineticCycleTime(c_float(time_))
-        self._Verbose(ERROR_CODE[error] )
+        error = self._dll.SetKineticCycleTime(time_)
 
     def SetNumberAccumulations(self, number):
         '''
@@ -455,7 +511,8 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetNumberAccumulations(number)
-        self._Verbose(ERROR_CODE[error] )
+        if error == "DRV_SUCCESS":
+            self._accumulations = number
 
     def SetNumberKinetics(self, numKin):
         '''
@@ -468,7 +525,8 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetNumberKinetics(numKin)
-        self._Verbose(ERROR_CODE[error] )
+        self._scans = numKin
+        self._geometry = None
 
     def SetOutputAmplifier(self, index):
         '''
@@ -481,7 +539,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetOutputAmplifier(index)
-        self._Verbose(ERROR_CODE[error] )
         self._outamp = index
 
     def SetReadMode(self, mode):
@@ -490,8 +547,8 @@ class AndorIdus():
 
         Input:
             mode (int) : 0 Full Vertical Binning
-                         1 Multi-Track
-                         2 Random-track
+                         1 Multi-Track, see SetMultiTrack
+                         2 Random-track, see SetRandomTracks
                          3 Single-Track
                          4 Image
 
@@ -500,7 +557,74 @@ class AndorIdus():
         '''
         error = self._dll.SetReadMode(mode)
         self._ReadMode = mode
-        self._Verbose(ERROR_CODE[error] )
+        self._geometry = None
+
+    def SetSingleTrack(self, centre, height):
+        '''
+        Set up the track of the Single-Track read mode
+
+        Input:
+            centre (int) : row at the centre of the track, 1-based
+            height (int) : rows in the track
+
+        Output:
+            (str) : the error code of the driver
+        '''
+        error = self._dll.SetSingleTrack(centre, height)
+        if error == "DRV_SUCCESS":
+            bottom = centre - height // 2
+            self._trackAreas = [(bottom, bottom + height - 1)]
+        return error
+
+    def SetMultiTrack(self, number, height, offset):
+        '''
+        Set up the tracks of the Multi-Track read mode. The tracks are
+        spread evenly over the sensor by the driver. Each frame is then
+        read as an array of (tracks, width).
+
+        Input:
+            number (int) : number of tracks
+            height (int) : rows per track
+            offset (int) : rows to move the tracks up by
+
+        Output:
+            (str) : the error code of the driver. The rows the driver
+                    placed the tracks on are in GetMetadata()["trackareas"]
+        '''
+        bottom = c_int()
+        gap = c_int()
+        error = self._dll.SetMultiTrack(number, height, offset,
+                                        byref(bottom), byref(gap))
+        if error == "DRV_SUCCESS":
+            pitch = height + gap.value
+            self._trackAreas = [(bottom.value + i * pitch,
+                                 bottom.value + i * pitch + height - 1)
+                                for i in range(number)]
+            self._numberTracks = number
+            self._geometry = None
+        return error
+
+    def SetRandomTracks(self, areas):
+        '''
+        Set up the tracks of the Random-Track read mode. Each frame is then
+        read as an array of (tracks, width).
+
+        Input:
+            areas (list) : (first row, last row) of each track, 1-based and
+                           inclusive, from the bottom of the sensor up
+
+        Output:
+            (str) : the error code of the driver
+        '''
+        areas = [(int(start), int(end)) for start, end in areas]
+        rows = (c_int * (2 * len(areas)))(*[row for area in areas
+                                            for row in area])
+        error = self._dll.SetRandomTracks(len(areas), rows)
+        if error == "DRV_SUCCESS":
+            self._trackAreas = areas
+            self._numberTracks = len(areas)
+            self._geometry = None
+        return error
 
     def SetTriggerMode(self, mode):
         '''
@@ -515,7 +639,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetTriggerMode(mode)
-        self._Verbose(ERROR_CODE[error] )
 
 
 ###### Single Parameters Get ######
@@ -533,39 +656,281 @@ class AndorIdus():
         acc = c_long()
         series = c_long()
         error = self._dll.GetAcquisitionProgress(byref(acc), byref(series))
-        if ERROR_CODE[error] == "DRV_SUCCESS":
+        if error == "DRV_SUCCESS":
             return acc.value
         else:
             return None
 
-    def GetAcquiredData(self, imageArray):
+    def GetGeometry(self):
+        '''
+        Returns the shape of the data for the current settings. It is
+        cached until one of the setters it depends on is called.
+
+        Input:
+            None
+
+        Output:
+            (ReadoutGeometry) : the readout geometry
+        '''
+        if self._geometry is None:
+            self._geometry = ReadoutGeometry(self._width, self._height,
+                self._ReadMode, self._AcquisitionMode, self._scans,
+                self._hbin, self._vbin, self._hstart, self._hend,
+                self._vstart, self._vend, self._numberTracks, self._rotate)
+        return self._geometry
+
+    def _FrameSize(self):
+        '''
+        Returns the number of pixels in a single frame
+
+        Input:
+            None
+
+        Output:
+            (int) : the number of pixels
+        '''
+        return self.GetGeometry().framesize
+
+    def _AcquiredDataSize(self):
+        '''
+        Returns the number of pixels in the current acquisition
+
+        Input:
+            None
+
+        Output:
+            (int) : the number of pixels
+        '''
+        return self.GetGeometry().size
+
+    def _DataBuffer(self, dim, ctype):
+        '''
+        Returns a numpy view of the ctypes buffer used for data retrieval.
+        The buffer is reused between calls and only reallocated when the
+        size or the type of the acquisition changes.
+
+        Input:
+            dim (int)     : the number of pixels
+            ctype (type)  : c_int or c_ushort
+
+        Output:
+            (ndarray) : array viewing the buffer
+        '''
+        if self._cbuffer is None or len(self._cbuffer) != dim \
+                or self._cbuffer._type_ is not ctype:
+            self._cbuffer = (ctype * dim)()
+            self._buffer = np.ctypeslib.as_array(self._cbuffer)
+        return self._buffer
+
+    def _ReadData(self, function, dim, out, before=(), after=()):
+        '''
+        Reads data through the given SDK function, using its 16-bit
+        variant when the camera is in 16-bit mode
+
+        Input:
+            function (string) : name of the 32-bit SDK function
+            dim (int)         : the number of pixels
+            out (ndarray)     : contiguous array to fill in place, or None
+            before (tuple)    : SDK arguments preceding the buffer
+            after (tuple)     : SDK arguments following the buffer size
+
+        Output:
+            (string)  : the error code
+            (ndarray) : the array holding the data
+        '''
+        if self.Is16Bit():
+            ctype, dtype, function = c_ushort, np.uint16, function + "16"
+        else:
+            ctype, dtype = c_int, np.int32
+
+        if out is None:
+            data = self._DataBuffer(dim, ctype)
+        else:
+            if out.dtype != dtype or not out.flags.c_contiguous \
+                    or out.size != dim:
+                raise ValueError("out must be a contiguous %s array "
+                                 "of %d elements" % (np.dtype(dtype).name, dim))
+            data = out.reshape(-1)
+
+        args = tuple(before) + (data.ctypes.data_as(POINTER(ctype)), dim) \
+            + tuple(after)
+        error = getattr(self._dll, function)(*args)
+        return error, data
+
+    def Set16Bit(self, state=None):
+        '''
+        Select 16-bit or 32-bit data retrieval
+
+        Input:
+            state (bool) : True/False to force 16/32-bit, None (default)
+                           to select from the bit depth of the AD channel
+
+        Output:
+            None
+        '''
+        self._data16 = state
+
+    def Is16Bit(self):
+        '''
+        Returns whether data is retrieved as 16-bit
+
+        Input:
+            None
+
+        Output:
+            (bool) : True for 16-bit retrieval
+        '''
+        if self._data16 is not None:
+            return self._data16
+        if self._bitDepth is None:
+            bitDepth = c_int()
+            error = self._dll.GetBitDepth(self._channel or 0, byref(bitDepth))
+            if error != "DRV_SUCCESS":
+                return False
+            self._bitDepth = bitDepth.value
+        return self._bitDepth <= 16
+
+    @traced("_tracer")
+    def GetAcquiredData(self, imageArray=None, out=None):
         '''
         Returns the Acquired data
 
+        Input:
+            imageArray (list)  : if given, the data is appended to this list
+            out (ndarray)      : contiguous array to fill in place
+
+        Output:
+            (list)    : a copy of the acquired data if imageArray is given
+            (ndarray) : otherwise a numpy array of the acquired data, uint16
+                        in 16-bit mode and int32 otherwise, shaped as
+                        GetGeometry().shape. Unless out is given, it views a
+                        buffer that is overwritten by the next call.
+        '''
+        error, data = self._ReadData("GetAcquiredData",
+                                     self._AcquiredDataSize(), out)
+        data = data.reshape(self.GetGeometry().shape)
+        self._imageArray = data
+
+        if imageArray is not None:
+            imageArray.extend(data.ravel().tolist())
+            return imageArray[:]
+
+        if out is not None:
+            return out
+        return data
+
+    @traced("_tracer")
+    def GetMostRecentImage(self, out=None):
+        '''
+        Returns the most recent frame of the acquisition
+
+        Input:
+            out (ndarray) : contiguous array to fill in place
+
+        Output:
+            (ndarray) : the frame, see GetAcquiredData
+        '''
+        error, data = self._ReadData("GetMostRecentImage", self._FrameSize(),
+                                     out)
+        data = data.reshape(self.GetGeometry().frameshape)
+        self._imageArray = data
+        if out is not None:
+            return out
+        return data
+
+    def GetFrameSize(self):
+        '''
+        Returns the number of pixels in a single frame
+
+        Input:
+            None
+
+        Output:
+            (int) : the number of pixels
+        '''
+        return self._FrameSize()
+
+    def GetNumberNewImages(self):
+        '''
+        Returns the range of frames in the circular buffer which have not
+        been retrieved yet
+
+        Input:
+            None
+
+        Output:
+            (tuple) : (first, last) series indices, None if there are none
+        '''
+        first = c_long()
+        last = c_long()
+        error = self._dll.GetNumberNewImages(byref(first), byref(last))
+        if error == "DRV_SUCCESS":
+            return (first.value, last.value)
+        else:
+            return None
+
+    def GetNumberAvailableImages(self):
+        '''
+        Returns the range of frames available in the circular buffer
+
         Input:
             None
 
         Output:
-            (array) : an array containing the acquired data
+            (tuple) : (first, last) series indices, None if there are none
+        '''
+        first = c_long()
+        last = c_long()
+        error = self._dll.GetNumberAvailableImages(byref(first), byref(last))
+        if error == "DRV_SUCCESS":
+            return (first.value, last.value)
+        else:
+            return None
+
+    @traced("_tracer")
+    def GetOldestImage(self, out=None):
+        '''
+        Returns the oldest frame which has not been retrieved yet
+
+        Input:
+            out (ndarray) : contiguous array to fill in place
+
+        Output:
+            (ndarray) : the frame, None if there is no new data
+        '''
+        error, data = self._ReadData("GetOldestImage", self._FrameSize(), out)
+        if error != "DRV_SUCCESS":
+            return None
+        data = data.reshape(self.GetGeometry().frameshape)
+        self._imageArray = data
+        return data
+
+    @traced("_tracer")
+    def GetImages(self, first, last, out=None):
         '''
-        # FIXME : Check how this works for FVB !!!
-        if self._ReadMode == 0:
-            dim = self._width
-        elif self._ReadMode == 4:
-            dim = self._width * self._height
-            
-        print "Dim is %s" % dim
-        cimageArray = c_int * dim
-        cimage = cimageArray()
-        error = self._dll.GetAcquiredData(pointer(cimage), dim)
-        self._Verbose(ERROR_CODE[error] )
+        Returns a range of frames from the circular buffer
 
-        for i in range(len(cimage)):
-            imageArray.append(cimage[i])
+        Input:
+            first (int)   : series index of the first frame (1-based)
+            last (int)    : series index of the last frame
+            out (ndarray) : contiguous array of (last - first + 1) frames
+                            to fill in place
 
-        self._imageArray = imageArray[:]
-        self._Verbose(ERROR_CODE[error] )
-        return self._imageArray
+        Output:
+            (ndarray) : the frames, shaped (frames,) + frame shape,
+                        None on failure
+        '''
+        validfirst = c_long()
+        validlast = c_long()
+        dim = self._FrameSize() * (last - first + 1)
+        error, data = self._ReadData("GetImages", dim, out, (first, last),
+                                     (byref(validfirst), byref(validlast)))
+        if error != "DRV_SUCCESS":
+            return None
+        data = data.reshape((last - first + 1,)
+                            + self.GetGeometry().frameshape)
+        self._imageArray = data
+        return data
 
     def GetBitDepth(self):
         '''
@@ -599,7 +964,6 @@ class AndorIdus():
         high = c_int()
         error = self._dll.GetEMGainRange(byref(low), byref(high))
         self._gainRange = (low.value, high.value)
-        self._Verbose(ERROR_CODE[error] )
         return self._gainRange
 
     def GetNumberADChannels(self):
@@ -615,7 +979,6 @@ class AndorIdus():
         noADChannels = c_int()
         error = self._dll.GetNumberADChannels(byref(noADChannels))
         self._noADChannels = noADChannels.value
-        self._Verbose(ERROR_CODE[error] )
         return self._noADChannels
 
     def GetNumberPreAmpGains(self):
@@ -631,7 +994,6 @@ class AndorIdus():
         noGains = c_int()
         error = self._dll.GetNumberPreAmpGains(byref(noGains))
         self._noGains = noGains.value
-        self._Verbose(ERROR_CODE[error] )
         return self._noGains
 
     def GetSeriesProgress(self):
@@ -647,7 +1009,7 @@ class AndorIdus():
         acc = c_long()
         series = c_long()
         error = self._dll.GetAcquisitionProgress(byref(acc), byref(series))
-        if ERROR_CODE[error] == "DRV_SUCCESS":
+        if error == "DRV_SUCCESS":
             return series.value
         else:
             return None
@@ -672,7 +1034,6 @@ class AndorIdus():
         status = c_int()
         error = self._dll.GetStatus(byref(status))
         self._status = ERROR_CODE[status.value]
-        self._Verbose(ERROR_CODE[error] )
         return self._status
 
 ###### Single Parameters Get/Set ######
@@ -689,7 +1050,6 @@ class AndorIdus():
         gain = c_int()
         error = self._dll.GetEMCCDGain(byref(gain))
         self._gain = gain.value
-        self._Verbose(ERROR_CODE[error] )
         return self._gain
 
     def SetEMCCDGain(self, gain):
@@ -703,7 +1063,8 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetEMCCDGain(gain)
-        self._Verbose(ERROR_CODE[error] )
+        if error == "DRV_SUCCESS":
+            self._gain = gain
 
     def GetHSSpeed(self):
         '''
@@ -718,7 +1079,8 @@ class AndorIdus():
         HSSpeed = c_float()
         self._HSSpeeds = []
         for i in range(self._noHSSpeeds):
-            self._dll.GetHSSpeed(self._channel, self._outamp, i, byref(HSSpeed))
+            self._dll.GetHSSpeed(self._channel or 0, self._outamp or 0, i,
+                                 byref(HSSpeed))
             self._HSSpeeds.append(HSSpeed.value)
         return self._HSSpeeds
 
@@ -732,8 +1094,7 @@ class AndorIdus():
         Output:
             None
         '''
-        error = self._dll.SetHSSpeed(index)
-        self._Verbose(ERROR_CODE[error] )
+        error = self._dll.SetHSSpeed(self._outamp or 0, index)
         self._hsspeed = index
 
     def GetVSSpeed(self):
@@ -765,7 +1126,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetVSSpeed(index)
-        self._Verbose(ERROR_CODE[error] )
         self._vsspeed = index
 
     def GetPreAmpGain(self):
@@ -797,7 +1157,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetPreAmpGain(index)
-        self._Verbose(ERROR_CODE[error] )
         self._preampgain = index
 
 
@@ -807,22 +1166,160 @@ class AndorIdus():
         Shut down the Andor
         '''
         error = self._dll.ShutDown()
-        self._Verbose(ERROR_CODE[error] )
 
     def AbortAcquisition(self):
         '''
-        Abort the acquisition
+        Abort the acquisition and wake up any thread waiting for it
         '''
         error = self._dll.AbortAcquisition()
-        self._Verbose(ERROR_CODE[error] )
+        self.CancelWait()
 
-    def StartAcquisition(self):
+    def StartAcquisition(self, wait=False, timeout=None):
         '''
         Start the acquisition
+
+        Input:
+            wait (bool)     : block until the acquisition is done,
+                              default=False
+            timeout (float) : maximum time to wait in seconds, default=None
+
+        Output:
+            (string) : the result of the wait, or of the start when not
+                       waiting or when the start failed
         '''
         error = self._dll.StartAcquisition()
-        #self._dll.WaitForAcquisition()
-        self._Verbose(ERROR_CODE[error] )
+        if wait and error == "DRV_SUCCESS":
+            return self.WaitForCompletion(timeout)
+        return error
+
+    def WaitForAcquisition(self):
+        '''
+        Block until the next frame or the end of the acquisition
+        '''
+        error = self._dll.WaitForAcquisition()
+
+    def WaitForAcquisitionTimeOut(self, timeout):
+        '''
+        Block until the next frame or the end of the acquisition
+
+        Input:
+            timeout (int) : maximum time to wait in milliseconds
+
+        Output:
+            (string) : DRV_SUCCESS or DRV_NO_NEW_DATA if nothing arrived
+        '''
+        error = self._dll.WaitForAcquisitionTimeOut(int(timeout))
+        return error
+
+    def CancelWait(self):
+        '''
+        Wake up a thread waiting in WaitForAcquisition
+        '''
+        self._waitCancelled = True
+        error = self._dll.CancelWait()
+
+    def WaitForCompletion(self, timeout=None, interval=1.0):
+        '''
+        Sleep on the driver's acquisition event until the acquisition has
+        finished. The status is also checked every interval seconds in case
+        an event was missed.
+
+        Input:
+            timeout (float)  : maximum time to wait in seconds, default=None
+            interval (float) : seconds between status checks, default=1.0
+
+        Output:
+            (string) : DRV_SUCCESS when finished, DRV_NO_NEW_DATA when
+                       CancelWait was called or the timeout passed
+        '''
+        self._waitCancelled = False
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            wait = interval
+            if timeout is not None:
+                wait = min(interval, deadline - time.time())
+            if wait > 0:
+                self.WaitForAcquisitionTimeOut(wait * 1000)
+            if self._waitCancelled:
+                self._Verbose("Wait cancelled", "WaitForCompletion")
+                return "DRV_NO_NEW_DATA"
+            if self.GetStatus() != "DRV_ACQUIRING":
+                return "DRV_SUCCESS"
+            if timeout is not None and time.time() >= deadline:
+                self._Verbose("Timed out after %g s" % timeout,
+                              "WaitForCompletion")
+                return "DRV_NO_NEW_DATA"
+
+    def iter_frames(self, n=None, timeout=None, ring=None):
+        '''
+        Stream frames in run till abort mode (acquisition mode 5), yielding
+        each one as the driver reports it. When n frames have been read or
+        the consumer stops iterating, the acquisition is aborted and the
+        previous acquisition mode restored. Raises RuntimeError if the
+        acquisition does not start.
+
+        Input:
+            n (int)         : number of frames, default=None for no limit
+            timeout (float) : longest wait for a new frame in seconds,
+                              default=None to wait indefinitely
+            ring (FrameRingBuffer) : preallocated slots to move the
+                                     frames into, counting the frames lost
+                                     from the camera's buffer in its
+                                     overruns, default=None
+
+        Output:
+            (ndarray) : the frames, as views of a reused buffer. Copy them
+                        to keep them.
+        '''
+        previous = self._AcquisitionMode
+        self.SetAcquisitionMode(5)
+        error = self.StartAcquisition(wait=False)
+        if error != "DRV_SUCCESS":
+            if previous is not None:
+                self.SetAcquisitionMode(previous)
+            raise RuntimeError("acquisition did not start: %s" % error)
+        if ring is not None:
+            ring.reset()
+        count = 0
+
+        try:
+            while n is None or count < n:
+                if ring is not None:
+                    ring.fill(self)
+                    if len(ring):
+                        limit = None if n is None else n - count
+                        for frame in ring.drain(limit):
+                            self._imageArray = frame
+                            count += 1
+                            yield frame
+                        continue
+                    new = None
+                else:
+                    new = self.GetNumberNewImages()
+                if new is None:
+                    if timeout is None:
+                        self.WaitForAcquisitionTimeOut(1000)
+                    elif self.WaitForAcquisitionTimeOut(timeout * 1000) \
+                            != "DRV_SUCCESS":
+                        raise RuntimeError("no frame within %g s" % timeout)
+                    continue
+
+                first, last = new
+                if n is not None:
+                    last = min(last, first + n - count - 1)
+                frames = self.GetImages(first, last)
+                if frames is None:
+                    continue
+                for frame in frames:
+                    self._imageArray = frame
+                    count += 1
+                    yield frame
+        finally:
+            self.AbortAcquisition()
+            if previous is not None:
+                self.SetAcquisitionMode(previous)
 
     def SetSingleImage(self):
         '''
@@ -853,7 +1350,6 @@ class AndorIdus():
         self._exposure = exposure.value
         self._accumulate = accumulate.value
         self._kinetic = kinetic.value
-        self._Verbose(ERROR_CODE[error] )
 
 
 ###### Misc functions ######
@@ -874,7 +1370,13 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetImage(hbin, vbin, hstart, hend, vstart, vend)
-        self._Verbose(ERROR_CODE[error] )
+        self._hbin = hbin
+        self._vbin = vbin
+        self._hstart = hstart
+        self._hend = hend
+        self._vstart = vstart
+        self._vend = vend
+        self._geometry = None
 
     def SetShutter(self, typ, mode, closingtime, openingtime):
         '''
@@ -890,7 +1392,8 @@ class AndorIdus():
             None
         '''
         error = self._dll.SetShutter(typ, mode, closingtime, openingtime)
-        self._Verbose(ERROR_CODE[error] )
+        if error == "DRV_SUCCESS":
+            self._shutter = [typ, mode, closingtime, openingtime]
 
     def SetShutterEx(self, typ, mode, closingtime, openingtime, extmode):
         '''
@@ -908,16 +1411,27 @@ class AndorIdus():
         '''
         error = self._dll.SetShutterEx(typ, mode, closingtime, openingtime,
                                        extmode)
-        self._Verbose(ERROR_CODE[error] )
 
     def SetSpool(self, active, method, path, framebuffersize):
         '''
         Set Spooling. Refer to manual for detailed description
         '''
-        error = self._dll.SetSpool(active, method, c_char_p(path),
+        error = self._dll.SetSpool(active, method, path,
                                    framebuffersize)
-        self._Verbose(ERROR_CODE[error] )
+        if error == "DRV_SUCCESS":
+            self._spool = (method, path) if active else None
+        return error
 
+    def GetSpool(self):
+        '''
+        Returns the spooling set by SetSpool
+
+        Output:
+            (tuple) : (method, path), or None when spooling is off
+        '''
+        return self._spool
+
+    @traced("_tracer")
     def SaveAsBmp(self, path):
         '''
         Save the most recent acquired image as a bitmap
@@ -928,32 +1442,115 @@ class AndorIdus():
         Output:
             None
         '''
-        im = Image.new("RGB", (self._height, self._width), "white")
-        pix = im.load()
+        save_image(path, self._imageArray, "BMP")
+
+    @traced("_tracer")
+    def SaveAsImage(self, path, bits=8, normalise=None,
+                    percentiles=(1.0, 99.0)):
+        '''
+        Save the most recent acquired image as a grayscale BMP, PNG or
+        TIFF image, by the file extension
 
-        for i in range(len(self._imageArray)):
-            (row, col) = divmod(i, self._width)
-            picvalue = int(round(self._imageArray[i]*255.0/65535))
-            pix[row, col] = (picvalue, picvalue, picvalue)
+        Input:
+            path (string)       : Filename to save to
+            bits (int)          : 8 (default) or 16, PNG and TIFF only
+            normalise (string)  : None (default) for the 16-bit range,
+                                  "minmax" or "percentile" to stretch
+                                  the contrast
+            percentiles (tuple) : the percentiles mapped to black and
+                                  white with "percentile"
 
-        im.save(path,"BMP")
+        Output:
+            None
+        '''
+        save_image(path, self._imageArray, bits=bits, normalise=normalise,
+                   percentiles=percentiles)
 
-    def SaveAsTxt(self, path):
+    @traced("_tracer")
+    def SaveAsTxt(self, path, layout="column", wavelengths=None):
         '''
         Save the most recent acquired image as txt
 
+        Input:
+            path (string)       : Filename to save to
+            layout (string)     : "column" (default) for one value per
+                                  line, "rows" for one image row per line,
+                                  "spectrum" for a wavelength column
+                                  followed by a column per track or frame
+            wavelengths (list)  : wavelengths of the pixel columns for
+                                  "spectrum", default pixel numbers
+
+        Output:
+            None
+        '''
+        save_text(path, self._imageArray, layout, wavelengths)
+
+    @traced("_tracer")
+    def SaveAsNpy(self, path):
+        '''
+        Save the most recent acquired data as a numpy .npy file
+
+        Input:
+            path (string) : Filename to save to
+
+        Output:
+            None
+        '''
+        save_npy(path, self._imageArray)
+
+    @traced("_tracer")
+    def SaveAsRaw(self, path):
+        '''
+        Save the most recent acquired data as raw binary, with its dtype,
+        shape and the camera settings in path + ".json". Read it back with
+        export.load_raw.
+
         Input:
             path (string) : Filename to save to
 
         Output:
             None
         '''
-        filename = open(path, 'w')
+        save_raw(path, self._imageArray, self.GetMetadata())
 
-        for line in self._imageArray:
-            filename.write("%g\n" % line)
-        filename.close()
+    def GetMetadata(self):
+        '''
+        Returns the settings the current data was taken with
 
+        Input:
+            None
+
+        Output:
+            (dict) : the settings by name
+        '''
+        return {
+            "serial": self._serial,
+            "width": self._width,
+            "height": self._height,
+            "readmode": self._ReadMode,
+            "acquisitionmode": self._AcquisitionMode,
+            "exposure": self._exposure,
+            "accumulate": self._accumulate,
+            "accumulations": self._accumulations,
+            "kinetic": self._kinetic,
+            "scans": self._scans,
+            "image": [self._hbin, self._vbin, self._hstart, self._hend,
+                      self._vstart, self._vend],
+            "rotate": self._rotate,
+            "tracks": self._numberTracks,
+            "trackareas": self._trackAreas,
+            "temperature": self._temperature,
+            "setpoint": self._set_T,
+            "shutter": self._shutter,
+            "preampgain": self._preampgain,
+            "emgain": self._gain,
+            "channel": self._channel,
+            "outamp": self._outamp,
+            "hsspeed": self._hsspeed,
+            "vsspeed": self._vsspeed,
+        }
+
+    @traced("_tracer")
     def SaveAsBmpNormalised(self, path):
         '''
         Save the most recent acquired image as a bitmap,
@@ -965,17 +1562,7 @@ class AndorIdus():
         Output:
             None
         '''
-        im = Image.new("RGB", (self._height, self._width),"white")
-        pix = im.load()
-        maxIntensity = max(self._imageArray)
-        minIntensity = min(self._imageArray)
-        print maxIntensity, minIntensity
-        for i in range(len(self._imageArray)):
-            (row, col) = divmod(i, self._width)
-            picvalue = int(round((self._imageArray[i]-minIntensity)*255.0/
-                (maxIntensity-minIntensity)))
-            pix[row, col] = (picvalue, picvalue, picvalue)
-        im.save(path, "BMP")
+        save_image(path, self._imageArray, "BMP", normalise="minmax")
 
     def SaveAsFITS(self, filename, type_):
         '''
@@ -988,7 +1575,6 @@ class AndorIdus():
             None
         '''
         error = self._dll.SaveAsFITS(filename, type_)
-        self._Verbose(ERROR_CODE[error] )
 
 
 ########### Automation functions #################
@@ -1003,7 +1589,7 @@ class AndorIdus():
         self.SetTemperature(Tset)
         self.CoolerON()
 
-        while self.GetTemperature() is not 'DRV_TEMP_STABILIZED':
+        while self.GetTemperature() != 'DRV_TEMP_STABILIZED':
             time.sleep(10)
 
     def Demo_ImagePrepare(self):
@@ -1017,28 +1603,41 @@ class AndorIdus():
         self.SetPreAmpGain(PreAmpGain)
         self.SetExposureTime(0.1)
 
-    def Demo_ImageCapture(self):
+    def Demo_ImageCapture(self, timeout=10):
         '''
         Perform the demo image measurement
-        '''
-        i = 0
-        while i < 4:
-            i += 1
-            print self.GetTemperature()
-            print self._temperature
-            print "Ready for Acquisition"
-            self.StartAcquisition()
-
-            # Check for status
-            while self.GetStatus() is not 'DRV_IDLE':
-                print "Data not yet acquired, waiting 0.5s"
-                time.sleep(0.5)
 
-            data = []
-            self.GetAcquiredData(data)
-            self.SaveAsBmpNormalised("n%03g.bmp" % i)
-            self.SaveAsBmp("%03g.bmp" % i)
-            self.SaveAsTxt("%03g.txt" % i)
+        Input:
+            timeout (float) : seconds to wait for each acquisition
+        '''
+        # Imported here so that the driver itself does not need the
+        # concurrent.futures backport on Python 2
+        from savepool import SavePool
+
+        pool = SavePool()
+        try:
+            i = 0
+            while i < 4:
+                i += 1
+                print self.GetTemperature()
+                print self._temperature
+                print "Ready for Acquisition"
+                if self.StartAcquisition(wait=True, timeout=timeout) \
+                        != "DRV_SUCCESS":
+                    print "Acquisition %d did not complete, aborting" % i
+                    self.AbortAcquisition()
+                    continue
+
+                # The files are written in the background while the next
+                # frame is exposed
+                pool.submit(self.GetAcquiredData(),
+                            [("bmp-normalised", "n%03g.bmp" % i),
+                             ("bmp", "%03g.bmp" % i),
+                             ("txt", "%03g.txt" % i)],
+                            self.GetMetadata())
+        finally:
+            pool.close()
+        pool.check()
 
     def Demo_FVBPrepare(self):
         '''
@@ -1051,9 +1650,12 @@ class AndorIdus():
         self.SetPreAmpGain(PreAmpGain)
         self.SetExposureTime(0.1)
 
-    def Demo_FVBCapture(self):
+    def Demo_FVBCapture(self, timeout=10):
         '''
         Perform the demo image measurement
+
+        Input:
+            timeout (float) : seconds to wait for each acquisition
         '''
         i = 0
         while i < 4:
@@ -1061,12 +1663,11 @@ class AndorIdus():
             print self.GetTemperature()
             print self._temperature
             print "Ready for Acquisition"
-            self.StartAcquisition()
-
-            # Check for status
-            while self.GetStatus() is not 'DRV_IDLE':
-                print "Data not yet acquired, waiting 0.5s"
-                time.sleep(0.5)
+            if self.StartAcquisition(wait=True, timeout=timeout) \
+                    != "DRV_SUCCESS":
+                print "Acquisition %d did not complete, aborting" % i
+                self.AbortAcquisition()
+                continue
 
             data = []
             self.GetAcquiredData(data)
@@ -15,9 +15,16 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import platform
+import os
 from ctypes import *
-from PIL import Image
-import sys
+import numpy as np
+import time
+import logging
+from bindings import PROTOTYPES, bind, set_verbose
+from export import save_image, save_text, save_npy, save_raw
+from profiler import traced
+from geometry import ReadoutGeometry
+from simulator import SimulatedSDK
 
 """Andor class which is meant to provide the Python version of the same
    functions that are defined in the Andor's SDK. Since Python does not
@@ -25,25 +32,41 @@ import sys
    are actually stored in the class instance. For example the temperature,
    gain, gainRange, status etc. are stored in the class. """
 
-class Andor:
-    def __init__(self):
+log = logging.getLogger("pyandor.andor")
 
+class Andor:
+    def __init__(self, backend=None):
+
+        # The backend is either "sim" for the simulated SDK, the path of the
+        # SDK library, or an object implementing the SDK functions. It
+        # defaults to the PYANDOR_BACKEND environment variable.
+        if backend is None:
+            backend = os.environ.get("PYANDOR_BACKEND")
+
+        if backend == "sim":
+            self.dll = SimulatedSDK()
+        elif isinstance(backend, str):
+            self.dll = cdll.LoadLibrary(backend)
+        elif backend is not None:
+            self.dll = backend
         # Check operating system and load library
         # for Windows
-        if platform.system() == "Windows":
+        elif platform.system() == "Windows":
             if platform.architecture()[0] == "32bit":
-                self.dll = cdll("C:\\Program Files\\Andor SOLIS\\Drivers\\atmcd32d")
+                self.dll = cdll.LoadLibrary("C:\\Program Files\\Andor SOLIS\\Drivers\\atmcd32d")
             else:
-                self.dll = cdll("C:\\Program Files\\Andor SOLIS\\Drivers\\atmcd64d")
+                self.dll = cdll.LoadLibrary("C:\\Program Files\\Andor SOLIS\\Drivers\\atmcd64d")
         # for Linux
-        if platform.system() == "Linux":
+        elif platform.system() == "Linux":
             dllname = "/usr/local/lib/libandor.so"
             self.dll = cdll.LoadLibrary(dllname)
         else:
             print "Cannot detect operating system, wil now stop"
-            raise
+            raise OSError("unsupported operating system")
+        self.dll = bind(self.dll, PROTOTYPES, ERROR_CODE, log)
 
-        self.Initialize()
+        self.verbosity   = log.isEnabledFor(logging.DEBUG)
+        error = self.Initialize()
 
         cw = c_int()
         ch = c_int()
@@ -56,8 +79,7 @@ class Andor:
         self.set_T       = None
         self.gain        = None
         self.gainRange   = None
-        self.status      = ERROR_CODE[error]
-        self.verbosity   = True
+        self.status      = error
         self.preampgain  = None
         self.channel     = None
         self.outamp      = None
@@ -66,6 +88,7 @@ class Andor:
         self.serial      = None
         self.exposure    = None
         self.accumulate  = None
+        self.accumulations = 1
         self.kinetic     = None
         self.ReadMode    = None
         self.AcquisitionMode = None
@@ -73,88 +96,110 @@ class Andor:
         self.hbin        = 1
         self.vbin        = 1
         self.hstart      = 1
-        self.hend        = cw
+        self.hend        = cw.value
         self.vstart      = 1
-        self.vend        = ch
+        self.vend        = ch.value
+        self.rotate      = 0
+        self.numberTracks = 1
+        self.trackAreas  = None
+        self.geometry    = None
         self.cooler      = None
+        self.imageArray  = None
+        self._cbuffer    = None
+        self._buffer     = None
+        self.bitDepth    = None
+        self.data16      = None
+        self.waitCancelled = False
+        self.tracer      = None
+        self.spool       = None
+        self.shutter     = None
         
     def __del__(self):
         error = self.dll.ShutDown()
     
     def verbose(self, error, function=''):
-        if self.verbosity is True:
-            print "[%s]: %s" %(function, error)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[%s]: %s", function, error)
 
     def SetVerbose(self, state=True):
-        self.verbose = state
+        # The SDK calls of every Andor instance are logged to the
+        # "pyandor.andor" logger at DEBUG level; this sets its level
+        self.verbosity = state
+        set_verbose(log, state)
+
+    def SetTracer(self, tracer=None):
+        # Records every SDK call, data retrieval and save in tracer (a
+        # profiler.CallTracer), or stops recording with None
+        if self.tracer is not None:
+            self.dll = self.dll.sdk
+        if tracer is not None:
+            self.dll = tracer.wrap(self.dll)
+        self.tracer = tracer
 
     def AbortAcquisition(self):
         error = self.dll.AbortAcquisition()
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        # Wake up any thread still waiting for the aborted acquisition
+        self.CancelWait()
+        return error
 
     def Initialize(self):
-        tekst = c_char()  
-        error = self.dll.Initialize(byref(tekst))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.Initialize("")
+        return error
         
     def ShutDown(self):
         error = self.dll.ShutDown()
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def GetCameraSerialNumber(self):
         serial = c_int()
         error = self.dll.GetCameraSerialNumber(byref(serial))
         self.serial = serial.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def SetReadMode(self, mode):
         #0: Full vertical binning
-        #1: multi track
-        #2: random track
+        #1: multi track, see SetMultiTrack
+        #2: random track, see SetRandomTracks
         #3: single track
         #4: image
         error = self.dll.SetReadMode(mode)
         self.ReadMode = mode
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        self.geometry = None
+        return error
 
     def SetAcquisitionMode(self, mode):
         #1: Single scan
         #3: Kinetic scan
         error = self.dll.SetAcquisitionMode(mode)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         self.AcquisitionMode = mode
-        return ERROR_CODE[error]
+        self.geometry = None
+        return error
         
     def SetNumberKinetics(self,numKin):
         error = self.dll.SetNumberKinetics(numKin)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         self.scans = numKin
-        return ERROR_CODE[error]
+        self.geometry = None
+        return error
 
     def SetNumberAccumulations(self,number):
         error = self.dll.SetNumberAccumulations(number)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        if error == "DRV_SUCCESS":
+            self.accumulations = number
+        return error
 
     def SetAccumulationCycleTime(self,time):
-        error = self.dll.SetAccumulationCycleTime(c_float(time))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.SetAccumulationCycleTime(time)
+        return error
 
     def SetKineticCycleTime(self,time):
-        error = self.dll.SetKineticCycleTime(c_float(time))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.SetKineticCycleTime(time)
+        return error
 
     def SetShutter(self,typ,mode,closingtime,openingtime):
         error = self.dll.SetShutter(typ,mode,closingtime,openingtime)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        if error == "DRV_SUCCESS":
+            self.shutter = [typ, mode, closingtime, openingtime]
+        return error
 
     def SetImage(self,hbin,vbin,hstart,hend,vstart,vend):
         self.hbin = hbin
@@ -163,46 +208,250 @@ class Andor:
         self.hend = hend
         self.vstart = vstart
         self.vend = vend
+        self.geometry = None
         
         error = self.dll.SetImage(hbin,vbin,hstart,hend,vstart,vend)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
-    def StartAcquisition(self):
+    def StartAcquisition(self, wait=True, timeout=None):
+        # With wait, blocks until the acquisition is complete or timeout
+        # seconds have passed and returns the result of the wait
         error = self.dll.StartAcquisition()
-        self.dll.WaitForAcquisition()
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
-
-    def GetAcquiredData(self,imageArray):
-        if (self.ReadMode==4):
-            if (self.AcquisitionMode==1):
-                dim = self.width * self.height / self.hbin / self.vbin
-            elif (self.AcquisitionMode==3):
-                dim = self.width * self.height / self.hbin / self.vbin * self.scans
-        elif (self.ReadMode==3 or self.ReadMode==0):
-            if (self.AcquisitionMode==1):
-                dim = self.width
-            elif (self.AcquisitionMode==3):
-                dim = self.width * self.scans
-
-        cimageArray = c_int * dim
-        cimage = cimageArray()
-        error = self.dll.GetAcquiredData(pointer(cimage),dim)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-
-        for i in range(len(cimage)):
-            imageArray.append(cimage[i])
-
-        self.imageArray = imageArray[:]
-        #self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        if wait and error == "DRV_SUCCESS":
+            return self.WaitForCompletion(timeout)
+        return error
+
+    def WaitForAcquisition(self):
+        error = self.dll.WaitForAcquisition()
+        return error
+
+    def WaitForAcquisitionTimeOut(self, timeout):
+        # timeout in milliseconds, DRV_NO_NEW_DATA if nothing arrived
+        error = self.dll.WaitForAcquisitionTimeOut(int(timeout))
+        return error
+
+    def CancelWait(self):
+        self.waitCancelled = True
+        error = self.dll.CancelWait()
+        return error
+
+    def WaitForCompletion(self, timeout=None, interval=1.0):
+        # Sleeps on the driver's acquisition event until the acquisition
+        # has finished. Returns DRV_SUCCESS, or DRV_NO_NEW_DATA when
+        # CancelWait was called or timeout seconds passed. The status is
+        # also checked every interval seconds in case an event was missed.
+        self.waitCancelled = False
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            wait = interval
+            if timeout is not None:
+                wait = min(interval, deadline - time.time())
+            if wait > 0:
+                self.WaitForAcquisitionTimeOut(wait * 1000)
+            if self.waitCancelled:
+                self.verbose("Wait cancelled", "WaitForCompletion")
+                return "DRV_NO_NEW_DATA"
+            if self.GetStatus() != "DRV_ACQUIRING":
+                return "DRV_SUCCESS"
+            if timeout is not None and time.time() >= deadline:
+                self.verbose("Timed out after %g s" % timeout, "WaitForCompletion")
+                return "DRV_NO_NEW_DATA"
+
+    def GetGeometry(self):
+        # Shape of the data for the current settings, cached until one of
+        # the setters it depends on is called
+        if self.geometry is None:
+            self.geometry = ReadoutGeometry(self.width, self.height, self.ReadMode, self.AcquisitionMode, self.scans,
+                                            self.hbin, self.vbin, self.hstart, self.hend, self.vstart, self.vend,
+                                            self.numberTracks, self.rotate)
+        return self.geometry
+
+    def _FrameSize(self):
+        return self.GetGeometry().framesize
+
+    def _AcquiredDataSize(self):
+        return self.GetGeometry().size
+
+    def _DataBuffer(self, dim, ctype):
+        # The ctypes buffer is kept between calls and only reallocated when
+        # the size or the type of the acquisition changes
+        if self._cbuffer is None or len(self._cbuffer) != dim or self._cbuffer._type_ is not ctype:
+            self._cbuffer = (ctype * dim)()
+            self._buffer = np.ctypeslib.as_array(self._cbuffer)
+        return self._buffer
+
+    def _ReadData(self, function, dim, out, before=(), after=()):
+        # 16-bit data is read through the "16" variant of the SDK function.
+        # before and after are the arguments around the buffer and its size.
+        if self.Is16Bit():
+            ctype, dtype, function = c_ushort, np.uint16, function + "16"
+        else:
+            ctype, dtype = c_int, np.int32
+
+        if out is None:
+            data = self._DataBuffer(dim, ctype)
+        else:
+            if out.dtype != dtype or not out.flags.c_contiguous or out.size != dim:
+                raise ValueError("out must be a contiguous %s array of %d elements" % (np.dtype(dtype).name, dim))
+            data = out.reshape(-1)
+
+        args = tuple(before) + (data.ctypes.data_as(POINTER(ctype)), dim) + tuple(after)
+        error = getattr(self.dll, function)(*args)
+        return error, data
+
+    def Set16Bit(self, state=None):
+        # True/False forces 16/32-bit data retrieval, None selects it from
+        # the bit depth of the current AD channel
+        self.data16 = state
+
+    def Is16Bit(self):
+        if self.data16 is not None:
+            return self.data16
+        if self.bitDepth is None:
+            bitDepth = c_int()
+            error = self.dll.GetBitDepth(self.channel or 0, byref(bitDepth))
+            if error != "DRV_SUCCESS":
+                return False
+            self.bitDepth = bitDepth.value
+        return self.bitDepth <= 16
+
+    @traced("tracer")
+    def GetAcquiredData(self, imageArray=None, out=None):
+        # Given a list, the data is appended to it and the error code is
+        # returned as before. Otherwise a numpy array (uint16 for 16-bit
+        # data, int32 otherwise) is returned which views a buffer that is
+        # overwritten by the next call, unless an array is passed as out to
+        # be filled in place. The array is shaped (frames, rows, columns)
+        # for kinetic series, with the axes of GetGeometry().
+        error, data = self._ReadData("GetAcquiredData", self._AcquiredDataSize(), out)
+        data = data.reshape(self.GetGeometry().shape)
+        self.imageArray = data
+
+        if imageArray is not None:
+            imageArray.extend(data.ravel().tolist())
+            return error
+
+        if out is not None:
+            return out
+        return data
+
+    @traced("tracer")
+    def GetMostRecentImage(self, out=None):
+        error, data = self._ReadData("GetMostRecentImage", self._FrameSize(), out)
+        data = data.reshape(self.GetGeometry().frameshape)
+        self.imageArray = data
+        if out is not None:
+            return out
+        return data
+
+    def GetFrameSize(self):
+        return self._FrameSize()
+
+    def GetNumberNewImages(self):
+        first = c_long()
+        last = c_long()
+        error = self.dll.GetNumberNewImages(byref(first), byref(last))
+        if error == "DRV_SUCCESS":
+            return (first.value, last.value)
+        else:
+            return None
+
+    def GetNumberAvailableImages(self):
+        first = c_long()
+        last = c_long()
+        error = self.dll.GetNumberAvailableImages(byref(first), byref(last))
+        if error == "DRV_SUCCESS":
+            return (first.value, last.value)
+        else:
+            return None
+
+    @traced("tracer")
+    def GetOldestImage(self, out=None):
+        # Returns the oldest frame not yet retrieved, or None if there is none
+        error, data = self._ReadData("GetOldestImage", self._FrameSize(), out)
+        if error != "DRV_SUCCESS":
+            return None
+        data = data.reshape(self.GetGeometry().frameshape)
+        self.imageArray = data
+        return data
+
+    @traced("tracer")
+    def GetImages(self, first, last, out=None):
+        # Reads frames first to last (1-based series indices) into one array
+        # of shape (last - first + 1,) + frame shape, or returns None on
+        # failure
+        validfirst = c_long()
+        validlast = c_long()
+        dim = self._FrameSize() * (last - first + 1)
+        error, data = self._ReadData("GetImages", dim, out, (first, last), (byref(validfirst), byref(validlast)))
+        if error != "DRV_SUCCESS":
+            return None
+        data = data.reshape((last - first + 1,) + self.GetGeometry().frameshape)
+        self.imageArray = data
+        return data
+
+    def iter_frames(self, n=None, timeout=None, ring=None):
+        # Streams frames in run till abort mode (acquisition mode 5),
+        # yielding each one as the driver reports it, until n frames have
+        # been read or the consumer stops iterating. The acquisition is then
+        # aborted and the previous acquisition mode restored. The frames are
+        # views of a reused buffer, copy them to keep them. timeout is the
+        # longest wait in seconds for a new frame. Raises RuntimeError if the
+        # acquisition does not start. With a FrameRingBuffer as ring, the
+        # new frames are moved into its preallocated slots instead, and
+        # frames lost from the camera's buffer are counted in its overruns.
+        previous = self.AcquisitionMode
+        self.SetAcquisitionMode(5)
+        error = self.StartAcquisition(wait=False)
+        if error != "DRV_SUCCESS":
+            if previous is not None:
+                self.SetAcquisitionMode(previous)
+            raise RuntimeError("acquisition did not start: %s" % error)
+        if ring is not None:
+            ring.reset()
+        count = 0
+
+        try:
+            while n is None or count < n:
+                if ring is not None:
+                    ring.fill(self)
+                    if len(ring):
+                        for frame in ring.drain(None if n is None else n - count):
+                            self.imageArray = frame
+                            count += 1
+                            yield frame
+                        continue
+                    new = None
+                else:
+                    new = self.GetNumberNewImages()
+                if new is None:
+                    if timeout is None:
+                        self.WaitForAcquisitionTimeOut(1000)
+                    elif self.WaitForAcquisitionTimeOut(timeout * 1000) != "DRV_SUCCESS":
+                        raise RuntimeError("no frame within %g s" % timeout)
+                    continue
+
+                first, last = new
+                if n is not None:
+                    last = min(last, first + n - count - 1)
+                frames = self.GetImages(first, last)
+                if frames is None:
+                    continue
+                for frame in frames:
+                    self.imageArray = frame
+                    count += 1
+                    yield frame
+        finally:
+            self.AbortAcquisition()
+            if previous is not None:
+                self.SetAcquisitionMode(previous)
 
     def SetExposureTime(self, time):
-        error = self.dll.SetExposureTime(c_float(time))
+        error = self.dll.SetExposureTime(time)
         self.exposure = time
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def GetAcquisitionTimings(self):
         exposure   = c_float()
@@ -212,8 +461,7 @@ class Andor:
         self.exposure = exposure.value
         self.accumulate = accumulate.value
         self.kinetic = kinetic.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def SetSingleScan(self):
         self.SetReadMode(4)
@@ -222,129 +470,146 @@ class Andor:
 
     def SetCoolerMode(self, mode):
         error = self.dll.SetCoolerMode(mode)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def SetFanMode(self, mode):
         #0: fan on full
         #1: fan on low
         #2: fna off
         error = self.dll.SetFanMode(mode)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
+    @traced("tracer")
     def SaveAsBmp(self, path):
-        im=Image.new("RGB",(self.width,self.height),"white")
-        pix = im.load()
-
-        for i in range(len(self.imageArray)):
-            (row, col) = divmod(i,self.width)
-            picvalue = int(round(self.imageArray[i]*255.0/65535))
-            pix[col,row] = (picvalue,picvalue,picvalue)
-
-        im.save(path,"BMP")
-
-    def SaveAsTxt(self, path):
-        file = open(path, 'w')
-
-        for line in self.imageArray:
-            file.write("%g\n" % line)
-
-        file.close()
+        # 8-bit grayscale, scaled from the 16-bit range
+        save_image(path, self.imageArray, "BMP")
+
+    @traced("tracer")
+    def SaveAsImage(self, path, bits=8, normalise=None, percentiles=(1.0, 99.0)):
+        # BMP, PNG or TIFF by the file extension, 8 or 16-bit (PNG and TIFF
+        # only). normalise is None, "minmax" or "percentile"; see export.py
+        save_image(path, self.imageArray, bits=bits, normalise=normalise, percentiles=percentiles)
+
+    @traced("tracer")
+    def SaveAsTxt(self, path, layout="column", wavelengths=None):
+        # layout "column" writes one value per line, "rows" one image row
+        # per line and "spectrum" a wavelength column (pixel numbers if no
+        # wavelengths are given) followed by a column per track or frame
+        save_text(path, self.imageArray, layout, wavelengths)
+
+    @traced("tracer")
+    def SaveAsNpy(self, path):
+        save_npy(path, self.imageArray)
+
+    @traced("tracer")
+    def SaveAsRaw(self, path):
+        # The data as it is in memory, with its dtype, shape and the camera
+        # settings in path + ".json"; read it back with export.load_raw
+        save_raw(path, self.imageArray, self.GetMetadata())
+
+    def GetMetadata(self):
+        # The settings the current data was taken with
+        return {
+            "serial": self.serial,
+            "width": self.width,
+            "height": self.height,
+            "readmode": self.ReadMode,
+            "acquisitionmode": self.AcquisitionMode,
+            "exposure": self.exposure,
+            "accumulate": self.accumulate,
+            "accumulations": self.accumulations,
+            "kinetic": self.kinetic,
+            "scans": self.scans,
+            "image": [self.hbin, self.vbin, self.hstart, self.hend, self.vstart, self.vend],
+            "rotate": self.rotate,
+            "tracks": self.numberTracks,
+            "trackareas": self.trackAreas,
+            "temperature": self.temperature,
+            "setpoint": self.set_T,
+            "shutter": self.shutter,
+            "preampgain": self.preampgain,
+            "emgain": self.gain,
+            "channel": self.channel,
+            "outamp": self.outamp,
+            "hsspeed": self.hsspeed,
+            "vsspeed": self.vsspeed,
+        }
 
     def SetImageRotate(self, iRotate):
         error = self.dll.SetImageRotate(iRotate)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        self.rotate = iRotate
+        self.geometry = None
 
+    @traced("tracer")
     def SaveAsBmpNormalised(self, path):
-
-        im=Image.new("RGB",(self.width,self.height),"white")
-        pix = im.load()
-
-        maxIntensity = max(self.imageArray)
-
-        for i in range(len(self.imageArray)):
-            (row, col) = divmod(i,self.width)
-            picvalue = int(round(self.imageArray[i]*255.0/maxIntensity))
-            pix[col,row] = (picvalue,picvalue,picvalue)
-
-        im.save(path,"BMP")
+        # 8-bit grayscale stretched from the lowest to the highest value
+        save_image(path, self.imageArray, "BMP", normalise="minmax")
         
     def SaveAsFITS(self, filename, type):
 		error = self.dll.SaveAsFITS(filename, type)
-		self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-		return ERROR_CODE[error]
+		return error
 
     def CoolerON(self):
         error = self.dll.CoolerON()
         self.cooler = 1
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def CoolerOFF(self):
         error = self.dll.CoolerOFF()
         self.cooler = 0
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def IsCoolerOn(self):
         iCoolerStatus = c_int()
         self.cooler = iCoolerStatus
         error = self.dll.IsCoolerOn(byref(iCoolerStatus))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return iCoolerStatus.value
 
     def GetTemperature(self):
         ctemperature = c_int()
         error = self.dll.GetTemperature(byref(ctemperature))
         self.temperature = ctemperature.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def SetTemperature(self,temperature):
         #ctemperature = c_int(temperature)
         #error = self.dll.SetTemperature(byref(ctemperature))
         error = self.dll.SetTemperature(temperature)
         self.set_T = temperature
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def GetEMCCDGain(self):
         gain = c_int()
         error = self.dll.GetEMCCDGain(byref(gain))
         self.gain = gain.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
      
     def SetEMCCDGainMode(self, gainMode):
         error = self.dll.SetEMCCDGainMode(gainMode)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]   
+        return error   
         
     def SetEMCCDGain(self, gain):
         error = self.dll.SetEMCCDGain(gain)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        if error == "DRV_SUCCESS":
+            self.gain = gain
+        return error
         
     def SetEMAdvanced(self, gainAdvanced):
 		error = self.dll.SetEMAdvanced(gainAdvanced)
-		self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-		return ERROR_CODE[error]
+		return error
 
     def GetEMGainRange(self):
         low = c_int()
         high = c_int()
         error = self.dll.GetEMGainRange(byref(low),byref(high))
         self.gainRange = (low.value, high.value)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
       
     def GetNumberADChannels(self):
         noADChannels = c_int()
         error = self.dll.GetNumberADChannels(byref(noADChannels))
         self.noADChannels = noADChannels.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def GetBitDepth(self):
         bitDepth = c_int()
@@ -357,22 +622,20 @@ class Andor:
 
     def SetADChannel(self, index):
         error = self.dll.SetADChannel(index)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         self.channel = index
-        return ERROR_CODE[error]  
+        self.bitDepth = None
+        return error  
         
     def SetOutputAmplifier(self, index):
         error = self.dll.SetOutputAmplifier(index)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         self.outamp = index
-        return ERROR_CODE[error]
+        return error
         
     def GetNumberHSSpeeds(self):
         noHSSpeeds = c_int()
-        error = self.dll.GetNumberHSSpeeds(self.channel, self.outamp, byref(noHSSpeeds))
+        error = self.dll.GetNumberHSSpeeds(self.channel or 0, self.outamp or 0, byref(noHSSpeeds))
         self.noHSSpeeds = noHSSpeeds.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def GetHSSpeed(self):
         HSSpeed = c_float()
@@ -380,21 +643,19 @@ class Andor:
         self.HSSpeeds = []
 
         for i in range(self.noHSSpeeds):
-            self.dll.GetHSSpeed(self.channel, self.outamp, i, byref(HSSpeed))
+            self.dll.GetHSSpeed(self.channel or 0, self.outamp or 0, i, byref(HSSpeed))
             self.HSSpeeds.append(HSSpeed.value)
             
     def SetHSSpeed(self, itype, index):
         error = self.dll.SetHSSpeed(itype,index)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         self.hsspeed = index
-        return ERROR_CODE[error]
+        return error
         
     def GetNumberVSSpeeds(self):
         noVSSpeeds = c_int()
         error = self.dll.GetNumberVSSpeeds(byref(noVSSpeeds))
         self.noVSSpeeds = noVSSpeeds.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def GetVSSpeed(self):
         VSSpeed = c_float()
@@ -407,16 +668,14 @@ class Andor:
 
     def SetVSSpeed(self, index):
         error = self.dll.SetVSSpeed(index)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         self.vsspeed = index
-        return ERROR_CODE[error] 
+        return error 
     
     def GetNumberPreAmpGains(self):
         noGains = c_int()
         error = self.dll.GetNumberPreAmpGains(byref(noGains))
         self.noGains = noGains.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def GetPreAmpGain(self):
         gain = c_float()
@@ -429,27 +688,24 @@ class Andor:
 
     def SetPreAmpGain(self, index):
         error = self.dll.SetPreAmpGain(index)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         self.preampgain = index
-        return ERROR_CODE[error]
+        return error
 
     def SetTriggerMode(self, mode):
         error = self.dll.SetTriggerMode(mode)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
 
     def GetStatus(self):
         status = c_int()
         error = self.dll.GetStatus(byref(status))
         self.status = ERROR_CODE[status.value]
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.status
         
     def GetSeriesProgress(self):
 		acc = c_long()
 		series = c_long()
 		error = self.dll.GetAcquisitionProgress(byref(acc),byref(series))
-		if ERROR_CODE[error] == "DRV_SUCCESS":
+		if error == "DRV_SUCCESS":
 			return series.value
 		else:
 			return None
@@ -458,30 +714,64 @@ class Andor:
 		acc = c_long()
 		series = c_long()
 		error = self.dll.GetAcquisitionProgress(byref(acc),byref(series))
-		if ERROR_CODE[error] == "DRV_SUCCESS":
+		if error == "DRV_SUCCESS":
 			return acc.value
 		else:
 			return None
         
     def SetFrameTransferMode(self, frameTransfer):
         error = self.dll.SetFrameTransferMode(frameTransfer)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def SetShutterEx(self, typ, mode, closingtime, openingtime, extmode):
         error = self.dll.SetShutterEx(typ, mode, closingtime, openingtime, extmode)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def SetSpool(self, active, method, path, framebuffersize):
-        error = self.dll.SetSpool(active, method, c_char_p(path), framebuffersize)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.SetSpool(active, method, path, framebuffersize)
+        if error == "DRV_SUCCESS":
+            self.spool = (method, path) if active else None
+        return error
+
+    def GetSpool(self):
+        # (method, path) of the spooling set by SetSpool, None when off
+        return self.spool
 
     def SetSingleTrack(self, centre, height):
         error = self.dll.SetSingleTrack(centre, height)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        if error == "DRV_SUCCESS":
+            bottom = centre - height // 2
+            self.trackAreas = [(bottom, bottom + height - 1)]
+        return error
+
+    def SetMultiTrack(self, number, height, offset):
+        # Sets up read mode 1: number tracks of height rows, spread evenly
+        # over the sensor and moved up by offset rows. The rows of each
+        # track, as the driver placed them, go to trackAreas. Each frame is
+        # then an array of (tracks, width).
+        bottom = c_int()
+        gap = c_int()
+        error = self.dll.SetMultiTrack(number, height, offset, byref(bottom), byref(gap))
+        if error == "DRV_SUCCESS":
+            pitch = height + gap.value
+            self.trackAreas = [(bottom.value + i * pitch, bottom.value + i * pitch + height - 1)
+                               for i in range(number)]
+            self.numberTracks = number
+            self.geometry = None
+        return error
+
+    def SetRandomTracks(self, areas):
+        # Sets up read mode 2: one track for each (first row, last row) in
+        # areas, 1-based and inclusive, from the bottom of the sensor up.
+        # Each frame is then an array of (tracks, width).
+        areas = [(int(start), int(end)) for start, end in areas]
+        rows = (c_int * (2 * len(areas)))(*[row for area in areas for row in area])
+        error = self.dll.SetRandomTracks(len(areas), rows)
+        if error == "DRV_SUCCESS":
+            self.trackAreas = areas
+            self.numberTracks = len(areas)
+            self.geometry = None
+        return error
     
     def SetDemoReady(self):
         error = self.SetSingleScan()
@@ -498,7 +788,7 @@ class Andor:
         elif (binningmode==4):
             self.SetImage(4,4,1,self.width,1,self.height)
         else:
-            self.verbose("Binning mode not found")
+            self.verbose("Binning mode not found", "SetBinning")
 
 ERROR_CODE = {
     20001: "DRV_ERROR_CODES",
@@ -0,0 +1,252 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import struct
+import time
+import numpy as np
+from hdf5writer import METADATA
+
+"""Raw frame archive for long runs, with random access to any frame. An
+   archive is two files:
+
+       session.pya      a header of HEADER bytes, then the frames back to
+                        back in readout order
+       session.pya.idx  one INDEX record per frame: the byte offset of the
+                        frame, the time it was taken and the settings of
+                        METADATA, NaN (or -1 for integers) where unknown
+
+   The header starts with MAGIC and holds the dtype, the frame shape and
+   the camera settings at the start of the run as JSON. Frames are
+   written with plain appends, so writing costs no more than a raw save
+   (frame_metadata is the one of hdf5writer):
+
+       with ArchiveWriter.for_camera(cam, "session.pya") as archive:
+           for frame in cam.iter_frames(100000):
+               archive.append(frame, **frame_metadata(cam))
+
+   ArchiveReader maps both files, so opening a session of many gigabytes
+   reads only the header, and reader[n] is a view of frame n in the
+   mapping. A reader can refresh() to pick up frames appended since. """
+
+MAGIC = b"PYANDORA"
+VERSION = 1
+
+# The frames start here, a page boundary
+HEADER = 4096
+
+INDEX = np.dtype([("offset", "<i8")] + [(key, np.dtype(kind).newbyteorder("<"))
+                                         for key, kind in METADATA])
+
+def _missing(dtype):
+    if dtype.kind == "f":
+        return np.nan
+    return -1
+
+def read_header(path):
+    # The JSON header of the archive at path, as a dictionary
+    with open(path, "rb") as f:
+        start = f.read(len(MAGIC) + 8)
+        if len(start) < len(MAGIC) + 8 or start[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a frame archive" % path)
+        version, size = struct.unpack("<II", start[len(MAGIC):])
+        if version != VERSION:
+            raise ValueError("%s is an archive of version %d, not %d" % (path, version, VERSION))
+        header = json.loads(f.read(size).decode("utf-8"))
+    header["frameshape"] = tuple(header["frameshape"])
+    return header
+
+class ArchiveWriter:
+    def __init__(self, path, frameshape, dtype, settings=None):
+        # settings is a dictionary saved in the header, such as the
+        # GetMetadata() of the camera. An existing archive of the same
+        # frames is continued.
+        if np.ndim(frameshape) == 0:
+            frameshape = (frameshape,)
+        self.path       = path
+        self.indexpath  = path + ".idx"
+        self.frameshape = tuple(frameshape)
+        self.dtype      = np.dtype(dtype).newbyteorder("<")
+        self.framebytes = int(np.prod(self.frameshape)) * self.dtype.itemsize
+
+        if os.path.exists(path):
+            self._resume()
+        else:
+            self._create(settings)
+
+    @classmethod
+    def for_camera(cls, cam, path):
+        # An archive shaped and typed for the camera's current settings,
+        # with those settings in its header
+        if cam.Is16Bit():
+            dtype = np.uint16
+        else:
+            dtype = np.int32
+        return cls(path, cam.GetGeometry().frameshape, dtype, cam.GetMetadata())
+
+    def _create(self, settings):
+        header = {
+            "dtype": self.dtype.str,
+            "frameshape": list(self.frameshape),
+            "created": time.time(),
+            "settings": settings or {},
+        }
+        text = json.dumps(header, sort_keys=True).encode("utf-8")
+        start = MAGIC + struct.pack("<II", VERSION, len(text))
+        if len(start) + len(text) > HEADER:
+            raise ValueError("archive header is longer than %d bytes" % HEADER)
+
+        self.file = open(self.path, "wb")
+        self.file.write(start + text + b"\0" * (HEADER - len(start) - len(text)))
+        self.index = open(self.indexpath, "wb")
+        self.count = 0
+
+    def _resume(self):
+        header = read_header(self.path)
+        if header["frameshape"] != self.frameshape:
+            raise ValueError("%s holds frames of shape %r, not %r"
+                             % (self.path, header["frameshape"], self.frameshape))
+        if np.dtype(str(header["dtype"])) != self.dtype:
+            raise ValueError("%s holds %s frames, not %s"
+                             % (self.path, header["dtype"], self.dtype.str))
+
+        # An interrupted run may have left a partial frame or index record
+        frames = (os.path.getsize(self.path) - HEADER) // self.framebytes
+        records = 0
+        if os.path.exists(self.indexpath):
+            records = os.path.getsize(self.indexpath) // INDEX.itemsize
+        self.count = min(frames, records)
+
+        self.file = open(self.path, "r+b")
+        self.file.truncate(HEADER + self.count * self.framebytes)
+        self.file.seek(0, os.SEEK_END)
+        self.index = open(self.indexpath, "ab")
+        self.index.truncate(self.count * INDEX.itemsize)
+        self.index.seek(0, os.SEEK_END)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, frame, **metadata):
+        # Appends one frame, with any of the METADATA values by name. The
+        # timestamp defaults to now.
+        frame = np.asarray(frame)
+        self.extend(frame[np.newaxis], [metadata])
+
+    def extend(self, frames, metadata=None):
+        # Appends a block of frames, with a list of metadata dictionaries
+        frames = np.asarray(frames)
+        if frames.shape[1:] != self.frameshape:
+            raise ValueError("frames of shape %r do not fit the archive of %r"
+                             % (frames.shape[1:], self.frameshape))
+        n = len(frames)
+
+        records = np.empty(n, INDEX)
+        for key, kind in METADATA:
+            records[key] = _missing(INDEX[key])
+        records["offset"] = HEADER + (self.count + np.arange(n)) * self.framebytes
+        records["timestamp"] = time.time()
+        if metadata:
+            for i, entry in enumerate(metadata):
+                for key, value in entry.items():
+                    if value is not None and key in INDEX.names:
+                        records[key][i] = value
+
+        np.ascontiguousarray(frames, self.dtype).tofile(self.file)
+        records.tofile(self.index)
+        self.count += n
+
+    def flush(self):
+        # Makes the frames appended so far visible to readers
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.index.close()
+            self.file = None
+            self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ArchiveReader:
+    """Random access to the frames of an archive written by ArchiveWriter,
+       without reading them into memory"""
+
+    def __init__(self, path):
+        header = read_header(path)
+        self.path       = path
+        self.indexpath  = path + ".idx"
+        self.dtype      = np.dtype(str(header["dtype"]))
+        self.frameshape = header["frameshape"]
+        self.settings   = header["settings"]
+        self.created    = header["created"]
+        self.framebytes = int(np.prod(self.frameshape)) * self.dtype.itemsize
+        self.refresh()
+
+    def refresh(self):
+        # Maps the frames written so far and returns their number
+        frames = (os.path.getsize(self.path) - HEADER) // self.framebytes
+        records = 0
+        if os.path.exists(self.indexpath):
+            records = os.path.getsize(self.indexpath) // INDEX.itemsize
+        self.count = min(frames, records)
+
+        if self.count:
+            self.frames = np.memmap(self.path, dtype=self.dtype, mode="r", offset=HEADER,
+                                    shape=(self.count,) + self.frameshape)
+            self.index = np.memmap(self.indexpath, dtype=INDEX, mode="r", shape=(self.count,))
+        else:
+            self.frames = np.empty((0,) + self.frameshape, self.dtype)
+            self.index = np.empty(0, INDEX)
+        return self.count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, n):
+        # Frame n (or a slice of frames), a view of the mapped file
+        return self.frames[n]
+
+    def __iter__(self):
+        for n in range(self.count):
+            yield self.frames[n]
+
+    def read(self, start=0, stop=None):
+        # Frames start to stop, a view of the mapped file
+        return self.frames[start:stop]
+
+    def metadata(self, start=0, stop=None):
+        # The index entries of frames start to stop, as arrays by name
+        index = self.index[start:stop]
+        return dict((key, index[key]) for key in INDEX.names)
+
+    def close(self):
+        self.frames = None
+        self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,178 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+"""asyncio facade for Andor and AndorIdus. Every SDK call is run on a
+   single thread executor owned by the instrument, so blocking calls never
+   stall the event loop and several instruments can be driven concurrently
+   from one loop. All methods return awaitables:
+
+       cam = AsyncCamera(Andor())
+       yield cam.SetExposureTime(0.1)     (or await in Python 3)
+       data = yield cam.acquire(timeout=10)
+
+   Any method of the wrapped camera can be called through the facade. The
+   facade is built on concurrent.futures; asyncio is only needed for the
+   awaitables. Without it (Python 2 without trollius) the methods return
+   concurrent.futures.Future objects, whose result() waits for the call.
+
+   wait_stable and cool_down check the temperature in short jobs, one
+   every interval seconds, so acquire() and other calls made meanwhile run
+   between the checks instead of queueing behind the whole wait. """
+
+class AsyncCamera:
+    def __init__(self, cam, executor=None):
+        self.cam = cam
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._timers = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.cam, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(self._call, attr)
+
+    def _wrap(self, future):
+        # An awaitable of the future, when there is asyncio
+        if asyncio is None:
+            return future
+        return asyncio.wrap_future(future)
+
+    def _call(self, function, *args, **kwargs):
+        return self._wrap(self.executor.submit(functools.partial(function, *args, **kwargs)))
+
+    def _acquire(self, timeout):
+        error = self.cam.StartAcquisition(wait=True, timeout=timeout)
+        if error != "DRV_SUCCESS":
+            if error == "DRV_NO_NEW_DATA":
+                # Timed out, the camera is still acquiring
+                self.cam.AbortAcquisition()
+            raise RuntimeError("acquisition failed: %s" % error)
+        return self.cam.GetAcquiredData().copy()
+
+    def acquire(self, timeout=None):
+        # Starts an acquisition and resolves to a copy of the data. Raises
+        # RuntimeError if the acquisition does not start or is not
+        # complete within timeout seconds.
+        return self._call(self._acquire, timeout)
+
+    def _resolve(self, result, value=None, exception=None):
+        with self._lock:
+            self._timers.pop(result, None)
+            if result.done():
+                return
+            if exception is not None:
+                result.set_exception(exception)
+            else:
+                result.set_result(value)
+
+    def _check_stable(self, result, interval, deadline):
+        # One temperature check, on the executor. Unless it is the last,
+        # the next is submitted after interval seconds by a timer.
+        if result.done():
+            # Cancelled by the caller
+            self._resolve(result)
+            return
+        if self._cancel.is_set():
+            self._resolve(result, None)
+            return
+        try:
+            status = self.cam.GetTemperature()
+        except Exception as e:
+            self._resolve(result, exception=e)
+            return
+        now = time.time()
+        if status == "DRV_TEMP_STABILIZED" or (deadline is not None and now >= deadline):
+            self._resolve(result, status)
+            return
+
+        delay = interval
+        if deadline is not None:
+            delay = min(interval, deadline - now)
+        timer = threading.Timer(delay, self._submit_check, (result, interval, deadline))
+        timer.daemon = True
+        with self._lock:
+            if self._cancel.is_set():
+                timer = None
+            else:
+                self._timers[result] = timer
+        if timer is None:
+            self._resolve(result, None)
+        else:
+            timer.start()
+
+    def _submit_check(self, result, interval, deadline):
+        try:
+            self.executor.submit(self._check_stable, result, interval, deadline)
+        except RuntimeError:
+            # The executor is shut down
+            self._resolve(result, None)
+
+    def _setup_and_check(self, result, interval, deadline, setup):
+        try:
+            setup()
+        except Exception as e:
+            self._resolve(result, exception=e)
+            return
+        self._check_stable(result, interval, deadline)
+
+    def _wait(self, interval, timeout, setup):
+        result = Future()
+        deadline = None if timeout is None else time.time() + timeout
+        if setup is None:
+            self.executor.submit(self._check_stable, result, interval, deadline)
+        else:
+            self.executor.submit(self._setup_and_check, result, interval, deadline, setup)
+        return self._wrap(result)
+
+    def wait_stable(self, interval=10, timeout=None):
+        # Resolves to the temperature status once it is DRV_TEMP_STABILIZED,
+        # to the last status after timeout seconds, or to None when the
+        # facade is closed
+        return self._wait(interval, timeout, None)
+
+    def cool_down(self, temperature, interval=10, timeout=None):
+        # Sets the temperature, switches the cooler on and waits as
+        # wait_stable does
+        def setup():
+            self.cam.SetTemperature(temperature)
+            self.cam.CoolerON()
+        return self._wait(interval, timeout, setup)
+
+    def close(self):
+        # Ends the temperature waits and stops the executor
+        with self._lock:
+            self._cancel.set()
+            timers = list(self._timers.items())
+        for result, timer in timers:
+            timer.cancel()
+            self._resolve(result, None)
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,257 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmarks of the wrapper against the simulated SDK. Measures the frame
+   rate and per-frame latency of StartAcquisition + GetAcquiredData across
+   read modes and binning, the per-call overhead of the setters, and the
+   throughput of the file writers at full sensor size. Time spent inside
+   the SDK is measured separately, so that the wrapper's own overhead can
+   be told apart from it. The results are written as JSON:
+
+       python benchmark.py -o results.json
+       python benchmark.py --compare old.json results.json """
+
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from optparse import OptionParser
+import numpy as np
+
+from andor import Andor
+from Andor_iDus_XP import AndorIdus
+from simulator import SimulatedSDK
+
+class TimedSDK:
+    """Proxy that adds up the time spent in each SDK function"""
+
+    def __init__(self, sdk):
+        self.sdk = sdk
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __getattr__(self, name):
+        function = getattr(self.sdk, name)
+        def timed(*args):
+            start = time.time()
+            try:
+                return function(*args)
+            finally:
+                self.seconds += time.time() - start
+                self.calls += 1
+        return timed
+
+class NullStream:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else None
+
+def open_camera(options, verbose=False):
+    sdk = TimedSDK(SimulatedSDK(width=options.width, height=options.height,
+                                realtime=options.realtime))
+    if options.camera == "idus":
+        cam = AndorIdus(sdk)
+    else:
+        cam = Andor(sdk)
+    cam.SetVerbose(verbose)
+    return cam, sdk
+
+def bench_acquisition(cam, sdk, options, readmode, binning):
+    frames = options.frames
+    cam.SetReadMode(readmode)
+    cam.SetAcquisitionMode(1)
+    cam.SetExposureTime(0.001)
+    if readmode == 4:
+        cam.SetImage(binning, binning, 1, options.width, 1, options.height)
+    if readmode == 3:
+        cam.SetSingleTrack(options.height // 2, 10)
+
+    latencies = []
+    sdk.reset()
+    start = time.time()
+    for i in range(frames):
+        t = time.time()
+        cam.StartAcquisition(wait=True)
+        cam.GetAcquiredData()
+        latencies.append(time.time() - t)
+    total = time.time() - start
+
+    return {
+        "readmode": readmode,
+        "binning": binning,
+        "frames": frames,
+        "shape": list(cam.GetGeometry().shape),
+        "fps": frames / total,
+        "latency_mean": float(np.mean(latencies)),
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "sdk_seconds_per_frame": sdk.seconds / frames,
+        "wrapper_seconds_per_frame": (total - sdk.seconds) / frames,
+        "sdk_calls_per_frame": float(sdk.calls) / frames,
+    }
+
+SETTERS = [
+    ("SetExposureTime", (0.01,)),
+    ("SetReadMode", (4,)),
+    ("SetAcquisitionMode", (1,)),
+    ("SetNumberKinetics", (10,)),
+    ("SetKineticCycleTime", (0.1,)),
+    ("SetTriggerMode", (0,)),
+    ("SetShutter", (1, 0, 30, 30)),
+    ("SetPreAmpGain", (0,)),
+    ("SetVSSpeed", (1,)),
+    ("SetEMCCDGain", (10,)),
+    ("SetTemperature", (-60,)),
+    ("GetStatus", ()),
+    ("GetTemperature", ()),
+]
+
+def bench_setters(cam, sdk, calls):
+    results = []
+    for name, args in SETTERS:
+        function = getattr(cam, name)
+        sdk.reset()
+        start = time.time()
+        for i in range(calls):
+            function(*args)
+        total = time.time() - start
+        results.append({
+            "function": name,
+            "calls": calls,
+            "seconds_per_call": total / calls,
+            "wrapper_seconds_per_call": (total - sdk.seconds) / calls,
+        })
+    return results
+
+def bench_save(cam, options, directory):
+    width, height = options.width, options.height
+    cam.SetReadMode(4)
+    cam.SetAcquisitionMode(1)
+    cam.SetImage(1, 1, 1, width, 1, height)
+    cam.StartAcquisition(wait=True)
+    cam.GetAcquiredData()
+
+    results = []
+    for name, extension in (("SaveAsTxt", "txt"), ("SaveAsBmp", "bmp"),
+                            ("SaveAsBmpNormalised", "bmp"), ("SaveAsImage", "png"),
+                            ("SaveAsImage", "tif"), ("SaveAsNpy", "npy"),
+                            ("SaveAsRaw", "raw")):
+        function = getattr(cam, name)
+        path = os.path.join(directory, "bench.%s" % extension)
+        times = []
+        for i in range(options.repeats):
+            start = time.time()
+            function(path)
+            times.append(time.time() - start)
+        seconds = float(np.mean(times))
+        results.append({
+            "function": "%s (%s)" % (name, extension),
+            "shape": [height, width],
+            "seconds_per_frame": seconds,
+            "megapixels_per_second": width * height / seconds / 1e6,
+            "bytes": os.path.getsize(path),
+        })
+    return results
+
+def run(options):
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "camera": options.camera,
+        "sensor": [options.height, options.width],
+        "realtime": options.realtime,
+    }
+
+    stdout = sys.stdout
+    sys.stdout = NullStream()
+    try:
+        cam, sdk = open_camera(options)
+
+        acquisition = []
+        for readmode, binning in ((0, 1), (3, 1), (4, 1), (4, 2), (4, 4)):
+            acquisition.append(bench_acquisition(cam, sdk, options, readmode, binning))
+        results["acquisition"] = acquisition
+
+        results["setters"] = bench_setters(cam, sdk, options.calls)
+
+        # With verbosity on, the wrapper's diagnostics are part of the cost
+        verbose, vsdk = open_camera(options, verbose=True)
+        results["setters_verbose"] = bench_setters(verbose, vsdk, options.calls)
+
+        directory = tempfile.mkdtemp()
+        try:
+            results["save"] = bench_save(cam, options, directory)
+        finally:
+            shutil.rmtree(directory)
+    finally:
+        sys.stdout = stdout
+
+    return results
+
+def compare(old, new):
+    # Prints the relative change of every timing between two result files
+    def rows(results):
+        for section, key in (("acquisition", "latency_mean"), ("setters", "seconds_per_call"),
+                             ("setters_verbose", "seconds_per_call"), ("save", "seconds_per_frame")):
+            for entry in results.get(section, []):
+                name = entry.get("function") or "readmode %(readmode)s bin %(binning)s" % entry
+                yield (section, name), entry[key]
+
+    before = dict(rows(old))
+    for key, value in rows(new):
+        if key in before and before[key]:
+            print "%-16s %-32s %12.3g s %+8.1f%%" % (key[0], key[1], value, 100.0 * (value / before[key] - 1))
+
+if __name__ == "__main__":
+    parser = OptionParser(usage="%prog [options] | --compare old.json new.json")
+    parser.add_option("-o", "--output", dest="output", help="write the JSON results to this file")
+    parser.add_option("--camera", dest="camera", default="andor", help="camera class (andor or idus)")
+    parser.add_option("--width", dest="width", type="int", default=1024, help="sensor width")
+    parser.add_option("--height", dest="height", type="int", default=1024, help="sensor height")
+    parser.add_option("--frames", dest="frames", type="int", default=50, help="frames per acquisition benchmark")
+    parser.add_option("--calls", dest="calls", type="int", default=2000, help="calls per setter benchmark")
+    parser.add_option("--repeats", dest="repeats", type="int", default=3, help="saves per writer benchmark")
+    parser.add_option("--realtime", action="store_true", dest="realtime", default=False,
+                      help="run the simulated camera in real time")
+    parser.add_option("--compare", action="store_true", dest="compare", default=False,
+                      help="compare two result files")
+    (options, args) = parser.parse_args()
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error("--compare needs two result files")
+        compare(json.load(open(args[0])), json.load(open(args[1])))
+    else:
+        results = run(options)
+        text = json.dumps(results, indent=2, sort_keys=True)
+        if options.output:
+            with open(options.output, "w") as f:
+                f.write(text)
+        else:
+            print text
@@ -0,0 +1,169 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import sys
+from ctypes import c_int, c_long, c_uint, c_ulong, c_float, c_char_p, c_ushort, POINTER
+
+"""Prototypes of the SDK functions used by the camera classes. bind() sets
+   argtypes, restype and errcheck on each function once when the library
+   is loaded, so that calls are marshalled without building ctypes
+   arguments by hand and every call returns the name of its error code
+   instead of the number. Diagnostics go to the logging module and are
+   only formatted when the logger is enabled for them. Backends written in
+   Python, such as the simulated SDK, get the same error translation.
+   Spectrograph/shamrock.py binds the Shamrock SDK with the same bind()
+   and set_verbose(), with its own prototypes and error codes. """
+
+PROTOTYPES = {
+    # Initialisation and camera information
+    "Initialize":               (c_char_p,),
+    "ShutDown":                 (),
+    "GetDetector":              (POINTER(c_int), POINTER(c_int)),
+    "GetCameraSerialNumber":    (POINTER(c_int),),
+    "GetNumberADChannels":      (POINTER(c_int),),
+    "GetBitDepth":              (c_int, POINTER(c_int)),
+    "GetNumberHSSpeeds":        (c_int, c_int, POINTER(c_int)),
+    "GetHSSpeed":               (c_int, c_int, c_int, POINTER(c_float)),
+    "GetNumberVSSpeeds":        (POINTER(c_int),),
+    "GetVSSpeed":               (c_int, POINTER(c_float)),
+    "GetNumberPreAmpGains":     (POINTER(c_int),),
+    "GetPreAmpGain":            (c_int, POINTER(c_float)),
+    "GetEMGainRange":           (POINTER(c_int), POINTER(c_int)),
+    "GetEMCCDGain":             (POINTER(c_int),),
+
+    # Settings
+    "SetReadMode":              (c_int,),
+    "SetAcquisitionMode":       (c_int,),
+    "SetNumberKinetics":        (c_int,),
+    "SetNumberAccumulations":   (c_int,),
+    "SetExposureTime":          (c_float,),
+    "SetAccumulationCycleTime": (c_float,),
+    "SetKineticCycleTime":      (c_float,),
+    "SetImage":                 (c_int, c_int, c_int, c_int, c_int, c_int),
+    "SetImageRotate":           (c_int,),
+    "SetSingleTrack":           (c_int, c_int),
+    "SetMultiTrack":            (c_int, c_int, c_int, POINTER(c_int), POINTER(c_int)),
+    "SetRandomTracks":          (c_int, POINTER(c_int)),
+    "SetHSSpeed":               (c_int, c_int),
+    "SetVSSpeed":               (c_int,),
+    "SetPreAmpGain":            (c_int,),
+    "SetADChannel":             (c_int,),
+    "SetOutputAmplifier":       (c_int,),
+    "SetEMCCDGain":             (c_int,),
+    "SetEMCCDGainMode":         (c_int,),
+    "SetEMAdvanced":            (c_int,),
+    "SetTriggerMode":           (c_int,),
+    "SetShutter":               (c_int, c_int, c_int, c_int),
+    "SetShutterEx":             (c_int, c_int, c_int, c_int, c_int),
+    "SetFrameTransferMode":     (c_int,),
+    "SetFanMode":               (c_int,),
+    "SetSpool":                 (c_int, c_int, c_char_p, c_int),
+    "SaveAsFITS":               (c_char_p, c_int),
+    "GetAcquisitionTimings":    (POINTER(c_float), POINTER(c_float), POINTER(c_float)),
+
+    # Temperature
+    "SetTemperature":           (c_int,),
+    "CoolerON":                 (),
+    "CoolerOFF":                (),
+    "SetCoolerMode":            (c_int,),
+    "IsCoolerOn":               (POINTER(c_int),),
+    "GetTemperature":           (POINTER(c_int),),
+
+    # Acquisition
+    "StartAcquisition":         (),
+    "AbortAcquisition":         (),
+    "GetStatus":                (POINTER(c_int),),
+    "GetAcquisitionProgress":   (POINTER(c_long), POINTER(c_long)),
+    "WaitForAcquisition":       (),
+    "WaitForAcquisitionTimeOut": (c_int,),
+    "CancelWait":               (),
+
+    # Data retrieval
+    "GetAcquiredData":          (POINTER(c_int), c_ulong),
+    "GetAcquiredData16":        (POINTER(c_ushort), c_ulong),
+    "GetMostRecentImage":       (POINTER(c_int), c_ulong),
+    "GetMostRecentImage16":     (POINTER(c_ushort), c_ulong),
+    "GetOldestImage":           (POINTER(c_int), c_ulong),
+    "GetOldestImage16":         (POINTER(c_ushort), c_ulong),
+    "GetImages":                (c_long, c_long, POINTER(c_int), c_ulong, POINTER(c_long), POINTER(c_long)),
+    "GetImages16":              (c_long, c_long, POINTER(c_ushort), c_ulong, POINTER(c_long), POINTER(c_long)),
+    "GetNumberNewImages":       (POINTER(c_long), POINTER(c_long)),
+    "GetNumberAvailableImages": (POINTER(c_long), POINTER(c_long)),
+}
+
+def _translator(name, codes, logger):
+    # Returns a function turning the code returned by the named function
+    # into its name, logging it when the logger is enabled for DEBUG
+    def translate(code):
+        error = codes.get(code)
+        if error is None:
+            error = "UNKNOWN_ERROR_CODE_%d" % code
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s]: %s", name, error)
+        return error
+    return translate
+
+class PythonBinding:
+    """Gives an SDK implemented in Python the calling convention of a bound
+       library: each function in the table returns its error code name."""
+
+    def __init__(self, sdk, prototypes, codes, logger):
+        self.sdk = sdk
+        for name in prototypes:
+            function = getattr(sdk, name, None)
+            if function is not None:
+                setattr(self, name, self._wrap(function, _translator(name, codes, logger)))
+
+    @staticmethod
+    def _wrap(function, translate):
+        def call(*args):
+            return translate(function(*args))
+        return call
+
+    def __getattr__(self, name):
+        raise AttributeError("%s is not in the binding table" % name)
+
+def bind(library, prototypes, codes, logger):
+    # Sets the prototypes of every function of a ctypes library in place and
+    # returns the library. Functions the library lacks are skipped, so that
+    # older SDK versions still load. Any other object is taken as an SDK
+    # implemented in Python and wrapped in a PythonBinding.
+    if not hasattr(library, "_handle"):
+        return PythonBinding(library, prototypes, codes, logger)
+
+    for name, argtypes in prototypes.items():
+        try:
+            function = getattr(library, name)
+        except AttributeError:
+            continue
+        translate = _translator(name, codes, logger)
+        function.argtypes = list(argtypes)
+        function.restype = c_uint
+        function.errcheck = lambda result, func, args, translate=translate: translate(result)
+    return library
+
+def set_verbose(logger, state):
+    # Turns the DEBUG output of a logger on or off. When nothing has been
+    # set up to show the output, it is printed to stdout as before.
+    if state:
+        logger.setLevel(logging.DEBUG)
+        if not logger.handlers and not logging.getLogger().handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+    else:
+        logger.setLevel(logging.WARNING)
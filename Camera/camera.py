@@ -1,4 +1,5 @@
 from andor import *
+from savepool import SavePool
 import time
 import sys
 import signal
@@ -52,8 +53,13 @@ def signal_handler(signal, frame):
     except NameError:
             menu = None
 
-    if menu is None:
+    if streaming:
+        # Ends the stream in menu_start_acquisition, which aborts the
+        # acquisition before going back to the menu
+        raise KeyboardInterrupt
+    elif menu is None:
         print "shutting down the camera ..."
+        pool.close()
         cam.ShutDown()
         sys.exit()
     else:
@@ -61,16 +67,26 @@ def signal_handler(signal, frame):
 
 signal.signal(signal.SIGINT, signal_handler)
 
+streaming = False
+
+def save(name, iterator, data):
+    # Queues the frame to be written in the background, so that the next
+    # exposure can start while it is saved
+    global cam
+    global pool
+    pool.submit(data, [("bmp-normalised", "%s%03g.bmp" %(name, iterator)),
+                       #("bmp", "%03g.bmp" %i),
+                       "%s%03g.txt" %(name, iterator)],
+                cam.GetMetadata())
+    for paths, error in pool.take_errors():
+        print "failed to save %s: %s" %(", ".join(paths), error)
+    print "captured %s%03g" %(name, iterator)
+
 def snap(name, iterator):
     global cam
     print "Ready for Acquisition..."
     cam.StartAcquisition()
-    data = []
-    cam.GetAcquiredData(data)
-    cam.SaveAsBmpNormalised("%s%03g.bmp" %(name, iterator))
-    #cam.SaveAsBmp("%03g.bmp" %i)
-    cam.SaveAsTxt("%s%03g.txt" %(name, iterator))
-    print "captured %s%03g" %(name, iterator)
+    save(name, iterator, cam.GetAcquiredData())
 
 def menu_status():
     global menu
@@ -117,12 +133,23 @@ def menu_start_acquisition():
     global filename
     global iteration
     global TriggerMode
+    global streaming
 
     cam.SetTriggerMode(TriggerMode)
 
-    while True:
-            iteration += 1
-            snap(filename, iteration)
+    print "Ready for Acquisition..."
+    frames = cam.iter_frames()
+    streaming = True
+    try:
+        for frame in frames:
+                iteration += 1
+                save(filename, iteration, frame)
+    except KeyboardInterrupt:
+        print "Acquisition stopped"
+    finally:
+        streaming = False
+        # Aborts the acquisition and restores the acquisition mode
+        frames.close()
 
     return False
 
@@ -140,6 +167,7 @@ def menu_capture_snapshot():
 
 def menu_quit():
     print "Shutting down the camera..."
+    pool.close()
     cam.ShutDown()
     sys.exit()
 
@@ -148,9 +176,9 @@ def menu_quit():
 #############################
 
 cam = Andor()
+pool = SavePool()
 
-if verbosity:
-    cam.verbosity = True
+cam.SetVerbose(verbosity)
 
 cam.SetSingleScan()
 cam.SetTriggerMode(TriggerMode)
@@ -199,5 +227,6 @@ iteration = 0
 
 if acquisition is True:
     menu_start_acquisition()
+    menu.run()
 else:
     menu.run('1')
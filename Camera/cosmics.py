@@ -0,0 +1,233 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+"""Cosmic ray removal for kinetic series of spectra (FVB or single track,
+   frames along the first axis and wavelength along the last), working on
+   whole arrays at once. Two detectors:
+
+       "median"     each pixel against the median of the same pixel in the
+                    window frames around it; needs a steady source, but
+                    finds cosmic rays of any shape
+       "laplacian"  each spectrum on its own: a pixel is a spike where the
+                    second difference along the spectrum is large against
+                    the noise and sharper than the lines around it (the 1-D
+                    form of van Dokkum's L.A.Cosmic)
+
+   The noise of each pixel is taken from the Poisson statistics of its
+   signal when the gain (electrons per count) is given, and estimated from
+   the data otherwise. A pixel is a cosmic ray where it exceeds its
+   expected value by threshold times that noise; it and grow pixels on
+   either side are replaced by the expected value.
+
+   clean() works on a whole series. For long series, feed() takes chunks,
+   such as the blocks of GetImages or iter_frames, and returns the frames
+   which are clean so far; the median detector holds back the last
+   window // 2 frames until the frames after them arrive or flush() is
+   called. Memory depends on the chunk and window sizes only:
+
+       cosmics = CosmicFilter("median", window=7)
+       for frame in cam.iter_frames(10000):
+           save(cosmics.feed(frame[np.newaxis]))
+       save(cosmics.flush()) """
+
+METHODS = ("median", "laplacian")
+
+# Standard deviation over median absolute deviation for normal noise
+MAD_SIGMA = 1.4826
+
+def _windows(data, size, axis):
+    # Strided view of the windows of size along axis, as a new axis after
+    # it, without copying
+    n = data.shape[axis] - size + 1
+    shape = data.shape[:axis] + (n, size) + data.shape[axis + 1:]
+    strides = data.strides[:axis] + (data.strides[axis],) + data.strides[axis:]
+    return as_strided(data, shape=shape, strides=strides)
+
+def _running_median(data, size):
+    # The median of size neighbouring values along the last axis, the
+    # edges extended
+    half = size // 2
+    pad = [(0, 0)] * (data.ndim - 1) + [(half, half)]
+    padded = np.pad(data, pad, mode="edge")
+    return np.median(_windows(padded, size, data.ndim - 1), axis=-1)
+
+def _grow(mask, grow):
+    # Widens the marked pixels by grow on either side along the last axis
+    out = mask.copy()
+    for shift in range(1, grow + 1):
+        out[..., shift:] |= mask[..., :-shift]
+        out[..., :-shift] |= mask[..., shift:]
+    return out
+
+class CosmicFilter:
+    def __init__(self, method="median", threshold=5.0, window=7, gain=None,
+                 readnoise=0.0, grow=1, objlim=2.0):
+        # threshold is in standard deviations of the noise. window is the
+        # number of frames of the median detector (odd), objlim the factor
+        # by which a spike must be sharper than the spectrum around it for
+        # the laplacian detector. gain in electrons per count and readnoise
+        # in electrons give the noise model.
+        if method not in METHODS:
+            raise ValueError("method must be one of %s" % ", ".join(METHODS))
+        if window < 3 or window % 2 == 0:
+            raise ValueError("window must be odd and at least 3")
+        self.method    = method
+        self.threshold = threshold
+        self.window    = window
+        self.gain      = gain
+        self.readnoise = readnoise
+        self.grow      = grow
+        self.objlim    = objlim
+        self.rejected  = 0
+        self.reset()
+
+    def reset(self):
+        # Starts a new series
+        self._buffer = None
+        self._offset = 0
+        self._next = 0
+
+    def _noise(self, expected):
+        # The Poisson noise of the expected counts
+        electrons = np.maximum(expected, 0) * self.gain
+        return np.sqrt(electrons + self.readnoise ** 2) / self.gain
+
+    def _replace(self, data, mask, expected):
+        mask = _grow(mask, self.grow) if self.grow else mask
+        self.rejected += int(np.count_nonzero(mask))
+        if data.dtype.kind in "ui":
+            expected = np.rint(expected)
+        out = data.copy()
+        out[mask] = expected[mask]
+        return out, mask
+
+    def _laplacian(self, data):
+        # Cleans each spectrum of data on its own
+        work = data.astype(np.float32)
+        pad = [(0, 0)] * (work.ndim - 1) + [(1, 1)]
+        padded = np.pad(work, pad, mode="edge")
+        laplacian = 2 * work - padded[..., :-2] - padded[..., 2:]
+
+        # The fine structure of the spectrum, lines but not spikes of one
+        # or two pixels
+        expected = _running_median(work, 5)
+        fine = expected - _running_median(expected, 9)
+        if self.gain:
+            # The second difference has 6 times the variance of a pixel
+            sigma = np.sqrt(6.0) * self._noise(expected)
+        else:
+            centre = np.median(laplacian, axis=-1)[..., np.newaxis]
+            sigma = MAD_SIGMA * np.median(np.abs(laplacian - centre), axis=-1)[..., np.newaxis]
+        sigma = np.maximum(sigma, 1.0)
+
+        mask = (laplacian > self.threshold * sigma)
+        mask &= laplacian > self.objlim * np.maximum(fine, sigma / np.sqrt(6.0))
+        mask &= work - expected > self.threshold * sigma / np.sqrt(6.0)
+        return self._replace(data, mask, expected)
+
+    def _median(self, data, index, starts):
+        # Cleans the frames index of data against the median of the windows
+        # of frames at starts, which are centred on the frames except at the
+        # ends of the series
+        windows = _windows(data, self.window, 0)[starts]
+        expected = np.median(windows, axis=1).astype(np.float32)
+        frames = data[index]
+        if self.gain:
+            sigma = self._noise(expected)
+        else:
+            # A few frames give a poor spread for each pixel, so the gain of
+            # a Poisson noise model is estimated from the whole frame instead
+            spread = MAD_SIGMA * np.median(np.abs(windows - expected[:, np.newaxis]), axis=1)
+            level = np.maximum(expected, 1.0)
+            ratio = (spread ** 2 / level).reshape(len(level), -1)
+            scale = np.median(ratio, axis=1).reshape((-1,) + (1,) * (level.ndim - 1))
+            sigma = np.sqrt(level * scale)
+        sigma = np.maximum(sigma, 1.0)
+        mask = frames - expected > self.threshold * sigma
+        return self._replace(frames, mask, expected)
+
+    def clean(self, series):
+        # Cleans a whole series and returns it with the mask of the
+        # replaced pixels
+        series = np.asarray(series)
+        if self.method == "laplacian":
+            return self._laplacian(series)
+        if len(series) < self.window:
+            raise ValueError("the median detector needs at least %d frames" % self.window)
+        half = self.window // 2
+        index = np.arange(len(series))
+        starts = np.clip(index - half, 0, len(series) - self.window)
+        return self._median(series, index, starts)
+
+    def feed(self, chunk):
+        # Adds a chunk of frames of the series and returns the frames that
+        # are clean so far
+        if not isinstance(chunk, np.ndarray):
+            chunk = getattr(chunk, "data", chunk)
+        chunk = np.asarray(chunk)
+        if self.method == "laplacian":
+            return self._laplacian(chunk)[0]
+
+        if self._buffer is None:
+            self._buffer = chunk.copy()
+        else:
+            self._buffer = np.concatenate((self._buffer, chunk))
+        seen = self._offset + len(self._buffer)
+        half = self.window // 2
+        ready = seen - half if seen >= self.window else 0
+        return self._release(ready, seen)
+
+    def flush(self):
+        # Returns the frames held back, at the end of the series
+        if self._buffer is None:
+            return None
+        seen = self._offset + len(self._buffer)
+        if seen < self.window:
+            raise ValueError("the median detector needs at least %d frames" % self.window)
+        out = self._release(seen, seen)
+        self.reset()
+        return out
+
+    def _release(self, ready, seen):
+        # Cleans frames self._next to ready of the series
+        if ready <= self._next:
+            return self._buffer[:0]
+        half = self.window // 2
+        index = np.arange(self._next, ready)
+        starts = np.clip(index - half, 0, seen - self.window)
+        out, mask = self._median(self._buffer, index - self._offset, starts - self._offset)
+        self._next = ready
+
+        # Keeps the frames the windows of later frames can reach
+        keep = max(min(self._next - half, seen - self.window), 0)
+        if keep > self._offset:
+            self._buffer = self._buffer[keep - self._offset:].copy()
+            self._offset = keep
+        return out
+
+    def stream(self, chunks):
+        # Yields the cleaned frames of an iterator of chunks
+        for chunk in chunks:
+            out = self.feed(chunk)
+            if len(out):
+                yield out
+        if self.method == "median":
+            out = self.flush()
+            if out is not None and len(out):
+                yield out
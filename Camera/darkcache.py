@@ -0,0 +1,258 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from ctypes import byref, c_int
+from export import save_raw, load_raw
+
+"""Library of master dark (or bias) frames, kept on disk and keyed by the
+   camera settings a dark depends on (KEY). A master dark is the median
+   (or mean) of a number of frames taken with the shutter closed, with the
+   settings the camera has at the time:
+
+       darks = DarkLibrary("darks")
+       clean = darks.subtract(cam.GetAcquiredData(), cam)
+
+   takes the darks the first time they are needed and reuses them while
+   the settings stay the same. A dark is taken again once it is older than
+   maxage seconds or the detector temperature has drifted by more than
+   maxdrift degrees since. The last maxentries darks used are held in
+   memory, and at most maxfiles are kept on disk, the least recently used
+   being removed first. processor() subtracts the darks in the frame
+   pipeline of AcquisitionEngine:
+
+       engine = AcquisitionEngine(cam, processors=[darks.processor(cam)])
+
+   Master darks are float32 frames; subtracting one returns float32 data
+   of the shape of the data, which can also be a series of frames. They
+   are taken as single scans, so the library refuses frames which are
+   sums of scans (accumulate mode or a kinetic series with more than one
+   accumulation) rather than subtract the wrong dark from them. """
+
+# The settings which make a dark
+KEY = ("exposure", "setpoint", "emgain", "preampgain", "hsspeed", "vsspeed",
+       "readmode", "image", "trackareas")
+
+# Shutter mode which keeps the shutter closed
+SHUTTER_CLOSED = 2
+
+# Acquisition modes whose frames are single scans, like the darks, and
+# those whose frames are single scans when they accumulate one
+SINGLE_SCANS = (1, 5)
+ACCUMULATING = (2, 3)
+
+def single_scans(settings):
+    # Whether the frames taken with a GetMetadata() dictionary are single
+    # scans, as the darks of capture() are
+    mode = settings.get("acquisitionmode")
+    if mode is None or mode in SINGLE_SCANS:
+        return True
+    return mode in ACCUMULATING and settings.get("accumulations", 1) == 1
+
+def settings_key(settings):
+    # The name of the darks for a GetMetadata() dictionary
+    values = json.dumps([settings.get(key) for key in KEY])
+    return hashlib.sha1(values.encode("utf-8")).hexdigest()[:16]
+
+class Dark:
+    def __init__(self, master, settings, taken, temperature, frames):
+        self.master      = master
+        self.settings    = settings
+        self.taken       = taken
+        self.temperature = temperature
+        self.frames      = frames
+
+    def age(self):
+        return time.time() - self.taken
+
+class DarkLibrary:
+    def __init__(self, directory, frames=16, combine="median", maxentries=8,
+                 maxfiles=64, maxage=24 * 3600.0, maxdrift=2.0, recheck=10.0):
+        # frames is the number of frames per master dark, combined by
+        # "median" or "mean". recheck is the time in seconds between
+        # temperature checks while a dark is used for frame after frame.
+        if combine not in ("median", "mean"):
+            raise ValueError("combine must be median or mean")
+        self.directory  = directory
+        self.frames     = frames
+        self.combine    = combine
+        self.maxentries = maxentries
+        self.maxfiles   = maxfiles
+        self.maxage     = maxage
+        self.maxdrift   = maxdrift
+        self.recheck    = recheck
+        self.entries    = collections.OrderedDict()
+        self._checked   = {}
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, "dark-%s.raw" % key)
+
+    def _temperature(self, cam):
+        # Read from the driver: GetTemperature of AndorIdus prints it, at
+        # every recheck
+        dll = cam.dll if hasattr(cam, "dll") else cam._dll
+        temperature = c_int()
+        dll.GetTemperature(byref(temperature))
+        return temperature.value
+
+    def _check(self, settings):
+        if not single_scans(settings):
+            raise ValueError("darks are single scans, not frames of acquisition mode %s "
+                             "with %s accumulations"
+                             % (settings.get("acquisitionmode"), settings.get("accumulations")))
+
+    def _stale(self, dark, temperature):
+        if self.maxage is not None and dark.age() > self.maxage:
+            return True
+        if (self.maxdrift is not None and temperature is not None
+                and dark.temperature is not None
+                and abs(temperature - dark.temperature) > self.maxdrift):
+            return True
+        return False
+
+    def _remember(self, key, dark):
+        # Moves the dark to the most recently used end
+        self.entries.pop(key, None)
+        self.entries[key] = dark
+        while len(self.entries) > self.maxentries:
+            self.entries.popitem(last=False)
+
+    def _load(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path + ".json") as f:
+            info = json.load(f)["metadata"]
+        master = load_raw(path, mmap=False)
+        # The time of last use, for the eviction of files
+        os.utime(path, None)
+        return Dark(master, info["settings"], info["taken"], info["temperature"], info["frames"])
+
+    def _store(self, key, dark):
+        info = {
+            "settings": dark.settings,
+            "taken": dark.taken,
+            "temperature": dark.temperature,
+            "frames": dark.frames,
+        }
+        save_raw(self._path(key), dark.master, info)
+
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.startswith("dark-") and name.endswith(".raw")]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:max(len(paths) - self.maxfiles, 0)]:
+            os.remove(path)
+            os.remove(path + ".json")
+
+    def get(self, cam):
+        # The master dark for the camera's current settings, or None if
+        # there is none that is fresh
+        settings = cam.GetMetadata()
+        self._check(settings)
+        key = settings_key(settings)
+        dark = self.entries.get(key)
+        if dark is None:
+            dark = self._load(key)
+        if dark is None or self._stale(dark, self._temperature(cam)):
+            self.entries.pop(key, None)
+            return None
+        self._remember(key, dark)
+        self._checked[key] = time.time()
+        return dark
+
+    def capture(self, cam, frames=None):
+        # Takes a master dark with the shutter closed and the current
+        # settings, and adds it to the library. The shutter is restored.
+        frames = frames or self.frames
+        settings = cam.GetMetadata()
+        self._check(settings)
+        shutter = settings["shutter"]
+        typ, closing, opening = 1, 0, 0
+        if shutter is not None:
+            typ, mode, closing, opening = shutter
+
+        cam.SetShutter(typ, SHUTTER_CLOSED, closing, opening)
+        try:
+            stack = None
+            for i, frame in enumerate(cam.iter_frames(frames)):
+                if stack is None:
+                    stack = np.empty((frames,) + frame.shape, np.float32)
+                stack[i] = frame
+        finally:
+            if shutter is not None:
+                cam.SetShutter(*shutter)
+            else:
+                cam.SetShutter(typ, 0, closing, opening)
+
+        if self.combine == "median":
+            master = np.median(stack, axis=0).astype(np.float32)
+        else:
+            master = stack.mean(axis=0, dtype=np.float64).astype(np.float32)
+
+        dark = Dark(master, dict((key, settings.get(key)) for key in KEY), time.time(),
+                    self._temperature(cam), frames)
+        key = settings_key(settings)
+        self._store(key, dark)
+        self._remember(key, dark)
+        self._checked[key] = time.time()
+        return dark
+
+    def master(self, cam):
+        # The master dark for the current settings, taken if needed
+        dark = self.get(cam)
+        if dark is None:
+            dark = self.capture(cam)
+        return dark
+
+    def subtract(self, data, cam):
+        # data minus the master dark for the current settings, as float32.
+        # Between temperature checks a dark in memory is used as it is.
+        settings = cam.GetMetadata()
+        self._check(settings)
+        key = settings_key(settings)
+        dark = self.entries.get(key)
+        if dark is None or time.time() - self._checked.get(key, 0) > self.recheck:
+            dark = self.master(cam)
+        else:
+            self._remember(key, dark)
+        return np.subtract(data, dark.master, dtype=np.float32)
+
+    def processor(self, cam):
+        # A frame processor for AcquisitionEngine which subtracts the darks.
+        # It runs in the engine thread, between acquisitions, so darks
+        # can be taken there. Raises ValueError at once if the frames are
+        # sums of scans.
+        self._check(cam.GetMetadata())
+        return lambda data: self.subtract(data, cam)
+
+    def prune(self):
+        # Removes the darks on disk which are too old
+        for name in os.listdir(self.directory):
+            if name.startswith("dark-") and name.endswith(".raw"):
+                path = os.path.join(self.directory, name)
+                with open(path + ".json") as f:
+                    taken = json.load(f)["metadata"]["taken"]
+                if self.maxage is not None and time.time() - taken > self.maxage:
+                    os.remove(path)
+                    os.remove(path + ".json")
+                    self.entries.pop(name[5:-4], None)
@@ -0,0 +1,151 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+from collections import namedtuple
+try:
+    from Queue import Queue, Full, Empty
+except ImportError:
+    from queue import Queue, Full, Empty
+
+"""Acquisition engine which owns the camera in a thread of its own. Each
+   acquisition is started, waited for and read out in that thread and the
+   frames are pushed into a bounded queue, so saving and processing in the
+   calling thread overlap with the next exposure. When the queue is full
+   the engine either waits for the consumer ("block") or throws away the
+   oldest queued frame ("drop-oldest"). Each frame is passed through the
+   processors, callables taking and returning the frame data, in the
+   engine thread before it is queued. Works with Andor and AndorIdus. """
+
+Frame = namedtuple("Frame", "index timestamp data")
+
+POLICIES = ("block", "drop-oldest")
+
+class AcquisitionEngine:
+    def __init__(self, cam, maxsize=8, policy="block", timeout=None, processors=()):
+        if policy not in POLICIES:
+            raise ValueError("policy must be one of %s" % ", ".join(POLICIES))
+
+        self.cam      = cam
+        self.queue    = Queue(maxsize)
+        self.policy   = policy
+        self.timeout  = timeout
+        self.processors = list(processors)
+        self.acquired = 0
+        self.dropped  = 0
+        self.error    = None
+        self._stop    = threading.Event()
+        self._thread  = None
+
+    def start(self, count=None):
+        # Acquires count frames, or until stop() when count is None
+        if self.is_running():
+            raise RuntimeError("acquisition engine is already running")
+        self._stop.clear()
+        self.error = None
+        self.acquired = 0
+        self.dropped = 0
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self._thread = threading.Thread(target=self._run, args=(count,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, wait=True, abort=False):
+        # The frame being exposed is finished before the thread exits,
+        # unless abort is set
+        self._stop.set()
+        if abort and self.is_running():
+            self.cam.AbortAcquisition()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self, count):
+        try:
+            while not self._stop.is_set() and (count is None or self.acquired < count):
+                error = self.cam.StartAcquisition(wait=False)
+                if error != "DRV_SUCCESS":
+                    raise RuntimeError("acquisition did not start: %s" % error)
+                if self.cam.WaitForCompletion(self.timeout) != "DRV_SUCCESS":
+                    self.cam.AbortAcquisition()
+                    if self._stop.is_set():
+                        break
+                    raise RuntimeError("acquisition did not complete within %s s" % self.timeout)
+                timestamp = time.time()
+                data = self.cam.GetAcquiredData().copy()
+                for process in self.processors:
+                    data = process(data)
+                self.acquired += 1
+                self._put(Frame(self.acquired, timestamp, data))
+        except Exception as e:
+            self.error = e
+        finally:
+            self._put(None)
+
+    def _put(self, frame):
+        if self.policy == "block":
+            while True:
+                try:
+                    self.queue.put(frame, timeout=0.1)
+                    return
+                except Full:
+                    # Nobody is listening anymore, give up on the frame but
+                    # make room for the end marker so stop() can return
+                    if self._stop.is_set():
+                        if frame is not None:
+                            return
+                        try:
+                            self.queue.get_nowait()
+                            self.dropped += 1
+                        except Empty:
+                            pass
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(frame)
+                    return
+                except Full:
+                    try:
+                        if self.queue.get_nowait() is not None:
+                            self.dropped += 1
+                    except Empty:
+                        pass
+
+    def get(self, timeout=None):
+        # Returns the next Frame, or None at the end of the acquisition or
+        # when nothing arrives within timeout seconds
+        try:
+            frame = self.queue.get(timeout=timeout)
+        except Empty:
+            return None
+        if frame is None:
+            # Leave the end marker for other consumers
+            self.queue.put(None)
+            if self.error is not None:
+                raise self.error
+        return frame
+
+    def frames(self):
+        # Iterates over the frames until the engine stops
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
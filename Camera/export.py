@@ -0,0 +1,199 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+from PIL import Image
+import numpy as np
+
+"""Writers for acquired data, shared by the camera classes. Images are
+   scaled with array operations and handed to PIL in one piece as 8-bit or
+   16-bit grayscale.
+
+   Orientation: an image is written in the order the SDK returns the data,
+   which is also the order of the arrays from GetAcquiredData. Rows go down
+   and columns go across, so the first pixel read out is at the top left.
+   A spectrum becomes an image one row high. A kinetic series becomes its
+   frames stacked top to bottom. test_export.py checks this for both
+   camera classes.
+
+   Scaling: without normalisation, data is taken as 16-bit counts. For
+   8-bit output it is scaled from 0..65535 to 0..255. For 16-bit output
+   it is written as it is, and 32-bit values above 65535 are clipped. With
+   normalise="minmax", the range from the lowest to the highest value
+   fills the output. With normalise="percentile", the range between the
+   two given percentiles fills it, and values outside are clipped, so that
+   a few hot pixels or cosmic rays do not flatten the contrast.
+
+   Text and binary files are written a chunk of rows at a time: each chunk
+   is formatted with a single string operation, or written straight from
+   the array, so a long series is never held in memory as one string. """
+
+FORMATS = {
+    ".bmp":  "BMP",
+    ".png":  "PNG",
+    ".tif":  "TIFF",
+    ".tiff": "TIFF",
+}
+
+# Formats that can hold 16-bit grayscale
+DEEP_FORMATS = ("PNG", "TIFF")
+
+def image_array(data):
+    # The 2-D view of data in the orientation described above
+    data = np.asarray(data)
+    if data.ndim == 0:
+        raise ValueError("no image data")
+    if data.ndim == 1:
+        return data.reshape(1, -1)
+    return data.reshape(-1, data.shape[-1])
+
+def intensity_range(data, normalise=None, percentiles=(1.0, 99.0)):
+    # Returns the (low, high) data values mapped to black and white
+    if normalise is None:
+        return 0, 65535
+    if normalise == "minmax":
+        return data.min(), data.max()
+    if normalise == "percentile":
+        low, high = np.percentile(data, percentiles)
+        return low, high
+    raise ValueError("unknown normalisation %r" % (normalise,))
+
+def scale(data, bits=8, normalise=None, percentiles=(1.0, 99.0)):
+    # Scales data to unsigned 8 or 16-bit integers
+    if bits not in (8, 16):
+        raise ValueError("bits must be 8 or 16")
+    dtype = np.uint8 if bits == 8 else np.uint16
+    top = (1 << bits) - 1
+    data = np.asarray(data)
+
+    if normalise is None and bits == 16:
+        if data.dtype == np.uint16:
+            return data
+        return np.clip(data, 0, top).astype(dtype)
+
+    low, high = intensity_range(data, normalise, percentiles)
+    span = float(high) - float(low)
+    factor = top / span if span > 0 else 0.0
+
+    out = np.subtract(data, low, dtype=np.float32)
+    out *= factor
+    np.clip(out, 0, top, out=out)
+    np.rint(out, out=out)
+    return out.astype(dtype)
+
+def save_image(path, data, format=None, bits=8, normalise=None, percentiles=(1.0, 99.0)):
+    # Writes data as a grayscale BMP, PNG or TIFF image. The format is
+    # taken from the file extension unless given.
+    if format is None:
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in FORMATS:
+            raise ValueError("cannot tell the image format of %r" % (path,))
+        format = FORMATS[extension]
+    format = format.upper()
+    if bits == 16 and format not in DEEP_FORMATS:
+        raise ValueError("%s cannot hold 16-bit images" % format)
+
+    pixels = scale(image_array(data), bits, normalise, percentiles)
+    im = Image.fromarray(np.ascontiguousarray(pixels))
+    im.save(path, format)
+    return im
+
+# Values formatted per write by the text and binary writers
+CHUNK = 1 << 16
+
+TEXT_LAYOUTS = ("column", "rows", "spectrum")
+
+def _chunks(data, rows):
+    for start in range(0, len(data), rows):
+        yield data[start:start + rows]
+
+def save_text(path, data, layout="column", wavelengths=None, fmt="%g", delimiter="\t"):
+    # Writes data as text. The layouts are
+    #   "column"   one value per line, in readout order
+    #   "rows"     one image row per line, in the orientation of images
+    #   "spectrum" one line per pixel column: the wavelength (or pixel
+    #              number) followed by the value of each row or frame
+    if layout not in TEXT_LAYOUTS:
+        raise ValueError("unknown text layout %r" % (layout,))
+
+    if layout == "column":
+        table = np.asarray(data).reshape(-1, 1)
+    else:
+        table = image_array(data)
+        if layout == "spectrum":
+            if wavelengths is None:
+                wavelengths = np.arange(1, table.shape[1] + 1)
+            wavelengths = np.asarray(wavelengths, dtype=np.float64)
+            if wavelengths.shape != (table.shape[1],):
+                raise ValueError("expected %d wavelengths" % table.shape[1])
+            table = np.column_stack((wavelengths, table.T))
+
+    columns = table.shape[1]
+    line = delimiter.join([fmt] * columns) + "\n"
+    rows = max(CHUNK // columns, 1)
+    with open(path, "w") as f:
+        for chunk in _chunks(table, rows):
+            f.write((line * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+def _frames(data):
+    # Chunks of whole rows along the first axis of data
+    data = np.ascontiguousarray(data)
+    if data.ndim == 0:
+        raise ValueError("no data")
+    rowsize = data[0].size if data.ndim > 1 else 1
+    return data, _chunks(data, max(CHUNK // max(rowsize, 1), 1))
+
+def save_npy(path, data):
+    # Writes data as a .npy file that numpy.load can open, memory mapped
+    # if wanted
+    data, chunks = _frames(data)
+    header = {
+        "descr": np.lib.format.dtype_to_descr(data.dtype),
+        "fortran_order": False,
+        "shape": data.shape,
+    }
+    with open(path, "wb") as f:
+        np.lib.format.write_array_header_1_0(f, header)
+        for chunk in chunks:
+            chunk.tofile(f)
+
+def save_raw(path, data, metadata=None):
+    # Writes the bytes of data to path, with its dtype, shape and any
+    # metadata in a JSON sidecar at path + ".json"
+    data, chunks = _frames(data)
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            chunk.tofile(f)
+    sidecar = {
+        "dtype": data.dtype.str,
+        "shape": list(data.shape),
+        "order": "C",
+    }
+    if metadata:
+        sidecar["metadata"] = metadata
+    with open(path + ".json", "w") as f:
+        json.dump(sidecar, f, indent=2, sort_keys=True)
+
+def load_raw(path, mmap=True):
+    # Reads a file written by save_raw, memory mapped unless mmap is False
+    with open(path + ".json") as f:
+        sidecar = json.load(f)
+    dtype = np.dtype(str(sidecar["dtype"]))
+    shape = tuple(sidecar["shape"])
+    if mmap:
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+    return np.fromfile(path, dtype=dtype).reshape(shape)
@@ -0,0 +1,186 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import numpy as np
+
+"""Streams the frames of a series into a FITS cube on disk as they are
+   acquired, without holding the series in memory. Images become a 3-D
+   cube (columns, rows, frames in FITS axis order), spectra a 2-D array of
+   one row per frame. The primary header is written first with the frame
+   axis set to zero; frames are appended to the data unit as they come,
+   and flush() and close() pad the data unit to a whole FITS block and
+   fill in the number of frames, so the file is valid after each of them:
+
+       with FITSWriter.for_camera(cam, "series.fits") as fits:
+           for frame in cam.iter_frames(1000):
+               fits.append(frame)
+
+   16-bit data is stored as BITPIX 16 with BZERO 32768, 32-bit data as
+   BITPIX 32. No FITS library is needed. """
+
+BLOCK = 2880
+CARD = 80
+
+BITPIX = {
+    "uint8":   (8, None),
+    "int16":   (16, None),
+    "uint16":  (16, 32768),
+    "int32":   (32, None),
+    "float32": (-32, None),
+    "float64": (-64, None),
+}
+
+def _value(value):
+    if isinstance(value, bool):
+        return "%20s" % ("T" if value else "F")
+    if isinstance(value, (int, long, np.integer)):
+        return "%20d" % value
+    if isinstance(value, (float, np.floating)):
+        text = repr(float(value)).upper()
+        if "." not in text and "E" not in text and "N" not in text:
+            text += ".0"
+        return "%20s" % text
+    text = str(value).replace("'", "''")
+    return "'%-8s'" % text
+
+def card(keyword, value=None, comment=None):
+    # One 80 character header card
+    keyword = keyword.upper()
+    if len(keyword) > 8:
+        raise ValueError("FITS keyword %r is longer than 8 characters" % keyword)
+    if keyword in ("COMMENT", "HISTORY") or value is None and comment is None:
+        text = "%-8s%s" % (keyword, "" if value is None else value)
+    else:
+        text = "%-8s= %s" % (keyword, _value(value))
+        if comment:
+            text += " / " + comment
+    if len(text) > CARD:
+        raise ValueError("FITS card %r is too long" % text)
+    return "%-80s" % text
+
+def camera_header(cam):
+    # Header cards from the camera state held by Andor or AndorIdus
+    settings = cam.GetMetadata()
+    cards = [
+        ("EXPOSURE", settings["exposure"], "exposure time [s]"),
+        ("KINCYCLE", settings["kinetic"], "kinetic cycle time [s]"),
+        ("EMGAIN",   settings["emgain"], "EMCCD gain"),
+        ("CCD-TEMP", settings["temperature"], "detector temperature [C]"),
+        ("HBIN",     settings["image"][0], "horizontal binning"),
+        ("VBIN",     settings["image"][1], "vertical binning"),
+        ("READMODE", settings["readmode"], "Andor read mode"),
+        ("ACQMODE",  settings["acquisitionmode"], "Andor acquisition mode"),
+        ("SERIALNO", settings["serial"], "camera serial number"),
+    ]
+    return [entry for entry in cards if entry[1] is not None]
+
+class FITSWriter:
+    def __init__(self, path, frameshape, dtype, header=()):
+        # header is a list of (keyword, value, comment) tuples added to the
+        # primary header
+        dtype = np.dtype(dtype)
+        if dtype.name not in BITPIX:
+            raise ValueError("cannot write %s data to FITS" % dtype.name)
+        if np.ndim(frameshape) == 0:
+            frameshape = (frameshape,)
+        self.path       = path
+        self.frameshape = tuple(frameshape)
+        self.dtype      = dtype
+        self.bitpix, self.bzero = BITPIX[dtype.name]
+        self.frametype  = np.dtype(">i2" if self.bzero else dtype.newbyteorder(">"))
+        self.count      = 0
+
+        naxes = tuple(reversed(self.frameshape)) + (0,)
+        cards = [card("SIMPLE", True, "conforms to FITS standard"),
+                 card("BITPIX", self.bitpix),
+                 card("NAXIS", len(naxes))]
+        for i, n in enumerate(naxes):
+            cards.append(card("NAXIS%d" % (i + 1), n))
+        self.countcard = len(cards) - 1
+        self.countkey = "NAXIS%d" % len(naxes)
+        if self.bzero:
+            cards.append(card("BZERO", self.bzero))
+            cards.append(card("BSCALE", 1))
+        cards.append(card("DATE", time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+                          "file creation date (UTC)"))
+        for entry in header:
+            cards.append(card(*entry))
+        cards.append(card("END"))
+
+        text = "".join(cards)
+        text += " " * (-len(text) % BLOCK)
+        self.file = open(path, "wb+")
+        self.file.write(text.encode("ascii"))
+        self.dataoffset = len(text)
+        self.databytes = 0
+
+    @classmethod
+    def for_camera(cls, cam, path, header=()):
+        # A writer shaped and typed for the camera's current settings, with
+        # the camera state in its header
+        if cam.Is16Bit():
+            dtype = np.uint16
+        else:
+            dtype = np.int32
+        return cls(path, cam.GetGeometry().frameshape, dtype, camera_header(cam) + list(header))
+
+    def __len__(self):
+        return self.count
+
+    def append(self, frame):
+        self.extend(np.asarray(frame)[np.newaxis])
+
+    def extend(self, frames):
+        # Appends a block of frames
+        frames = np.asarray(frames)
+        if frames.shape[1:] != self.frameshape:
+            raise ValueError("frames of shape %r do not fit the cube of %r"
+                             % (frames.shape[1:], self.frameshape))
+        if self.bzero:
+            # Offset binary: flipping the top bit subtracts BZERO
+            data = (frames.astype(np.uint16, copy=False) ^ 0x8000).view(np.int16)
+            data = data.astype(self.frametype, copy=False)
+        else:
+            data = frames.astype(self.frametype, copy=False)
+
+        self.file.seek(self.dataoffset + self.databytes)
+        self.file.write(np.ascontiguousarray(data).tobytes())
+        self.databytes += data.nbytes
+        self.count += len(frames)
+
+    def flush(self):
+        # Pads the data unit and writes the number of frames, leaving a
+        # valid file; later frames overwrite the padding
+        end = self.dataoffset + self.databytes
+        self.file.seek(end)
+        self.file.write(b"\0" * (-self.databytes % BLOCK))
+        self.file.truncate()
+        self.file.seek(self.countcard * CARD)
+        self.file.write(card(self.countkey, self.count).encode("ascii"))
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,85 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Readout geometry of an acquisition. Works out the shape of the data the
+   SDK returns from the read mode, acquisition mode, binning, crop and track
+   settings, so that buffers can be allocated at exactly the right size and
+   handed back already reshaped. The camera classes cache one instance and
+   drop it whenever a setter changes one of the settings. """
+
+# Read modes
+FVB          = 0
+MULTI_TRACK  = 1
+RANDOM_TRACK = 2
+SINGLE_TRACK = 3
+IMAGE        = 4
+
+# Acquisition modes
+SINGLE_SCAN    = 1
+ACCUMULATE     = 2
+KINETICS       = 3
+FAST_KINETICS  = 4
+RUN_TILL_ABORT = 5
+
+class ReadoutGeometry:
+    def __init__(self, width, height, readmode, acqmode=SINGLE_SCAN, scans=1,
+                 hbin=1, vbin=1, hstart=1, hend=None, vstart=1, vend=None,
+                 tracks=1, rotate=0):
+        if hend is None:
+            hend = width
+        if vend is None:
+            vend = height
+
+        if readmode == IMAGE:
+            columns = (hend - hstart + 1) // hbin
+            rows = (vend - vstart + 1) // vbin
+            if columns < 1 or rows < 1:
+                raise ValueError("empty image area")
+            # A 90 degree rotation swaps the axes of the image
+            if rotate in (1, 2):
+                rows, columns = columns, rows
+            frameshape = (rows, columns)
+        elif readmode in (FVB, SINGLE_TRACK):
+            frameshape = (width,)
+        elif readmode in (MULTI_TRACK, RANDOM_TRACK):
+            frameshape = (tracks, width)
+        else:
+            raise ValueError("unknown read mode %r" % (readmode,))
+
+        if acqmode in (KINETICS, FAST_KINETICS):
+            frames = scans
+        elif acqmode in (SINGLE_SCAN, ACCUMULATE, RUN_TILL_ABORT, None):
+            frames = 1
+        else:
+            raise ValueError("unknown acquisition mode %r" % (acqmode,))
+
+        self.readmode   = readmode
+        self.acqmode    = acqmode
+        self.frames     = frames
+        self.frameshape = frameshape
+        self.framesize  = 1
+        for n in frameshape:
+            self.framesize *= n
+        self.size = self.framesize * frames
+
+        # A series keeps its frame axis even when it holds a single frame
+        if acqmode in (KINETICS, FAST_KINETICS):
+            self.shape = (frames,) + frameshape
+        else:
+            self.shape = frameshape
+
+    def __repr__(self):
+        return "ReadoutGeometry(readmode=%r, acqmode=%r, shape=%r)" % (self.readmode, self.acqmode, self.shape)
@@ -0,0 +1,243 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import numpy as np
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+"""Appends the frames of a series to one chunked HDF5 dataset as they
+   arrive, instead of writing a file per frame. Per-frame metadata goes to
+   parallel one dimensional datasets in the "meta" group, one entry per
+   frame, with NaN (or -1 for integers) where a value is unknown:
+
+       writer = HDF5Writer.for_camera(cam, "night.h5", compression="gzip")
+       for frame in cam.iter_frames(1000):
+           writer.append(frame, **frame_metadata(cam, shamrock))
+       writer.close()
+
+   Opening an existing file continues the series where it ended, so an
+   interrupted run can be resumed into the same file. The file is written
+   in SWMR mode and flushed after each frame by default, so HDF5Reader can
+   read the frames written so far while the series is still running.
+   Needs h5py. """
+
+# Per-frame metadata datasets and their types
+METADATA = (
+    ("timestamp",   np.float64),
+    ("temperature", np.float32),
+    ("exposure",    np.float32),
+    ("gain",        np.int32),
+    ("readmode",    np.int16),
+    ("hbin",        np.int16),
+    ("vbin",        np.int16),
+    ("wavelength",  np.float32),
+)
+
+def _missing(dtype):
+    if np.dtype(dtype).kind == "f":
+        return np.nan
+    return -1
+
+def frame_metadata(cam, shamrock=None):
+    # The metadata of the current frame from the settings held by a camera
+    # (and the wavelength of a Shamrock), as keyword arguments for append
+    settings = cam.GetMetadata()
+    metadata = {
+        "timestamp": time.time(),
+        "temperature": settings["temperature"],
+        "exposure": settings["exposure"],
+        "gain": settings["emgain"],
+        "readmode": settings["readmode"],
+        "hbin": settings["image"][0],
+        "vbin": settings["image"][1],
+    }
+    if shamrock is not None:
+        metadata["wavelength"] = shamrock.current_wavelength
+    return metadata
+
+class HDF5Writer:
+    def __init__(self, path, frameshape=None, dtype=None, dataset="frames",
+                 compression=None, compression_opts=None, chunkframes=1,
+                 flush_every=1, swmr=True):
+        # frameshape and dtype may be left out, the dataset is then created
+        # for the first frame appended. compression is passed to h5py
+        # ("gzip", "lzf" or None). Each chunk holds chunkframes frames.
+        if h5py is None:
+            raise ImportError("HDF5Writer needs h5py")
+        self.path        = path
+        self.name        = dataset
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.chunkframes = chunkframes
+        self.flush_every = flush_every
+        self.swmr        = swmr
+        self.frames      = None
+        self.meta        = {}
+        self.count       = 0
+        self.unflushed   = 0
+
+        self.file = h5py.File(path, "a", libver="latest")
+        try:
+            if dataset in self.file:
+                self._resume(frameshape, dtype)
+            elif frameshape is not None and dtype is not None:
+                self._create(tuple(frameshape), dtype)
+        except:
+            self.file.close()
+            raise
+
+    @classmethod
+    def for_camera(cls, cam, path, **kwargs):
+        # A writer shaped and typed for the camera's current settings
+        if cam.Is16Bit():
+            dtype = np.uint16
+        else:
+            dtype = np.int32
+        return cls(path, cam.GetGeometry().frameshape, dtype, **kwargs)
+
+    def _create(self, frameshape, dtype):
+        self.frames = self.file.create_dataset(
+            self.name, shape=(0,) + frameshape, maxshape=(None,) + frameshape,
+            dtype=dtype, chunks=(self.chunkframes,) + frameshape,
+            compression=self.compression, compression_opts=self.compression_opts)
+        group = self.file.require_group("meta")
+        for key, kind in METADATA:
+            self.meta[key] = group.create_dataset(key, shape=(0,), maxshape=(None,), dtype=kind,
+                                                  chunks=(1024,), fillvalue=_missing(kind))
+        self._start_swmr()
+
+    def _resume(self, frameshape, dtype):
+        self.frames = self.file[self.name]
+        if frameshape is not None and tuple(frameshape) != self.frames.shape[1:]:
+            raise ValueError("%s holds frames of shape %r, not %r"
+                             % (self.path, self.frames.shape[1:], tuple(frameshape)))
+        if dtype is not None and np.dtype(dtype) != self.frames.dtype:
+            raise ValueError("%s holds %s frames, not %s"
+                             % (self.path, self.frames.dtype, np.dtype(dtype)))
+        self.count = len(self.frames)
+
+        # An interrupted run may have left the metadata a frame ahead or
+        # behind the frames
+        group = self.file.require_group("meta")
+        for key, kind in METADATA:
+            if key in group:
+                self.meta[key] = group[key]
+            else:
+                self.meta[key] = group.create_dataset(key, shape=(0,), maxshape=(None,), dtype=kind,
+                                                      chunks=(1024,), fillvalue=_missing(kind))
+            self.meta[key].resize((self.count,))
+        self._start_swmr()
+
+    def _start_swmr(self):
+        if self.swmr and not self.file.swmr_mode:
+            self.file.swmr_mode = True
+
+    def __len__(self):
+        return self.count
+
+    def append(self, frame, **metadata):
+        # Appends one frame, with any of the METADATA values by name
+        frame = np.asarray(frame)
+        self.extend(frame[np.newaxis], [metadata])
+
+    def extend(self, frames, metadata=None):
+        # Appends a block of frames, with a list of metadata dictionaries
+        frames = np.asarray(frames)
+        if self.frames is None:
+            self._create(frames.shape[1:], frames.dtype)
+        elif frames.shape[1:] != self.frames.shape[1:]:
+            raise ValueError("frames of shape %r do not fit the dataset of %r"
+                             % (frames.shape[1:], self.frames.shape[1:]))
+
+        n = len(frames)
+        start, stop = self.count, self.count + n
+        self.frames.resize((stop,) + self.frames.shape[1:])
+        self.frames[start:stop] = frames
+
+        for key, kind in METADATA:
+            values = np.empty(n, kind)
+            values.fill(_missing(kind))
+            if metadata:
+                for i, entry in enumerate(metadata):
+                    value = entry.get(key)
+                    if value is not None:
+                        values[i] = value
+            dataset = self.meta[key]
+            dataset.resize((stop,))
+            dataset[start:stop] = values
+
+        self.count = stop
+        self.unflushed += n
+        if self.flush_every and self.unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        # Makes the frames appended so far visible to readers
+        self.file.flush()
+        self.unflushed = 0
+
+    def close(self):
+        if self.file:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class HDF5Reader:
+    """Reads the frames and metadata of a file written by HDF5Writer, also
+       while it is still being written"""
+
+    def __init__(self, path, dataset="frames"):
+        if h5py is None:
+            raise ImportError("HDF5Reader needs h5py")
+        self.file = h5py.File(path, "r", libver="latest", swmr=True)
+        self.frames = self.file[dataset]
+        self.meta = self.file["meta"]
+
+    def refresh(self):
+        # Picks up the frames the writer has flushed since the last call
+        self.frames.refresh()
+        for key in self.meta:
+            self.meta[key].refresh()
+        return len(self.frames)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def read(self, start=0, stop=None):
+        # Frames start to stop of the series, without reading the rest
+        return self.frames[start:stop]
+
+    def metadata(self, start=0, stop=None):
+        # The metadata of frames start to stop, as arrays by name
+        return dict((key, self.meta[key][start:stop]) for key in self.meta)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
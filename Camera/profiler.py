@@ -0,0 +1,225 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+import json
+import math
+import os
+import threading
+import time
+
+"""Opt-in latency instrumentation. A CallTracer records the start and end
+   time, result and thread of every SDK call, data retrieval and save made
+   by the cameras (and the Shamrock) it is attached to:
+
+       tracer = CallTracer()
+       cam.SetTracer(tracer)
+       ...
+       print tracer.summary()["GetAcquiredData"]
+       tracer.export_chrome_trace("run.json")
+
+   The events go to a fixed size ring buffer, so the tracer can be left on
+   indefinitely; only the most recent capacity events are kept for the
+   timeline, while the per-function counters and latency histograms cover
+   every call. The timeline is in the Chrome trace format and can be opened
+   in chrome://tracing or Perfetto. SDK calls and wrapper methods are in
+   separate categories, so the time a wrapper method spends outside the SDK
+   (copying, formatting, writing to disk) shows up around its SDK calls. """
+
+clock = getattr(time, "perf_counter", time.time)
+
+# Histogram bucket k counts durations in [2**(k-1), 2**k) microseconds
+BUCKETS = 32
+
+# Results which are not errors from any function
+SUCCESS = frozenset(["DRV_SUCCESS", "SHAMROCK_SUCCESS"])
+
+TEMPERATURE = ("DRV_TEMP_OFF", "DRV_TEMP_STABILIZED", "DRV_TEMP_NOT_REACHED",
+               "DRV_TEMP_DRIFT", "DRV_TEMP_NOT_STABILIZED")
+NO_NEW_DATA = ("DRV_NO_NEW_DATA",)
+
+# Results which are not errors from particular functions: the temperature
+# status, and no data after a timeout or when there is nothing new yet
+EXPECTED = {
+    "GetTemperature":            TEMPERATURE,
+    "GetTemperatureF":           TEMPERATURE,
+    "GetStatus":                 ("DRV_IDLE", "DRV_ACQUIRING"),
+    "WaitForAcquisition":        NO_NEW_DATA,
+    "WaitForAcquisitionTimeOut": NO_NEW_DATA,
+    "GetNumberNewImages":        NO_NEW_DATA,
+    "GetNumberAvailableImages":  NO_NEW_DATA,
+    "GetOldestImage":            NO_NEW_DATA,
+    "GetOldestImage16":          NO_NEW_DATA,
+    "GetMostRecentImage":        NO_NEW_DATA,
+    "GetMostRecentImage16":      NO_NEW_DATA,
+}
+
+def is_error(name, result):
+    # Whether the result of the named function is an error
+    if result is None or result in SUCCESS:
+        return False
+    return result not in EXPECTED.get(name, ())
+
+class FunctionStats:
+    def __init__(self):
+        self.calls     = 0
+        self.errors    = 0
+        self.total     = 0.0
+        self.max       = 0.0
+        self.histogram = [0] * BUCKETS
+
+    def add(self, duration, failed):
+        self.calls += 1
+        if failed:
+            self.errors += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        bucket = math.frexp(duration * 1e6)[1]
+        self.histogram[min(max(bucket, 0), BUCKETS - 1)] += 1
+
+    def percentile(self, q):
+        # Upper bound in seconds of the bucket holding the q-th percentile
+        if not self.calls:
+            return None
+        rank = q / 100.0 * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return min(2.0 ** bucket / 1e6, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total": self.total,
+            "mean": self.total / self.calls if self.calls else None,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "histogram": dict(("<%dus" % 2 ** bucket, count)
+                              for bucket, count in enumerate(self.histogram) if count),
+        }
+
+class CallTracer:
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        self._lock   = threading.Lock()
+        self._events = [None] * self.capacity
+        self.count   = 0
+        self.stats   = {}
+        self.origin  = clock()
+
+    def record(self, category, name, start, end, result=None):
+        # Adds one event. A result other than None is counted as an error
+        # unless it is a success or one of the EXPECTED results of the
+        # function.
+        failed = is_error(name, result)
+        with self._lock:
+            self._events[self.count % self.capacity] = (category, name, start, end, result,
+                                                        threading.current_thread().ident)
+            self.count += 1
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = FunctionStats()
+            stats.add(end - start, failed)
+
+    def wrap(self, sdk):
+        # Returns a proxy of a bound SDK whose calls are recorded
+        return TracedSDK(sdk, self)
+
+    def events(self):
+        # The retained events, oldest first
+        with self._lock:
+            if self.count <= self.capacity:
+                return self._events[:self.count]
+            slot = self.count % self.capacity
+            return self._events[slot:] + self._events[:slot]
+
+    def dropped(self):
+        return max(self.count - self.capacity, 0)
+
+    def summary(self):
+        with self._lock:
+            return dict((name, stats.as_dict()) for name, stats in self.stats.items())
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        trace = []
+        for category, name, start, end, result, tid in self.events():
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": (start - self.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": tid,
+            }
+            if result is not None:
+                event["args"] = {"result": str(result)}
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms",
+                "otherData": {"dropped": self.dropped()}}
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+class TracedSDK:
+    """Proxy of a bound SDK that records each call in a tracer"""
+
+    def __init__(self, sdk, tracer):
+        self.sdk = sdk
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        function = getattr(self.sdk, name)
+        tracer = self.tracer
+        def traced(*args):
+            start = clock()
+            result = None
+            try:
+                result = function(*args)
+                return result
+            finally:
+                tracer.record("sdk", name, start, clock(), result)
+        # Cached, so that __getattr__ only runs once per function
+        setattr(self, name, traced)
+        return traced
+
+def traced(attribute):
+    # Decorator recording a wrapper method in the tracer held by the named
+    # attribute of the instance, when there is one
+    def decorate(method):
+        name = method.__name__
+        @functools.wraps(method)
+        def call(self, *args, **kwargs):
+            tracer = getattr(self, attribute)
+            if tracer is None:
+                return method(self, *args, **kwargs)
+            start = clock()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                tracer.record("wrapper", name, start, clock())
+        return call
+    return decorate
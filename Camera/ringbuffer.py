@@ -0,0 +1,136 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import numpy as np
+
+"""Fixed capacity ring buffer of preallocated frame slots. The slots are
+   filled straight from the camera's circular buffer with GetImages while a
+   kinetic or run till abort acquisition is running, so memory stays the
+   same however long the series is. Consumers get views of the slots and
+   hand them back with release(); frames the camera produces while every
+   slot is still in use are lost and counted in overruns. iter_frames of
+   the cameras streams through a ring buffer when one is passed:
+
+       ring = FrameRingBuffer.for_camera(cam, 64)
+       for frame in cam.iter_frames(10000, ring=ring):
+           process(frame)
+       print ring.overruns """
+
+class FrameRingBuffer:
+    def __init__(self, capacity, frameshape, dtype=np.int32):
+        if np.ndim(frameshape) == 0:
+            frameshape = (frameshape,)
+        self.capacity  = capacity
+        self.frameshape = tuple(frameshape)
+        self.frames    = np.empty((capacity,) + self.frameshape, dtype)
+        self.indices   = np.zeros(capacity, np.int64)
+        self.head      = 0          # frames written since reset
+        self.tail      = 0          # frames released since reset
+        self.lastIndex = 0          # series index of the last fetched frame
+        self.fetched   = 0
+        self.overruns  = 0
+        self._cond     = threading.Condition()
+
+    @classmethod
+    def for_camera(cls, cam, capacity):
+        # Slots sized and typed for the camera's current settings
+        if cam.Is16Bit():
+            dtype = np.uint16
+        else:
+            dtype = np.int32
+        return cls(capacity, cam.GetGeometry().frameshape, dtype)
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def reset(self):
+        with self._cond:
+            self.head = 0
+            self.tail = 0
+            self.lastIndex = 0
+            self.fetched = 0
+            self.overruns = 0
+
+    def fill(self, cam):
+        # Moves every new frame the camera holds into free slots, with one
+        # GetImages call per contiguous run of slots. Returns the number of
+        # frames fetched.
+        new = cam.GetNumberNewImages()
+        if new is None:
+            return 0
+        first, last = new
+
+        with self._cond:
+            if first > self.lastIndex + 1:
+                self.overruns += first - self.lastIndex - 1
+
+            count = 0
+            while first <= last:
+                free = self.capacity - (self.head - self.tail)
+                if free == 0:
+                    break
+                slot = self.head % self.capacity
+                n = min(last - first + 1, free, self.capacity - slot)
+                if cam.GetImages(first, first + n - 1, out=self.frames[slot:slot + n]) is None:
+                    break
+                self.indices[slot:slot + n] = np.arange(first, first + n)
+                self.head += n
+                first += n
+                count += n
+
+            # Frames left in the camera are counted as overruns once the
+            # camera's buffer moves past them
+            self.lastIndex = first - 1
+            self.fetched += count
+            if count:
+                self._cond.notify_all()
+        return count
+
+    def follow(self, cam, interval=1.0):
+        # Fills the buffer as the camera signals new frames, until it stops
+        # acquiring. interval bounds each wait in seconds.
+        while cam.GetStatus() == "DRV_ACQUIRING":
+            cam.WaitForAcquisitionTimeOut(interval * 1000)
+            self.fill(cam)
+        self.fill(cam)
+
+    def get(self, timeout=None):
+        # Returns (series index, frame view) of the oldest unreleased frame,
+        # or None if there is none within timeout seconds. The view stays
+        # valid until release() is called.
+        with self._cond:
+            if self.head == self.tail:
+                self._cond.wait(timeout)
+                if self.head == self.tail:
+                    return None
+            slot = self.tail % self.capacity
+            return self.indices[slot], self.frames[slot]
+
+    def release(self, count=1):
+        # Hands the oldest count frames back to the producer
+        with self._cond:
+            self.tail += min(count, self.head - self.tail)
+
+    def drain(self, limit=None):
+        # Yields the views of the unreleased frames, oldest first, at most
+        # limit of them. Each is released when the next one is asked for.
+        while len(self) and (limit is None or limit > 0):
+            index, frame = self.get(0)
+            yield frame
+            self.release()
+            if limit is not None:
+                limit -= 1
@@ -0,0 +1,155 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import collections
+import numpy as np
+
+"""Software binning and regions of interest on full resolution frames.
+   Binning is a reshape of the frame into blocks followed by one sum (or
+   mean) over the block axes, so any rectangular bin size works and the
+   camera does not have to be reconfigured to change it:
+
+       binned = bin_frame(frame, hbin=3, vbin=8)
+
+   ROIEngine reduces each frame to a few named regions, each cut out of
+   the frame, binned and summed or averaged, which is all that needs to
+   be stored of many measurements:
+
+       rois = ROIEngine()
+       rois.add("fibre1", rows=(10, 30), vbin=None)          # a spectrum
+       rois.add("spot", rows=(100, 140), cols=(500, 540), reduce="mean",
+                hbin=None, vbin=None)                        # one value
+       results = rois.process(cam.GetAcquiredData())
+
+   Rows and columns are 0-based, half-open index ranges of the arrays from
+   GetAcquiredData, not the 1-based pixels of SetImage. A bin of None
+   spans the whole region along that axis. Frames can carry leading axes,
+   such as the frames of a kinetic series, which are kept. Sums of 16-bit
+   data are 32-bit and of 32-bit data 64-bit, so they do not overflow;
+   means are float32. """
+
+REDUCTIONS = ("sum", "mean")
+
+def _sum_type(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind == "u":
+        return np.uint32 if dtype.itemsize <= 2 else np.uint64
+    if dtype.kind == "i":
+        return np.int32 if dtype.itemsize <= 2 else np.int64
+    return np.float64
+
+def bin_frame(data, hbin=1, vbin=1, reduce="sum"):
+    # Bins the last two axes of data by vbin rows and hbin columns. The
+    # image size must be a multiple of the bin size.
+    if reduce not in REDUCTIONS:
+        raise ValueError("reduce must be one of %s" % ", ".join(REDUCTIONS))
+    data = np.asarray(data)
+    rows, cols = data.shape[-2:]
+    if rows % vbin or cols % hbin:
+        raise ValueError("%dx%d pixels do not divide into bins of %dx%d"
+                         % (rows, cols, vbin, hbin))
+    blocks = data.reshape(data.shape[:-2] + (rows // vbin, vbin, cols // hbin, hbin))
+    axes = (data.ndim - 1, data.ndim + 1)
+    if reduce == "mean":
+        return blocks.mean(axis=axes, dtype=np.float64).astype(np.float32)
+    return blocks.sum(axis=axes, dtype=_sum_type(data.dtype))
+
+class ROI:
+    def __init__(self, name, rows=None, cols=None, hbin=1, vbin=1, reduce="sum"):
+        # rows and cols are (start, stop) ranges, None for all
+        if reduce not in REDUCTIONS:
+            raise ValueError("reduce must be one of %s" % ", ".join(REDUCTIONS))
+        self.name   = name
+        self.rows   = rows
+        self.cols   = cols
+        self.hbin   = hbin
+        self.vbin   = vbin
+        self.reduce = reduce
+
+    def _range(self, extent, size):
+        start, stop = (0, size) if extent is None else extent
+        if not 0 <= start < stop <= size:
+            raise ValueError("ROI %r range %r is outside 0..%d" % (self.name, extent, size))
+        return start, stop
+
+    def shape(self, frameshape):
+        # The shape of the result for frames of frameshape (rows, columns)
+        rows, cols = frameshape[-2:]
+        top, bottom = self._range(self.rows, rows)
+        left, right = self._range(self.cols, cols)
+        vbin = self.vbin or bottom - top
+        hbin = self.hbin or right - left
+        if (bottom - top) % vbin or (right - left) % hbin:
+            raise ValueError("ROI %r of %dx%d pixels does not divide into bins of %dx%d"
+                             % (self.name, bottom - top, right - left, vbin, hbin))
+        return tuple(frameshape[:-2]) + ((bottom - top) // vbin, (right - left) // hbin)
+
+    def apply(self, data):
+        data = np.asarray(data)
+        rows, cols = data.shape[-2:]
+        top, bottom = self._range(self.rows, rows)
+        left, right = self._range(self.cols, cols)
+        region = data[..., top:bottom, left:right]
+        return bin_frame(region, self.hbin or right - left, self.vbin or bottom - top,
+                         self.reduce)
+
+class ROIEngine:
+    def __init__(self, rois=()):
+        self.rois = collections.OrderedDict()
+        for roi in rois:
+            self.rois[roi.name] = roi
+
+    def add(self, name, rows=None, cols=None, hbin=1, vbin=1, reduce="sum"):
+        # Adds a region, or replaces the one of that name
+        self.rois[name] = ROI(name, rows, cols, hbin, vbin, reduce)
+        return self.rois[name]
+
+    def remove(self, name):
+        del self.rois[name]
+
+    def check(self, frameshape):
+        # The result shape of each region for frames of frameshape; raises
+        # ValueError for regions which do not fit
+        return collections.OrderedDict((name, roi.shape(frameshape))
+                                       for name, roi in self.rois.items())
+
+    def check_camera(self, cam):
+        return self.check(cam.GetGeometry().frameshape)
+
+    def process(self, data):
+        # The result of each region for a frame (or a series of frames), by
+        # name
+        if not isinstance(data, np.ndarray):
+            data = getattr(data, "data", data)
+        data = np.asarray(data)
+        if data.ndim < 2:
+            raise ValueError("regions need frames of rows and columns")
+        return collections.OrderedDict((name, roi.apply(data))
+                                       for name, roi in self.rois.items())
+
+    def processor(self):
+        # A frame processor for AcquisitionEngine, which then queues the
+        # results by name instead of the frames
+        return self.process
+
+    def reduction(self, frameshape, dtype):
+        # The size of the results relative to that of the frames
+        frame = int(np.prod(frameshape)) * np.dtype(dtype).itemsize
+        results = 0
+        for name, roi in self.rois.items():
+            itemsize = 4 if roi.reduce == "mean" else np.dtype(_sum_type(dtype)).itemsize
+            results += int(np.prod(roi.shape(frameshape))) * itemsize
+        return float(results) / frame
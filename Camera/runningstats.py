@@ -0,0 +1,155 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import numpy as np
+
+"""Software accumulation with running per-pixel statistics. Where
+   hardware accumulation only returns the sum, RunningStatistics keeps the
+   mean, variance, minimum and maximum of every pixel over any number of
+   frames in a few float64 arrays of the frame shape, using Welford's
+   update for single frames and Chan's combination for blocks of frames
+   (a kinetic series from GetAcquiredData), so memory does not grow with
+   the number of frames:
+
+       stats = RunningStatistics.for_camera(cam)
+       for frame in cam.iter_frames(500):
+           stats.add(frame)
+           if stats.count % 100 == 0:
+               print stats.snapshot()["std"].mean()
+
+   The arrays are allocated for the first frame when no shape is given. """
+
+class RunningStatistics:
+    def __init__(self, frameshape=None):
+        self.frameshape = None
+        self.count = 0
+        if frameshape is not None:
+            if np.ndim(frameshape) == 0:
+                frameshape = (frameshape,)
+            self._allocate(tuple(frameshape))
+
+    @classmethod
+    def for_camera(cls, cam):
+        # Statistics shaped for the frames of the camera's current settings
+        return cls(cam.GetGeometry().frameshape)
+
+    def _allocate(self, frameshape):
+        self.frameshape = frameshape
+        self._mean  = np.zeros(frameshape, np.float64)
+        self._m2    = np.zeros(frameshape, np.float64)
+        self._min   = np.empty(frameshape, np.float64)
+        self._max   = np.empty(frameshape, np.float64)
+        self._delta = np.empty(frameshape, np.float64)
+        self._work  = np.empty(frameshape, np.float64)
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        if self.frameshape is not None:
+            self._mean.fill(0)
+            self._m2.fill(0)
+            self._min.fill(np.inf)
+            self._max.fill(-np.inf)
+
+    def _check(self, frameshape):
+        if self.frameshape is None:
+            self._allocate(frameshape)
+        elif frameshape != self.frameshape:
+            raise ValueError("frames of shape %r do not fit statistics of %r"
+                             % (frameshape, self.frameshape))
+
+    def add(self, frame):
+        # Adds one frame (an array, or a Frame of AcquisitionEngine)
+        if not isinstance(frame, np.ndarray):
+            frame = getattr(frame, "data", frame)
+        frame = np.asarray(frame)
+        self._check(frame.shape)
+        self.count += 1
+
+        # delta = x - mean; mean += delta / n; m2 += delta * (x - mean)
+        np.subtract(frame, self._mean, out=self._delta)
+        np.divide(self._delta, self.count, out=self._work)
+        self._mean += self._work
+        np.subtract(frame, self._mean, out=self._work)
+        self._work *= self._delta
+        self._m2 += self._work
+
+        np.minimum(self._min, frame, out=self._min)
+        np.maximum(self._max, frame, out=self._max)
+
+    def extend(self, frames):
+        # Adds a block of frames along the first axis at once
+        frames = np.asarray(frames)
+        if len(frames) == 0:
+            return
+        self._check(frames.shape[1:])
+
+        n = len(frames)
+        total = self.count + n
+        mean = frames.mean(axis=0, dtype=np.float64)
+        m2 = np.subtract(frames, mean, dtype=np.float64)
+        m2 *= m2
+        m2 = m2.sum(axis=0)
+
+        # Chan et al.: combine the block with what came before
+        np.subtract(mean, self._mean, out=self._delta)
+        np.multiply(self._delta, float(n) / total, out=self._work)
+        self._mean += self._work
+        self._delta *= self._delta
+        self._delta *= float(self.count) * n / total
+        self._m2 += m2
+        self._m2 += self._delta
+        self.count = total
+
+        np.minimum(self._min, frames.min(axis=0), out=self._min)
+        np.maximum(self._max, frames.max(axis=0), out=self._max)
+
+    def consume(self, frames):
+        # Adds the frames of an iterator, such as iter_frames() or the
+        # frames() of AcquisitionEngine or SpoolReader
+        for frame in frames:
+            self.add(frame)
+        return self
+
+    def mean(self):
+        return self._mean.copy()
+
+    def variance(self, ddof=1):
+        # The per-pixel variance, NaN while there are too few frames
+        if self.count <= ddof:
+            return np.full(self.frameshape, np.nan)
+        return self._m2 / (self.count - ddof)
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+    def minimum(self):
+        return self._min.copy()
+
+    def maximum(self):
+        return self._max.copy()
+
+    def snapshot(self, ddof=1):
+        # Copies of the statistics so far, which later frames leave alone
+        variance = self.variance(ddof)
+        return {
+            "count": self.count,
+            "mean": self._mean.copy(),
+            "variance": variance,
+            "std": np.sqrt(variance),
+            "min": self._min.copy(),
+            "max": self._max.copy(),
+        }
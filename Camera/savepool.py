@@ -0,0 +1,199 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from export import save_image, save_text, save_npy, save_raw
+from fitswriter import FITSWriter
+from compression import save_compressed
+
+"""Background writer for acquired frames. submit() copies a frame and
+   queues it with the files to write it to; a pool of worker threads (or
+   processes) encodes and writes them while the camera goes on with the
+   next exposure:
+
+       pool = SavePool()
+       cam.StartAcquisition()
+       pool.submit(cam.GetAcquiredData(), ["001.txt", ("bmp-normalised", "n001.bmp")])
+       ...
+       pool.close()
+       pool.check()
+
+   At most maxsize frames are queued or being written; submit() blocks
+   until one of them is done when the queue is full, so a slow disk slows
+   the acquisition down instead of filling the memory. Failed saves are
+   collected in errors rather than lost in a worker.
+
+   With processes=True the encoding, such as the compression of "pyz"
+   outputs, is spread over the cores of the machine. """
+
+def write_bmp(path, data, metadata):
+    save_image(path, data, "BMP")
+
+def write_bmp_normalised(path, data, metadata):
+    save_image(path, data, "BMP", normalise="minmax")
+
+def write_png(path, data, metadata):
+    save_image(path, data, "PNG", bits=16)
+
+def write_tiff(path, data, metadata):
+    save_image(path, data, "TIFF", bits=16)
+
+def write_txt(path, data, metadata):
+    save_text(path, data)
+
+def write_npy(path, data, metadata):
+    save_npy(path, data)
+
+def write_raw(path, data, metadata):
+    save_raw(path, data, metadata)
+
+def write_fits(path, data, metadata):
+    with FITSWriter(path, data.shape, data.dtype) as fits:
+        fits.append(data)
+
+def write_pyz(path, data, metadata):
+    save_compressed(path, data, metadata)
+
+# The output formats by name. The workers look the writers up here, so
+# that only names cross over to a process pool.
+WRITERS = {
+    "bmp":            write_bmp,
+    "bmp-normalised": write_bmp_normalised,
+    "png":            write_png,
+    "tiff":           write_tiff,
+    "txt":            write_txt,
+    "npy":            write_npy,
+    "raw":            write_raw,
+    "fits":           write_fits,
+    "pyz":            write_pyz,
+}
+
+EXTENSIONS = {
+    ".bmp":  "bmp",
+    ".png":  "png",
+    ".tif":  "tiff",
+    ".tiff": "tiff",
+    ".txt":  "txt",
+    ".npy":  "npy",
+    ".raw":  "raw",
+    ".fit":  "fits",
+    ".fits": "fits",
+    ".pyz":  "pyz",
+}
+
+def output(entry):
+    # A (format, path) pair from a path or a (format, path) pair
+    if isinstance(entry, tuple):
+        format, path = entry
+    else:
+        path = entry
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in EXTENSIONS:
+            raise ValueError("cannot tell the output format of %r" % (path,))
+        format = EXTENSIONS[extension]
+    if format not in WRITERS:
+        raise ValueError("unknown output format %r" % (format,))
+    return format, path
+
+def write_outputs(data, outputs, metadata=None):
+    # Writes data to each output in turn. Runs in the workers.
+    for format, path in outputs:
+        WRITERS[format](path, data, metadata)
+    return [path for format, path in outputs]
+
+class SavePool:
+    def __init__(self, workers=2, maxsize=8, processes=False):
+        if processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.maxsize = maxsize
+        self.pending = 0
+        self.written = 0
+        self.errors  = []
+        self._cond   = threading.Condition()
+
+    def submit(self, data, outputs, metadata=None, timeout=None):
+        # Queues a copy of data to be written to outputs, each a path or a
+        # (format, path) pair. Waits up to timeout seconds for room in the
+        # queue and returns the future of the job, or None if there was no
+        # room.
+        outputs = [output(entry) for entry in outputs]
+        with self._cond:
+            if self.pending >= self.maxsize:
+                self._cond.wait(timeout)
+                while timeout is None and self.pending >= self.maxsize:
+                    self._cond.wait()
+                if self.pending >= self.maxsize:
+                    return None
+            self.pending += 1
+
+        try:
+            future = self.executor.submit(write_outputs, np.array(data, copy=True), outputs, metadata)
+        except:
+            self._done(outputs, None)
+            raise
+        future.add_done_callback(lambda future: self._done(outputs, future))
+        return future
+
+    def _done(self, outputs, future):
+        with self._cond:
+            self.pending -= 1
+            if future is not None:
+                error = future.exception()
+                if error is not None:
+                    self.errors.append(([path for format, path in outputs], error))
+                else:
+                    self.written += 1
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        # Waits until every queued frame has been written. Returns False if
+        # that did not happen within timeout seconds.
+        with self._cond:
+            if self.pending:
+                self._cond.wait(timeout)
+                while timeout is None and self.pending:
+                    self._cond.wait()
+            return self.pending == 0
+
+    def take_errors(self):
+        # Returns and forgets the failed saves, as (paths, exception) pairs
+        with self._cond:
+            errors, self.errors = self.errors, []
+        return errors
+
+    def check(self):
+        # Raises the first failed save, if any
+        errors = self.take_errors()
+        if errors:
+            paths, error = errors[0]
+            raise RuntimeError("%d save(s) failed, the first of %s with: %s"
+                               % (len(errors), ", ".join(paths), error))
+
+    def close(self, wait=True):
+        if wait:
+            self.flush()
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
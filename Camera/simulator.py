@@ -0,0 +1,599 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+import numpy as np
+from geometry import ReadoutGeometry, ACCUMULATE, KINETICS, FAST_KINETICS, RUN_TILL_ABORT
+
+"""Simulated Andor SDK. SimulatedSDK stands in for libandor and implements
+   the SDK functions the wrappers use, with the calling convention of the
+   prototypes in bindings.py (plain numbers and strings in, byref outputs,
+   pointer buffers, integer return codes). Acquisitions run
+   in simulated time: each frame takes the exposure plus a readout time
+   derived from the HS/VS speeds, binning and crop, and frames appear in a
+   circular buffer as that time passes. The frames are synthetic: a bias
+   level, a Gaussian spot (images) or emission lines (spectra), shot and
+   read noise and the odd cosmic ray.
+
+   Select it with Andor(backend="sim") or by setting PYANDOR_BACKEND=sim.
+   With realtime=False no time is spent waiting and frames are available
+   as soon as they are due, which is what benchmarks of the wrapper want. """
+
+DRV_SUCCESS        = 20002
+DRV_NO_NEW_DATA    = 20024
+DRV_TEMP_OFF       = 20034
+DRV_TEMP_STABILIZED = 20036
+DRV_TEMP_NOT_REACHED = 20037
+DRV_P1INVALID      = 20066
+DRV_P2INVALID      = 20067
+DRV_P3INVALID      = 20068
+DRV_ACQUIRING      = 20072
+DRV_IDLE           = 20073
+DRV_NOT_INITIALIZED = 20075
+DRV_NOT_SUPPORTED  = 20991
+
+# Horizontal readout rates in MHz and vertical shift times in microseconds
+HS_SPEEDS = [5.0, 3.0, 1.0, 0.05]
+VS_SPEEDS = [0.3, 0.5, 0.9, 1.7, 3.3]
+PREAMP_GAINS = [1.0, 2.0, 4.0]
+
+def _set(ref, value):
+    # Writes through a byref() argument
+    ref._obj.value = value
+
+def _buffer(ptr, size):
+    return np.ctypeslib.as_array(ptr, shape=(size,))
+
+class SimulatedSDK:
+    def __init__(self, width=1024, height=256, bitdepth=16, serial=12345,
+                 realtime=True, circular_buffer=32, cooling_time=20.0,
+                 ambient=20, cosmics=0.2, seed=0):
+        self.width          = width
+        self.height         = height
+        self.bitdepth       = bitdepth
+        self.serial         = serial
+        self.realtime       = realtime
+        self.capacity       = circular_buffer
+        self.cooling_time   = cooling_time
+        self.ambient        = ambient
+        self.cosmics        = cosmics
+        self.seed           = seed
+
+        self.initialized    = False
+        self.readmode       = 4
+        self.acqmode        = 1
+        self.scans          = 1
+        self.accumulations  = 1
+        self.exposure       = 0.01
+        self.accCycle       = 0.0
+        self.kinCycle       = 0.0
+        self.image          = (1, 1, 1, width, 1, height)
+        self.tracks         = 1
+        self.trackAreas     = [(height // 2, height // 2)]
+        self.rotate         = 0
+        self.hsspeed        = 0
+        self.vsspeed        = 1
+        self.preampgain     = 0
+        self.channel        = 0
+        self.outamp         = 0
+        self.emgain         = 0
+        self.trigger        = 0
+        self.shutter        = 0
+        self.spool          = None
+
+        self.setpoint       = ambient
+        self.cooler         = 0
+        self.coolerStart    = None
+        self.coolerFrom     = ambient
+
+        self._cond          = threading.Condition()
+        self._clock         = 0.0
+        self._start         = None
+        self._stopped       = None
+        self._total         = 0
+        self._period        = 0.0
+        self._retrieved     = 0
+        self._signalled     = 0
+        self._cancelled     = False
+        self._base          = None
+
+    # Timing
+
+    def _now(self):
+        if self.realtime:
+            return time.time()
+        return self._clock
+
+    def _sleep_until(self, when):
+        # Waits on the condition so that CancelWait can interrupt
+        if self.realtime:
+            self._cond.wait(max(when - time.time(), 0))
+        else:
+            self._clock = max(self._clock, when)
+
+    def _geometry(self):
+        hbin, vbin, hstart, hend, vstart, vend = self.image
+        return ReadoutGeometry(self.width, self.height, self.readmode, self.acqmode,
+                               self.scans, hbin, vbin, hstart, hend, vstart, vend,
+                               self.tracks, self.rotate)
+
+    def ReadoutTime(self):
+        # Every row is shifted down the sensor; only the rows and columns
+        # left after binning and cropping are digitised
+        geometry = self._geometry()
+        shift = self.height * VS_SPEEDS[self.vsspeed] * 1e-6
+        rows = geometry.framesize // geometry.frameshape[-1]
+        columns = geometry.frameshape[-1]
+        digitise = rows * (columns + self.width * 0.01) / (HS_SPEEDS[self.hsspeed] * 1e6)
+        return shift + digitise
+
+    def _timings(self):
+        exposure = self.exposure
+        readout = self.ReadoutTime()
+        accumulate = max(self.accCycle, exposure + readout)
+        kinetic = max(self.kinCycle, accumulate * self.accumulations)
+        return exposure, accumulate, kinetic
+
+    def _produced(self):
+        # Number of frames completed so far
+        if self._start is None:
+            return 0
+        now = self._now() if self._stopped is None else self._stopped
+        # The tolerance keeps a frame that is exactly due from rounding down
+        count = int((now - self._start) / self._period + 1e-9)
+        if self._total is not None:
+            count = min(count, self._total)
+        return count
+
+    def _acquiring(self):
+        if self._start is None or self._stopped is not None:
+            return False
+        return self._total is None or self._produced() < self._total
+
+    def _oldest(self):
+        return max(1, self._produced() - self.capacity + 1)
+
+    # Synthetic data
+
+    def _pattern(self, geometry):
+        # Noise free signal in counts per second, for one frame
+        if self._base is not None and self._base[0] == geometry.frameshape:
+            return self._base[1]
+
+        if len(geometry.frameshape) == 2 and self.readmode == 4:
+            rows, columns = geometry.frameshape
+            y, x = np.mgrid[0:rows, 0:columns]
+            r2 = ((x - columns * 0.45) / (columns * 0.08 + 1)) ** 2 + ((y - rows * 0.55) / (rows * 0.08 + 1)) ** 2
+            signal = 50.0 + 20000.0 * np.exp(-r2 / 2)
+            hbin, vbin = self.image[0], self.image[1]
+            signal *= hbin * vbin
+        else:
+            columns = geometry.frameshape[-1]
+            x = np.arange(columns, dtype=np.float64)
+            signal = np.full(columns, 200.0)
+            for centre, width, height in ((0.2, 3.0, 40000.0), (0.43, 2.0, 15000.0),
+                                          (0.61, 4.0, 30000.0), (0.85, 2.5, 8000.0)):
+                signal += height * np.exp(-((x - centre * columns) / width) ** 2 / 2)
+            if len(geometry.frameshape) == 2:
+                # Each track sums its rows
+                heights = [end - start + 1 for start, end in self.trackAreas]
+                signal = signal * np.array(heights, np.float64)[:, np.newaxis]
+
+        self._base = (geometry.frameshape, signal)
+        return signal
+
+    def _frame(self, index, geometry):
+        rng = np.random.RandomState((self.seed * 1000003 + index) & 0x7fffffff)
+        bias = 500.0
+        exposure = self.exposure * self.accumulations
+        signal = self._pattern(geometry) * exposure
+        if self.shutter == 2:
+            signal = signal * 0.0
+        gain = PREAMP_GAINS[self.preampgain] * max(1, self.emgain)
+        frame = bias + signal * gain + rng.normal(0.0, 1.0, signal.shape) * np.sqrt(signal * gain + 25.0)
+
+        if rng.random_sample() < self.cosmics:
+            flat = frame.reshape(-1)
+            hits = rng.randint(0, flat.size, rng.randint(1, 4))
+            flat[hits] += rng.uniform(2000, 20000, hits.size)
+
+        return np.clip(frame, 0, 2 ** self.bitdepth - 1)
+
+    def _fill(self, ptr, size, first, last):
+        geometry = self._geometry()
+        frames = last - first + 1
+        if size != geometry.framesize * frames:
+            return DRV_P2INVALID if first == last else DRV_P3INVALID
+        out = _buffer(ptr, size).reshape((frames,) + geometry.frameshape)
+        for i in range(frames):
+            out[i] = self._frame(first + i, geometry)
+        return DRV_SUCCESS
+
+    # Initialisation and camera information
+
+    def Initialize(self, directory):
+        self.initialized = True
+        return DRV_SUCCESS
+
+    def ShutDown(self):
+        self.initialized = False
+        return DRV_SUCCESS
+
+    def GetDetector(self, width, height):
+        _set(width, self.width)
+        _set(height, self.height)
+        return DRV_SUCCESS
+
+    def GetCameraSerialNumber(self, serial):
+        _set(serial, self.serial)
+        return DRV_SUCCESS
+
+    def GetNumberADChannels(self, channels):
+        _set(channels, 1)
+        return DRV_SUCCESS
+
+    def GetBitDepth(self, channel, depth):
+        _set(depth, self.bitdepth)
+        return DRV_SUCCESS
+
+    def GetNumberHSSpeeds(self, channel, typ, speeds):
+        _set(speeds, len(HS_SPEEDS))
+        return DRV_SUCCESS
+
+    def GetHSSpeed(self, channel, typ, index, speed):
+        _set(speed, HS_SPEEDS[index])
+        return DRV_SUCCESS
+
+    def GetNumberVSSpeeds(self, speeds):
+        _set(speeds, len(VS_SPEEDS))
+        return DRV_SUCCESS
+
+    def GetVSSpeed(self, index, speed):
+        _set(speed, VS_SPEEDS[index])
+        return DRV_SUCCESS
+
+    def GetNumberPreAmpGains(self, gains):
+        _set(gains, len(PREAMP_GAINS))
+        return DRV_SUCCESS
+
+    def GetPreAmpGain(self, index, gain):
+        _set(gain, PREAMP_GAINS[index])
+        return DRV_SUCCESS
+
+    def GetEMGainRange(self, low, high):
+        _set(low, 0)
+        _set(high, 300)
+        return DRV_SUCCESS
+
+    def GetEMCCDGain(self, gain):
+        _set(gain, self.emgain)
+        return DRV_SUCCESS
+
+    # Settings
+
+    def _setter(self, name, value, valid=True):
+        with self._cond:
+            if self._acquiring():
+                return DRV_ACQUIRING
+            if not valid:
+                return DRV_P1INVALID
+            setattr(self, name, value)
+            self._base = None
+            return DRV_SUCCESS
+
+    def SetReadMode(self, mode):
+        return self._setter("readmode", mode, mode in (0, 1, 2, 3, 4))
+
+    def SetAcquisitionMode(self, mode):
+        return self._setter("acqmode", mode, mode in (1, 2, 3, 4, 5))
+
+    def SetNumberKinetics(self, number):
+        return self._setter("scans", number, number >= 1)
+
+    def SetNumberAccumulations(self, number):
+        return self._setter("accumulations", number, number >= 1)
+
+    def SetExposureTime(self, exposure):
+        return self._setter("exposure", exposure, exposure >= 0)
+
+    def SetAccumulationCycleTime(self, cycle):
+        return self._setter("accCycle", cycle, cycle >= 0)
+
+    def SetKineticCycleTime(self, cycle):
+        return self._setter("kinCycle", cycle, cycle >= 0)
+
+    def SetImage(self, hbin, vbin, hstart, hend, vstart, vend):
+        valid = (1 <= hstart <= hend <= self.width and 1 <= vstart <= vend <= self.height
+                 and (hend - hstart + 1) % hbin == 0 and (vend - vstart + 1) % vbin == 0)
+        return self._setter("image", (hbin, vbin, hstart, hend, vstart, vend), valid)
+
+    def SetImageRotate(self, rotate):
+        return self._setter("rotate", rotate, rotate in (0, 1, 2))
+
+    def _set_tracks(self, areas):
+        # Tracks must lie on the sensor, from the bottom up, without overlap
+        valid = len(areas) >= 1 and all(1 <= start <= end <= self.height for start, end in areas)
+        valid = valid and all(areas[i][1] < areas[i + 1][0] for i in range(len(areas) - 1))
+        error = self._setter("trackAreas", areas, valid)
+        if error == DRV_SUCCESS:
+            self.tracks = len(areas)
+        return error
+
+    def SetSingleTrack(self, centre, height):
+        bottom = centre - height // 2
+        return self._set_tracks([(bottom, bottom + height - 1)])
+
+    def SetMultiTrack(self, number, height, offset, bottom, gap):
+        # The tracks are spread evenly, with equal gaps around them
+        if number < 1 or height < 1 or number * height > self.height:
+            return DRV_P1INVALID if number < 1 else DRV_P2INVALID
+        space = (self.height - number * height) // (number + 1)
+        first = 1 + space + offset
+        areas = [(first + i * (height + space), first + i * (height + space) + height - 1)
+                 for i in range(number)]
+        error = self._set_tracks(areas)
+        if error == DRV_P1INVALID:
+            return DRV_P3INVALID
+        if error == DRV_SUCCESS:
+            _set(bottom, first)
+            _set(gap, space)
+        return error
+
+    def SetRandomTracks(self, number, areas):
+        return self._set_tracks([(areas[2 * i], areas[2 * i + 1]) for i in range(number)])
+
+    def SetHSSpeed(self, typ, index):
+        return self._setter("hsspeed", index, 0 <= index < len(HS_SPEEDS))
+
+    def SetVSSpeed(self, index):
+        return self._setter("vsspeed", index, 0 <= index < len(VS_SPEEDS))
+
+    def SetPreAmpGain(self, index):
+        return self._setter("preampgain", index, 0 <= index < len(PREAMP_GAINS))
+
+    def SetADChannel(self, index):
+        return self._setter("channel", index, index == 0)
+
+    def SetOutputAmplifier(self, index):
+        return self._setter("outamp", index, index in (0, 1))
+
+    def SetEMCCDGain(self, gain):
+        return self._setter("emgain", gain, 0 <= gain <= 300)
+
+    def SetEMCCDGainMode(self, mode):
+        return DRV_SUCCESS
+
+    def SetEMAdvanced(self, state):
+        return DRV_SUCCESS
+
+    def SetTriggerMode(self, mode):
+        return self._setter("trigger", mode)
+
+    def SetShutter(self, typ, mode, closingtime, openingtime):
+        return self._setter("shutter", mode, mode in (0, 1, 2))
+
+    def SetShutterEx(self, typ, mode, closingtime, openingtime, extmode):
+        return self._setter("shutter", mode, mode in (0, 1, 2))
+
+    def SetFrameTransferMode(self, mode):
+        return DRV_SUCCESS
+
+    def SetFanMode(self, mode):
+        return DRV_SUCCESS
+
+    def SetSpool(self, active, method, path, framebuffersize):
+        if active:
+            return self._setter("spool", (method, path, framebuffersize))
+        return self._setter("spool", None)
+
+    def SaveAsFITS(self, filename, typ):
+        return DRV_NOT_SUPPORTED
+
+    def GetAcquisitionTimings(self, exposure, accumulate, kinetic):
+        timings = self._timings()
+        _set(exposure, timings[0])
+        _set(accumulate, timings[1])
+        _set(kinetic, timings[2])
+        return DRV_SUCCESS
+
+    def GetReadOutTime(self, readout):
+        _set(readout, self.ReadoutTime())
+        return DRV_SUCCESS
+
+    # Temperature
+
+    def _temperature(self):
+        if not self.cooler:
+            return self.ambient
+        t = time.time() - self.coolerStart
+        return self.setpoint + (self.coolerFrom - self.setpoint) * np.exp(-t / self.cooling_time)
+
+    def SetTemperature(self, temperature):
+        self.coolerFrom = self._temperature()
+        self.coolerStart = time.time()
+        self.setpoint = int(temperature)
+        return DRV_SUCCESS
+
+    def CoolerON(self):
+        self.coolerFrom = self._temperature()
+        self.coolerStart = time.time()
+        self.cooler = 1
+        return DRV_SUCCESS
+
+    def CoolerOFF(self):
+        self.cooler = 0
+        return DRV_SUCCESS
+
+    def SetCoolerMode(self, mode):
+        return DRV_SUCCESS
+
+    def IsCoolerOn(self, status):
+        _set(status, self.cooler)
+        return DRV_SUCCESS
+
+    def GetTemperature(self, temperature):
+        current = self._temperature()
+        _set(temperature, int(round(current)))
+        if not self.cooler:
+            return DRV_TEMP_OFF
+        if abs(current - self.setpoint) < 0.5:
+            return DRV_TEMP_STABILIZED
+        return DRV_TEMP_NOT_REACHED
+
+    # Acquisition
+
+    def StartAcquisition(self):
+        with self._cond:
+            if self._acquiring():
+                return DRV_ACQUIRING
+            exposure, accumulate, kinetic = self._timings()
+            if self.acqmode in (KINETICS, FAST_KINETICS):
+                self._total, self._period = self.scans, kinetic
+            elif self.acqmode == ACCUMULATE:
+                self._total, self._period = 1, accumulate * self.accumulations
+            elif self.acqmode == RUN_TILL_ABORT:
+                self._total, self._period = None, kinetic
+            else:
+                self._total, self._period = 1, exposure + self.ReadoutTime()
+            self._period = max(self._period, 1e-6)
+            self._start = self._now()
+            self._stopped = None
+            self._retrieved = 0
+            self._signalled = 0
+            return DRV_SUCCESS
+
+    def AbortAcquisition(self):
+        with self._cond:
+            if not self._acquiring():
+                return DRV_IDLE
+            self._stopped = self._now()
+            self._cond.notify_all()
+            return DRV_SUCCESS
+
+    def GetStatus(self, status):
+        with self._cond:
+            _set(status, DRV_ACQUIRING if self._acquiring() else DRV_IDLE)
+        return DRV_SUCCESS
+
+    def GetAcquisitionProgress(self, accumulations, series):
+        with self._cond:
+            produced = self._produced()
+        _set(accumulations, produced * self.accumulations)
+        _set(series, produced)
+        return DRV_SUCCESS
+
+    def WaitForAcquisitionTimeOut(self, timeout):
+        # Returns once a frame has completed since the last wait, or with
+        # DRV_NO_NEW_DATA on timeout, CancelWait or when nothing is running
+        with self._cond:
+            self._cancelled = False
+            deadline = self._now() + timeout / 1000.0
+            while True:
+                produced = self._produced()
+                if produced > self._signalled:
+                    self._signalled = produced
+                    return DRV_SUCCESS
+                if self._cancelled or not self._acquiring():
+                    return DRV_NO_NEW_DATA
+                if self._now() >= deadline:
+                    return DRV_NO_NEW_DATA
+                due = self._start + (produced + 1) * self._period
+                self._sleep_until(min(due, deadline))
+
+    def WaitForAcquisition(self):
+        return self.WaitForAcquisitionTimeOut(float("inf"))
+
+    def CancelWait(self):
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+        return DRV_SUCCESS
+
+    def _read(self, ptr, size, index):
+        return self._fill(ptr, size, index, index)
+
+    def GetAcquiredData(self, ptr, size):
+        with self._cond:
+            if self._acquiring():
+                return DRV_ACQUIRING
+            produced = self._produced()
+            if produced == 0:
+                return DRV_NO_NEW_DATA
+            if self.acqmode in (KINETICS, FAST_KINETICS):
+                return self._fill(ptr, size, 1, self.scans) if produced == self.scans else DRV_NO_NEW_DATA
+            return self._read(ptr, size, produced)
+
+    GetAcquiredData16 = GetAcquiredData
+
+    def GetMostRecentImage(self, ptr, size):
+        with self._cond:
+            produced = self._produced()
+            if produced == 0:
+                return DRV_NO_NEW_DATA
+            return self._read(ptr, size, produced)
+
+    GetMostRecentImage16 = GetMostRecentImage
+
+    def GetOldestImage(self, ptr, size):
+        with self._cond:
+            produced = self._produced()
+            index = max(self._retrieved + 1, self._oldest())
+            if index > produced:
+                return DRV_NO_NEW_DATA
+            error = self._read(ptr, size, index)
+            if error == DRV_SUCCESS:
+                self._retrieved = index
+            return error
+
+    GetOldestImage16 = GetOldestImage
+
+    def GetImages(self, first, last, ptr, size, validfirst, validlast):
+        with self._cond:
+            produced = self._produced()
+            if produced == 0:
+                return DRV_NO_NEW_DATA
+            if first < self._oldest() or first > produced:
+                return DRV_P1INVALID
+            if last < first or last > produced:
+                return DRV_P2INVALID
+            error = self._fill(ptr, size, first, last)
+            if error == DRV_SUCCESS:
+                _set(validfirst, first)
+                _set(validlast, last)
+                self._retrieved = max(self._retrieved, last)
+            return error
+
+    GetImages16 = GetImages
+
+    def GetNumberNewImages(self, first, last):
+        with self._cond:
+            produced = self._produced()
+            index = max(self._retrieved + 1, self._oldest())
+            if index > produced:
+                return DRV_NO_NEW_DATA
+            _set(first, index)
+            _set(last, produced)
+            return DRV_SUCCESS
+
+    def GetNumberAvailableImages(self, first, last):
+        with self._cond:
+            produced = self._produced()
+            if produced == 0:
+                return DRV_NO_NEW_DATA
+            _set(first, self._oldest())
+            _set(last, produced)
+            return DRV_SUCCESS
@@ -0,0 +1,364 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import os
+import re
+import struct
+import time
+import numpy as np
+from PIL import Image
+from engine import Frame
+
+"""Reads the files the SDK spools to disk after SetSpool. The files are
+   found by the stem passed to SetSpool, in the order of the numbers in
+   their names, and mapped into memory, so a frame is a view of the file
+   rather than a copy. The spool methods of SetSpool read are
+
+       0     sequence of 32-bit integers
+       1     sequence of 16 or 32-bit integers, as the data
+       2     sequence of 16-bit integers
+       3     sequence of 16 or 32-bit integers in a directory tree
+       4     sequence of 16 or 32-bit integers on a RAM disk
+       5     16-bit FITS
+       7     16-bit TIFF
+
+   SIF (6) and the compressed directory tree (8) are formats of the SDK's
+   own and are not read.
+
+   Raw sequences carry no header, so the frame shape and data type come
+   from the camera settings; for_camera takes them, and the method and
+   stem, from the camera. TIFF pages are mapped when stored uncompressed
+   and read through PIL otherwise. FITS stores unsigned 16-bit data as
+   big-endian signed values with an offset, so those frames are
+   converted, which copies them.
+
+   With follow=True the reader keeps watching the spool while the
+   acquisition runs and hands out frames as they are completed, through
+   the get() and frames() of AcquisitionEngine:
+
+       cam.SetSpool(1, 1, "/data/run", 10)
+       reader = SpoolReader.for_camera(cam, follow=True, timeout=5)
+       cam.StartAcquisition(wait=False)
+       for frame in reader.frames():
+           process(frame.data)
+
+   Frames are numbered from 1 and stamped with the modification time of
+   their file. """
+
+# Spool method: (file kind, data type or None for that of the camera)
+METHODS = {
+    0: ("raw", np.int32),
+    1: ("raw", None),
+    2: ("raw", np.uint16),
+    3: ("raw", None),
+    4: ("raw", None),
+    5: ("fits", np.uint16),
+    7: ("tiff", np.uint16),
+}
+
+# Methods which spool to a tree of directories under the stem
+TREES = (3,)
+
+EXTENSIONS = {
+    "tiff": (".tif", ".tiff"),
+    "fits": (".fits", ".fit", ".fts"),
+}
+
+# Files next to raw spool files which are not frames
+SIDECARS = (".ini", ".txt", ".xml", ".json", ".sifx")
+
+FITS_BLOCK = 2880
+
+# What PIL raises on a TIFF file whose end is not written yet
+TRUNCATED = (IOError, EOFError, SyntaxError, TypeError, ValueError, KeyError, struct.error)
+
+def _natural(path):
+    # Sort key which puts file10 after file9
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", path)]
+
+def spool_files(stem, method):
+    # The files spooled to stem with the given method, in order
+    if method not in METHODS:
+        raise ValueError("cannot read spool method %r" % (method,))
+    kind = METHODS[method][0]
+    directory, prefix = os.path.split(stem)
+    directory = directory or "."
+
+    found = []
+    if method in TREES:
+        walk = os.walk(directory)
+    else:
+        walk = [(directory, [], os.listdir(directory) if os.path.isdir(directory) else [])]
+    for root, dirs, names in walk:
+        if root == directory:
+            dirs[:] = [name for name in dirs if name.startswith(prefix)]
+        for name in names:
+            path = os.path.join(root, name)
+            if root == directory and not name.startswith(prefix):
+                continue
+            if not os.path.isfile(path):
+                continue
+            extension = os.path.splitext(name)[1].lower()
+            if kind in EXTENSIONS:
+                if extension not in EXTENSIONS[kind]:
+                    continue
+            elif extension in SIDECARS:
+                continue
+            found.append(path)
+    return sorted(found, key=_natural)
+
+def _fits_header(f):
+    # The cards of a FITS header as a dictionary and the size of the header
+    cards = {}
+    size = 0
+    while True:
+        block = f.read(FITS_BLOCK)
+        if len(block) < FITS_BLOCK:
+            return None, 0
+        size += FITS_BLOCK
+        for i in range(0, FITS_BLOCK, 80):
+            text = block[i:i + 80].decode("ascii", "replace")
+            keyword = text[:8].strip()
+            if keyword == "END":
+                return cards, size
+            if text[8:10] == "= ":
+                value = text[10:].split("/")[0].strip().strip("'").strip()
+                cards[keyword] = value
+
+def _unsigned16(frame):
+    # FITS offset binary to uint16: flipping the top bit adds BZERO
+    return (frame.view(">u2") ^ 0x8000).astype(np.uint16)
+
+class _Segment:
+    # The frames of one spool file, converted by convert when read
+    def __init__(self, path, size, count, frames, convert=None):
+        self.path    = path
+        self.size    = size
+        self.count   = count
+        self.frames  = frames
+        self.convert = convert
+        self.mtime   = os.path.getmtime(path)
+
+    def frame(self, i):
+        if self.convert is None:
+            return self.frames[i]
+        return self.convert(self.frames[i])
+
+class SpoolReader:
+    def __init__(self, stem, frameshape, method=1, dtype=None, follow=False,
+                 poll=0.05, timeout=None):
+        # Reads the spool at stem, written with the given method, of frames
+        # of frameshape. With follow, get() and frames() wait for frames
+        # still to come: poll is the time between looks at the spool and
+        # timeout the time without a new frame after which the spool is
+        # taken to be finished.
+        if method not in METHODS:
+            raise ValueError("cannot read spool method %r" % (method,))
+        kind, default = METHODS[method]
+        if dtype is None:
+            dtype = default
+        if dtype is None:
+            raise ValueError("spool method %d needs the data type" % method)
+        if np.ndim(frameshape) == 0:
+            frameshape = (frameshape,)
+
+        self.stem       = stem
+        self.method     = method
+        self.kind       = kind
+        self.frameshape = tuple(frameshape)
+        self.dtype      = np.dtype(dtype)
+        self.framebytes = int(np.prod(self.frameshape)) * self.dtype.itemsize
+        self.follow     = follow
+        self.poll       = poll
+        self.timeout    = timeout
+        self.segments   = []
+        self.count      = 0
+        self.position   = 0
+        self._stopped   = False
+        self.refresh()
+
+    @classmethod
+    def for_camera(cls, cam, stem=None, method=None, **kwargs):
+        # A reader for what the camera spools with its current settings. The
+        # stem and method default to those of the last SetSpool.
+        spool = cam.GetSpool()
+        if stem is None or method is None:
+            if spool is None:
+                raise ValueError("spooling is not enabled")
+            method = spool[0] if method is None else method
+            stem = spool[1] if stem is None else stem
+        if cam.Is16Bit():
+            dtype = np.uint16
+        else:
+            dtype = np.int32
+        if METHODS.get(method, (None, None))[1] is not None:
+            dtype = None
+        return cls(stem, cam.GetGeometry().frameshape, method, dtype, **kwargs)
+
+    def _map(self, path, size):
+        # A _Segment of the complete frames in the file at path
+        if self.kind == "raw":
+            count = size // self.framebytes
+            frames = None
+            if count:
+                frames = np.memmap(path, dtype=self.dtype, mode="r",
+                                   shape=(count,) + self.frameshape)
+            return _Segment(path, size, count, frames)
+        if self.kind == "tiff":
+            return self._map_tiff(path, size)
+        return self._map_fits(path, size)
+
+    def _map_tiff(self, path, size):
+        # The complete pages of the file; a page the SDK is still writing is
+        # left for a later refresh
+        pages = []
+        try:
+            im = Image.open(path)
+        except TRUNCATED:
+            # Not even the header is complete yet
+            return _Segment(path, size, 0, None)
+        try:
+            # Page by page rather than by n_frames, which some versions of
+            # PIL never return from on a truncated file
+            for page in itertools.count():
+                im.seek(page)
+                tile = im.tile
+                if not tile or any(offset == tile[0][2] for offset, data in pages):
+                    # The directory of the page is not complete
+                    break
+                if (len(tile) == 1 and tile[0][0] == "raw" and im.mode in ("I;16", "I;16B")
+                        and tile[0][3][1] in (0, im.size[0] * 2)):
+                    if tile[0][2] + im.size[0] * im.size[1] * 2 > size:
+                        break
+                    dtype = "<u2" if im.mode == "I;16" else ">u2"
+                    data = np.memmap(path, dtype=dtype, mode="r", offset=tile[0][2],
+                                     shape=(im.size[1], im.size[0]))
+                else:
+                    data = np.array(im)
+                pages.append((tile[0][2], data))
+        except TRUNCATED:
+            # The end of the file, or a page not written yet
+            pass
+        finally:
+            im.close()
+        frames = [data.reshape(self.frameshape) for offset, data in pages]
+        return _Segment(path, size, len(frames), frames)
+
+    def _map_fits(self, path, size):
+        with open(path, "rb") as f:
+            cards, offset = _fits_header(f)
+        if cards is None:
+            return _Segment(path, size, 0, None)
+        bitpix = int(cards["BITPIX"])
+        dtype = np.dtype(">i%d" % (bitpix // 8)) if bitpix > 0 else np.dtype(">f%d" % (-bitpix // 8))
+        count = (size - offset) // (int(np.prod(self.frameshape)) * dtype.itemsize)
+        naxis = int(cards["NAXIS"])
+        if naxis > len(self.frameshape):
+            written = int(cards["NAXIS%d" % naxis])
+            if written:
+                count = min(count, written)
+        if not count:
+            return _Segment(path, size, 0, None)
+        frames = np.memmap(path, dtype=dtype, mode="r", offset=offset,
+                           shape=(count,) + self.frameshape)
+        bzero = float(cards.get("BZERO", 0))
+        if bzero == 32768 and bitpix == 16:
+            return _Segment(path, size, count, frames, _unsigned16)
+        if bzero:
+            return _Segment(path, size, count, frames, lambda frame: frame + bzero)
+        return _Segment(path, size, count, frames)
+
+    def refresh(self):
+        # Looks for new files and frames and returns the number of frames
+        # spooled so far
+        segments = []
+        known = dict((segment.path, segment) for segment in self.segments)
+        paths = spool_files(self.stem, self.method)
+        for path in paths:
+            size = os.path.getsize(path)
+            segment = known.get(path)
+            # Frames go into the padding of a FITS file, which leaves its
+            # size as it was, so the last one is read again regardless
+            if (segment is None or segment.size != size
+                    or (self.kind == "fits" and path == paths[-1])):
+                segment = self._map(path, size)
+            segments.append(segment)
+        self.segments = segments
+        self.count = sum(segment.count for segment in segments)
+        return self.count
+
+    def __len__(self):
+        return self.count
+
+    def _locate(self, n):
+        if n < 0:
+            n += self.count
+        if not 0 <= n < self.count:
+            raise IndexError("frame %d of %d" % (n, self.count))
+        for segment in self.segments:
+            if n < segment.count:
+                return segment, n
+            n -= segment.count
+
+    def __getitem__(self, n):
+        # Frame n, a view of the mapped file where possible
+        segment, i = self._locate(n)
+        return segment.frame(i)
+
+    def stop(self):
+        # Ends frames() and get() of a following reader
+        self._stopped = True
+
+    def get(self, timeout=None):
+        # Returns the next Frame, or None at the end of the spool or when no
+        # frame is spooled within timeout seconds (the timeout of the
+        # reader by default, for ever if both are None)
+        if timeout is None:
+            timeout = self.timeout
+        deadline = None if timeout is None else time.time() + timeout
+        while self.position >= self.count:
+            if not self.follow or self._stopped:
+                if self.refresh() <= self.position:
+                    return None
+                break
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(self.poll)
+            self.refresh()
+
+        segment, i = self._locate(self.position)
+        self.position += 1
+        return Frame(self.position, segment.mtime, segment.frame(i))
+
+    def frames(self):
+        # Iterates over the frames until the spool ends
+        while True:
+            frame = self.get()
+            if frame is None:
+                return
+            yield frame
+
+    def close(self):
+        self.stop()
+        self.segments = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,102 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from PIL import Image
+
+from andor import Andor
+from Andor_iDus_XP import AndorIdus
+from export import scale
+from simulator import SimulatedSDK
+
+"""Checks the orientation convention of export.py on both camera classes:
+   an image written by SaveAsBmp or SaveAsImage and read back with PIL has
+   the rows and columns of the array from GetAcquiredData. The sensor of
+   the simulated SDK is not square and its signal is off centre, so a
+   transposed or flipped image does not match.
+
+       python -m unittest test_export """
+
+WIDTH, HEIGHT = 64, 24
+
+class OrientationTest:
+    camera = None
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        sdk = SimulatedSDK(width=WIDTH, height=HEIGHT, realtime=False, cosmics=0)
+        self.cam = self.camera(sdk)
+        self.cam.SetVerbose(False)
+        self.cam.SetAcquisitionMode(1)
+        self.cam.SetExposureTime(0.1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def acquire(self, readmode):
+        self.cam.SetReadMode(readmode)
+        if readmode == 4:
+            self.cam.SetImage(1, 1, 1, WIDTH, 1, HEIGHT)
+        self.assertEqual(self.cam.StartAcquisition(wait=True), "DRV_SUCCESS")
+        return self.cam.GetAcquiredData().copy()
+
+    def read(self, name):
+        return np.array(Image.open(os.path.join(self.directory, name)))
+
+    def test_bmp(self):
+        data = self.acquire(4)
+        self.assertEqual(data.shape, (HEIGHT, WIDTH))
+        self.cam.SaveAsBmp(os.path.join(self.directory, "image.bmp"))
+        image = self.read("image.bmp")
+        self.assertEqual(image.shape, data.shape)
+        self.assertTrue((image == scale(data, 8)).all())
+
+    def test_image_16bit(self):
+        data = self.acquire(4)
+        for name in ("image.png", "image.tif"):
+            self.cam.SaveAsImage(os.path.join(self.directory, name), bits=16)
+            image = self.read(name)
+            self.assertEqual(image.shape, data.shape)
+            self.assertTrue((image == data).all())
+            self.assertEqual(np.unravel_index(image.argmax(), image.shape),
+                             np.unravel_index(data.argmax(), data.shape))
+
+    def test_image_normalised(self):
+        data = self.acquire(4)
+        self.cam.SaveAsImage(os.path.join(self.directory, "image.png"), normalise="minmax")
+        image = self.read("image.png")
+        self.assertTrue((image == scale(data, 8, "minmax")).all())
+
+    def test_spectrum(self):
+        # A spectrum is an image one row high
+        data = self.acquire(0)
+        self.cam.SaveAsImage(os.path.join(self.directory, "spectrum.png"), bits=16)
+        image = self.read("spectrum.png")
+        self.assertEqual(image.shape, (1, WIDTH))
+        self.assertTrue((image[0] == data).all())
+
+class AndorTest(OrientationTest, unittest.TestCase):
+    camera = Andor
+
+class AndorIdusTest(OrientationTest, unittest.TestCase):
+    camera = AndorIdus
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+import numpy as np
+
+from andor import Andor
+from Andor_iDus_XP import AndorIdus
+from ringbuffer import FrameRingBuffer
+from simulator import SimulatedSDK
+
+"""Checks FrameRingBuffer on the simulated SDK, whose frames depend on
+   their series index only: streaming through a small ring wraps around
+   its slots and gives the frames iter_frames gives without one, and
+   frames the camera's circular buffer overwrote before they were fetched
+   are counted as overruns.
+
+       python -m unittest test_ringbuffer """
+
+# Frames held by the simulated camera
+CIRCULAR = 32
+
+class RingBufferTest:
+    camera = None
+
+    def open(self):
+        sdk = SimulatedSDK(width=32, height=8, realtime=False, circular_buffer=CIRCULAR)
+        cam = self.camera(sdk)
+        cam.SetVerbose(False)
+        cam.SetReadMode(0)
+        cam.SetAcquisitionMode(1)
+        cam.SetExposureTime(0.01)
+        return cam
+
+    def test_wrap_around(self):
+        expected = [frame.copy() for frame in self.open().iter_frames(23)]
+        cam = self.open()
+        ring = FrameRingBuffer.for_camera(cam, 5)
+        frames = [frame.copy() for frame in cam.iter_frames(23, ring=ring)]
+        self.assertEqual(len(frames), 23)
+        self.assertEqual(ring.fetched, ring.head)
+        self.assertTrue(ring.head > ring.capacity)
+        self.assertEqual(ring.overruns, 0)
+        for frame, want in zip(frames, expected):
+            self.assertTrue((frame == want).all())
+
+    def test_overrun(self):
+        cam = self.open()
+        ring = FrameRingBuffer.for_camera(cam, 5)
+        cam.SetAcquisitionMode(5)
+        self.assertEqual(cam.StartAcquisition(wait=False), "DRV_SUCCESS")
+        try:
+            # The camera completes 40 frames and keeps the last 32
+            for i in range(40):
+                cam.WaitForAcquisitionTimeOut(1000)
+            self.assertEqual(ring.fill(cam), 5)
+            self.assertEqual(ring.overruns, 40 - CIRCULAR)
+            self.assertEqual(ring.fill(cam), 0)
+
+            indices = []
+            for i in range(3):
+                for j in range(len(ring)):
+                    indices.append(ring.get(0)[0])
+                    ring.release()
+                ring.fill(cam)
+            self.assertEqual(indices, list(range(9, 24)))
+            self.assertEqual(ring.overruns, 40 - CIRCULAR)
+        finally:
+            cam.AbortAcquisition()
+
+class AndorTest(RingBufferTest, unittest.TestCase):
+    camera = Andor
+
+class AndorIdusTest(RingBufferTest, unittest.TestCase):
+    camera = AndorIdus
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import numpy as np
+from PIL import Image
+
+from fitswriter import FITSWriter
+from spool import SpoolReader, spool_files
+
+"""Checks SpoolReader on spools written to a temporary directory the way
+   the SDK writes them: raw, FITS and TIFF files are read back once the
+   run is over and while they grow, a frame being written is left for a
+   later refresh, and a following reader hands out the frames as they
+   come.
+
+       python -m unittest test_spool """
+
+SHAPE = (6, 8)
+
+def series(n, start=0):
+    # n frames, each different from the others
+    frames = np.arange(start * 48, (start + n) * 48) * 37 % 65536
+    return frames.astype(np.uint16).reshape((n,) + SHAPE)
+
+class SpoolTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stem = os.path.join(self.directory, "run")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data, mode="wb"):
+        with open(os.path.join(self.directory, name), mode) as f:
+            f.write(data)
+
+    def assertFrames(self, reader, frames):
+        self.assertEqual(len(reader), len(frames))
+        for i, frame in enumerate(frames):
+            self.assertTrue((reader[i] == frame).all())
+
+    def test_methods(self):
+        for method in (6, 8, 9):
+            self.assertRaises(ValueError, SpoolReader, self.stem, SHAPE, method)
+        # The data type of methods 1, 3 and 4 is that of the camera
+        self.assertRaises(ValueError, SpoolReader, self.stem, SHAPE, 1)
+        self.assertEqual(SpoolReader(self.stem, SHAPE, 0).dtype, np.int32)
+        self.assertEqual(SpoolReader(self.stem, SHAPE, 2).dtype, np.uint16)
+        self.assertEqual(SpoolReader(self.stem, SHAPE, 1, np.int32).dtype, np.int32)
+        self.assertEqual(SpoolReader(self.stem, SHAPE, 5).kind, "fits")
+        self.assertEqual(SpoolReader(self.stem, SHAPE, 7).kind, "tiff")
+
+    def test_files(self):
+        for name in ("run10.dat", "run9.dat", "run.ini", "other1.dat", "run1.fits", "run2.tif"):
+            self.write(name, b"")
+        os.mkdir(self.stem + "_0")
+        self.write(os.path.join("run_0", "run11.dat"), b"")
+        names = lambda method: [os.path.relpath(path, self.directory)
+                                for path in spool_files(self.stem, method)]
+        self.assertEqual(names(2), ["run1.fits", "run2.tif", "run9.dat", "run10.dat"])
+        self.assertEqual(names(3), ["run1.fits", "run2.tif", "run9.dat", "run10.dat",
+                                    os.path.join("run_0", "run11.dat")])
+        self.assertEqual(names(5), ["run1.fits"])
+        self.assertEqual(names(7), ["run2.tif"])
+
+    def test_raw(self):
+        frames = series(7)
+        self.write("run1.dat", frames[:4].tobytes())
+        self.write("run2.dat", frames[4:].tobytes())
+        self.assertFrames(SpoolReader(self.stem, SHAPE, 2), frames)
+
+    def test_raw_growing(self):
+        frames = series(5)
+        data = frames.tobytes()
+        framebytes = len(data) // 5
+        self.write("run1.dat", data[:framebytes + 10])
+        reader = SpoolReader(self.stem, SHAPE, 2)
+        self.assertFrames(reader, frames[:1])
+        self.write("run1.dat", data[framebytes + 10:3 * framebytes], "ab")
+        self.assertEqual(reader.refresh(), 3)
+        self.write("run1.dat", data[3 * framebytes:], "ab")
+        self.assertEqual(reader.refresh(), 5)
+        self.assertFrames(reader, frames)
+
+    def test_fits(self):
+        frames = series(6)
+        with FITSWriter(self.stem + "1.fits", SHAPE, np.uint16) as writer:
+            writer.extend(frames[:4])
+        with FITSWriter(self.stem + "2.fits", SHAPE, np.uint16) as writer:
+            writer.extend(frames[4:])
+        reader = SpoolReader(self.stem, SHAPE, 5)
+        self.assertFrames(reader, frames)
+        self.assertEqual(reader[0].dtype, np.uint16)
+
+    def test_fits_growing(self):
+        # Until it is flushed the header counts no frames, and they are
+        # counted from the size of the file
+        frames = series(4)
+        writer = FITSWriter(self.stem + "1.fits", SHAPE, np.uint16)
+        try:
+            reader = SpoolReader(self.stem, SHAPE, 5)
+            self.assertEqual(len(reader), 0)
+            writer.extend(frames[:2])
+            writer.file.flush()
+            self.assertEqual(reader.refresh(), 2)
+            writer.flush()
+            writer.append(frames[2])
+            writer.file.flush()
+            self.assertEqual(reader.refresh(), 2)
+            writer.append(frames[3])
+        finally:
+            writer.close()
+        self.assertEqual(reader.refresh(), 4)
+        self.assertFrames(reader, frames)
+
+    def test_tiff(self):
+        frames = series(4)
+        images = [Image.fromarray(frame) for frame in frames]
+        images[0].save(self.stem + "1.tif", save_all=True, append_images=images[1:])
+        self.assertFrames(SpoolReader(self.stem, SHAPE, 7), frames)
+
+    def test_tiff_growing(self):
+        # Cut anywhere, the file gives the pages before the cut
+        frames = series(3)
+        images = [Image.fromarray(frame) for frame in frames]
+        images[0].save(self.stem + "0.tif", save_all=True, append_images=images[1:])
+        with open(self.stem + "0.tif", "rb") as f:
+            data = f.read()
+        os.remove(self.stem + "0.tif")
+        counts = set()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for cut in range(0, len(data) + 1, 3):
+                self.write("run1.tif", data[:cut])
+                reader = SpoolReader(self.stem, SHAPE, 7)
+                self.assertFrames(reader, frames[:len(reader)])
+                counts.add(len(reader))
+        self.write("run1.tif", data)
+        self.assertEqual(len(SpoolReader(self.stem, SHAPE, 7)), 3)
+        self.assertTrue(counts >= set([0, 1, 2]))
+
+    def test_follow(self):
+        frames = series(4)
+        data = frames.tobytes()
+        self.write("run1.dat", data[:len(data) // 2])
+        reader = SpoolReader(self.stem, SHAPE, 2, follow=True, poll=0.01, timeout=0.1)
+        got = [reader.get(), reader.get()]
+        self.assertEqual(reader.get(timeout=0.05), None)
+        self.write("run1.dat", data[len(data) // 2:], "ab")
+        got.extend(reader.frames())
+        self.assertEqual([frame.index for frame in got], [1, 2, 3, 4])
+        for frame, want in zip(got, frames):
+            self.assertTrue((frame.data == want).all())
+
+        # A stopped reader ends with the frames spooled by then
+        self.write("run2.dat", series(1, 4).tobytes())
+        reader.stop()
+        self.assertTrue((reader.get().data == series(1, 4)[0]).all())
+        self.assertEqual(reader.get(), None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#   pyAndor - A Python wrapper for Andor's scientific cameras
+#   Copyright (C) 2009  Hamid Ohadi
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import functools
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+"""asyncio facade for the Shamrock spectrograph. SDK calls, including the
+   settling delays of the slit functions, run on a single thread executor
+   owned by the spectrograph so that the event loop is never blocked. All
+   methods return awaitables; any method of the wrapped Shamrock can be
+   called through the facade. As in asyncandor.py, without asyncio the
+   methods return concurrent.futures.Future objects instead. """
+
+class AsyncShamrock:
+    def __init__(self, shamrock, executor=None):
+        self.shamrock = shamrock
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        self.executor = executor
+
+    def __getattr__(self, name):
+        attr = getattr(self.shamrock, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(self._call, attr)
+
+    def _call(self, function, *args, **kwargs):
+        future = self.executor.submit(functools.partial(function, *args, **kwargs))
+        if asyncio is None:
+            return future
+        return asyncio.wrap_future(future)
+
+    def _set_wavelength(self, centre_wl):
+        self.shamrock.ShamrockSetWavelength(centre_wl)
+        return self.shamrock.ShamrockGetWavelength()
+
+    def set_wavelength(self, centre_wl):
+        # Resolves to the wavelength reported after the move
+        return self._call(self._set_wavelength, centre_wl)
+
+    def _set_slit(self, width):
+        self.shamrock.ShamrockSetSlit(width)
+        return self.shamrock.slit_width
+
+    def set_slit(self, width):
+        # Resolves to the slit width reported after the move
+        return self._call(self._set_slit, width)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -13,17 +13,65 @@ Created on Fri Apr 10 08:43:56 2015
 
 
 from ctypes import *
+import logging
+import os
 import time
 import sys
 
+# bind() and set_verbose() are shared with the camera classes
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Camera"))
+from bindings import bind, set_verbose
+
+log = logging.getLogger("pyandor.shamrock")
+
+# Prototypes of the Shamrock SDK functions, set once when the library is
+# loaded. Every call then returns the name of its error code.
+PROTOTYPES = {
+    "ShamrockInitialize":               (c_char_p,),
+    "ShamrockClose":                    (),
+    "ShamrockGetNumberDevices":         (POINTER(c_int),),
+    "ShamrockGetSerialNumber":          (c_int, POINTER(c_char)),
+    "ShamrockEepromGetOpticalParams":   (c_int, POINTER(c_float), POINTER(c_float), POINTER(c_float)),
+    "ShamrockGratingIsPresent":         (c_int, POINTER(c_int)),
+    "ShamrockGetTurret":                (c_int, POINTER(c_int)),
+    "ShamrockSetTurret":                (c_int, c_int),
+    "ShamrockGetNumberGratings":        (c_int, POINTER(c_int)),
+    "ShamrockGetGrating":               (c_int, POINTER(c_int)),
+    "ShamrockGetGratingInfo":           (c_int, c_int, POINTER(c_float), POINTER(c_char), POINTER(c_int), POINTER(c_int)),
+    "ShamrockGetGratingOffset":         (c_int, c_int, POINTER(c_int)),
+    "ShamrockSetGratingOffset":         (c_int, c_int, c_int),
+    "ShamrockGetDetectorOffset":        (c_int, POINTER(c_int)),
+    "ShamrockSetDetectorOffset":        (c_int, c_int),
+    "ShamrockWavelengthIsPresent":      (c_int, POINTER(c_int)),
+    "ShamrockGetWavelength":            (c_int, POINTER(c_float)),
+    "ShamrockSetWavelength":            (c_int, c_float),
+    "ShamrockAtZeroOrder":              (c_int, POINTER(c_int)),
+    "ShamrockGotoZeroOrder":            (c_int,),
+    "ShamrockGetWavelengthLimits":      (c_int, c_int, POINTER(c_float), POINTER(c_float)),
+    "ShamrockAutoSlitIsPresent":        (c_int, c_int, POINTER(c_int)),
+    "ShamrockAutoSlitReset":            (c_int, c_int),
+    "ShamrockGetAutoSlitWidth":         (c_int, c_int, POINTER(c_float)),
+    "ShamrockSetAutoSlitWidth":         (c_int, c_int, c_float),
+    "ShamrockSlitIsPresent":            (c_int, POINTER(c_int)),
+    "ShamrockGetSlit":                  (c_int, POINTER(c_float)),
+    "ShamrockSetSlit":                  (c_int, c_float),
+    "ShamrockSlitReset":                (c_int,),
+    "ShamrockSetPixelWidth":            (c_int, c_float),
+    "ShamrockGetPixelWidth":            (c_int, POINTER(c_float)),
+    "ShamrockGetNumberPixels":          (c_int, POINTER(c_int)),
+    "ShamrockSetNumberPixels":          (c_int, c_int),
+    "ShamrockGetCalibration":           (c_int, POINTER(c_float), c_int),
+    "ShamrockGetPixelCalibrationCoefficients": (c_int, POINTER(c_float), POINTER(c_float), POINTER(c_float), POINTER(c_float)),
+}
+
 class Shamrock:
     def __init__(self):
         #for Windows
         self.dll2 = CDLL("C:\\Program Files\\Andor SDK\\Drivers\\Shamrock64\\atshamrock")
-        self.dll = CDLL("C:\\Program Files\\Andor SDK\\Drivers\\Shamrock64\\ShamrockCIF")
+        self.dll = bind(CDLL("C:\\Program Files\\Andor SDK\\Drivers\\Shamrock64\\ShamrockCIF"),
+                        PROTOTYPES, ERROR_CODE, log)
         
-        tekst = c_char()        
-        error = self.dll.ShamrockInitialize(byref(tekst))
+        error = self.dll.ShamrockInitialize("")
         
         self.shamrocks = None
         self.current_shamrock = 0 #for more than one Shamrock this has to be varied, see ShamrockGetNumberDevices
@@ -38,40 +86,49 @@ class Shamrock:
         self.slit_width = None
         self.pixel_width = None
         self.pixel_number = None
-        self.status = ERROR_CODE[error]
-        self.verbosity = True
+        self.status = error
+        self.verbosity = log.isEnabledFor(logging.DEBUG)
         self.current_grating = None
+        self.tracer = None
     
     #some commands to print out returned errors from the Shamrock
     def verbose(self, error, function=''):
-        if self.verbosity is True:
-            print "[%s]: %s" %(function, error)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("[%s]: %s", function, error)
 
+    #the calls of every Shamrock are logged to the "pyandor.shamrock" logger,
+    #this sets its level and prints to stdout if logging is not set up
     def SetVerbose(self, state=True):
-        self.verbose = state
+        self.verbosity = state
+        set_verbose(log, state)
+
+    #records the timing and result of every SDK call in tracer (a
+    #CallTracer from Camera/profiler.py), or stops recording with None
+    def SetTracer(self, tracer=None):
+        if self.tracer is not None:
+            self.dll = self.dll.sdk
+        if tracer is not None:
+            self.dll = tracer.wrap(self.dll)
+        self.tracer = tracer
     
     #basic Shamrock features    
     def ShamrockInitialize(self):
         error = self.dll.ShamrockInitialize("")
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def ShamrockGetNumberDevices(self):
         no_shamrocks = c_int()
         error = self.dll.ShamrockGetNumberDevices(byref(no_shamrocks))
         self.shamrocks = no_shamrocks.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     def ShamrockClose(self):
         error = self.dll.ShamrockClose()
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     def ShamrockGetSerialNumber(self):
         self.ShamrockSN = c_char()
         error = self.dll.ShamrockGetSerialNumber(self.current_shamrock, byref(self.ShamrockSN))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.ShamrockSN
     
     def ShamrockEepromGetOpticalParams(self):
@@ -79,34 +136,30 @@ class Shamrock:
         self.AngularDeviation = c_float()
         self.FocalTilt = c_float()
         error = self.dll.ShamrockEepromGetOpticalParams(self.current_shamrock, byref(self.FocalLength), byref(self.AngularDeviation), byref(self.FocalTilt))
-        return ERROR_CODE[error]
+        return error
         
     #basic Grating features
     def ShamrockGratingIsPresent(self):
         is_present = c_int()
         error = self.dll.ShamrockGratingIsPresent(self.current_shamrock,is_present)
         self.grating = is_present.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.grating
     
     def ShamrockGetTurret(self):
         self.Turret = c_int()
         error = self.dll.ShamrockGetTurret(self.current_shamrock,byref(self.Turret))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.Turret        
     
     def ShamrockGetNumberGratings(self):
         self.noGratings = c_int()
         error = self.dll.ShamrockGetNumberGratings(self.current_shamrock,byref(self.noGratings))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.noGratings
     
     def ShamrockGetGrating(self):
         grating = c_int()
         error = self.dll.ShamrockGetGrating(self.current_shamrock,byref(grating))
         self.current_grating = grating.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def ShamrockGetGratingInfo(self):
         if self.current_grating == None:
@@ -117,7 +170,6 @@ class Shamrock:
         offset = c_int()        
         error = self.dll.ShamrockGetGratingInfo(self.current_shamrock,self.current_grating,byref(lines),byref(blaze),byref(home),byref(offset))
         self.CurrGratingInfo = [lines.value,blaze.value,home.value,offset.value]
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.CurrGratingInfo
     
     def ShamrockGetGratingOffset(self):
@@ -125,69 +177,58 @@ class Shamrock:
             self.ShamrockGetGrating()
         self.GratingOffset = c_int() #not this is in steps, so int
         error = self.dll.ShamrockGetGratingOffset(self.current_shamrock,self.current_grating,byref(self.GratingOffset))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.GratingOffset
     
     def ShamrockSetGratingOffset(self,offset):
-        error = self.dll.ShamrockSetGratingOffset(self.current_shamrock,self.current_grating,c_int(offset))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.ShamrockSetGratingOffset(self.current_shamrock,self.current_grating,offset)
+        return error
     
     def ShamrockGetDetectorOffset(self):
         self.DetectorOffset = c_int() #not this is in steps, so int
         error = self.dll.ShamrockGetDetectorOffset(self.current_shamrock,byref(self.DetectorOffset))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.DetectorOffset
         
     def ShamrockSetDetectorOffset(self,offset):
-        error = self.dll.ShamrockSetDetectorOffset(self.current_shamrock,self.current_grating,c_int(offset))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.ShamrockSetDetectorOffset(self.current_shamrock,offset)
+        return error
         
     def ShamrockSetTurret(self,turret):
-        error = self.dll.ShamrockSetTurret(self.current_shamrock,c_int(turret))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.ShamrockSetTurret(self.current_shamrock,turret)
+        return error
     
     #Wavelength features
     def ShamrockWavelengthIsPresent(self):
         ispresent = c_int()
         error = self.dll.ShamrockWavelengthIsPresent(self.current_shamrock,byref(ispresent))
         self.motor_present = ispresent.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def ShamrockGetWavelength(self):
         curr_wave = c_float()
         error = self.dll.ShamrockGetWavelength(self.current_shamrock,byref(curr_wave))
         self.current_wavelength = curr_wave.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.current_wavelength
         
     def ShamrockAtZeroOrder(self):
         is_at_zero = c_int()
         error = self.dll.ShamrockAtZeroOrder(self.current_shamrock,byref(is_at_zero))
         self.wavelength_is_zero = is_at_zero.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def ShamrockGetWavelengthLimits(self):
         min_wl = c_float()
         max_wl = c_float()
         error = self.dll.ShamrockGetWavelengthLimits(self.current_shamrock,self.current_grating,byref(min_wl),byref(max_wl))
         self.wl_limits = [min_wl.value, max_wl.value]
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def ShamrockSetWavelength(self,centre_wl):
-        error = self.dll.ShamrockSetWavelength(self.current_shamrock,c_float(centre_wl))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.ShamrockSetWavelength(self.current_shamrock,centre_wl)
+        return error
     
     def ShamrockGotoZeroOrder(self):
         error = self.dll.ShamrockGotoZeroOrder(self.current_shamrock)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     #Slit functions
     def ShamrockAutoSlitIsPresent(self):
@@ -201,87 +242,73 @@ class Shamrock:
     #Sets the slit to the default value (10um)
     def ShamrockAutoSlitReset(self,slit):
         error = self.dll.ShamrockAutoSlitReset(self.current_shamrock,self.current_slit)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     #finds if input slit is present
     def ShamrockSlitIsPresent(self):
         slit_present = c_int()
         error = self.dll.ShamrockSlitIsPresent(self.current_shamrock,byref(slit_present))
         self.slit_present = slit_present.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     #Output Slits
     def ShamrockGetAutoSlitWidth(self,slit):
         slitw = c_float()
         error = self.dll.ShamrockGetAutoSlitWidth(self.current_shamrock,slit,byref(slitw))
         self.out_slit_width = slitw.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     def ShamrockSetAutoSlitWidth(self,slit,width):
-        slit_w = c_float(width)        
-        error = self.dll.ShamrockSetAutoSlitWidth(self.current_shamrock,slit,slit_w)
+        error = self.dll.ShamrockSetAutoSlitWidth(self.current_shamrock,slit,width)
         self.out_slit_width = width
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     #Input Slits
     def ShamrockGetSlit(self):
         slitw = c_float()
         error = self.dll.ShamrockGetSlit(self.current_shamrock,byref(slitw))
         self.slit_width = slitw.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
         return self.slit_width
     
     def ShamrockSetSlit(self,width):
-        slit_w = c_float(width)
-        error = self.dll.ShamrockSetSlit(self.current_shamrock,slit_w)
+        error = self.dll.ShamrockSetSlit(self.current_shamrock,width)
         time.sleep(1)
         self.ShamrockGetSlit()
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     def ShamrockSlitReset(self):
         error = self.dll.ShamrockSlitReset(self.current_shamrock)
         time.sleep(1)
         self.ShamrockGetSlit()
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
     #Calibration functions
     def ShamrockSetPixelWidth(self,width):
-        error = self.dll.ShamrockSetPixelWidth(self.current_shamrock,c_float(width))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        error = self.dll.ShamrockSetPixelWidth(self.current_shamrock,width)
+        return error
     
     def ShamrockGetPixelWidth(self):
         pixelw = c_float()
         error = self.dll.ShamrockGetPixelWidth(self.current_shamrock,byref(pixelw))
         self.pixel_width = pixelw.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     def ShamrockGetNumberPixels(self):
         numpix = c_int()
         error = self.dll.ShamrockGetNumberPixels(self.current_shamrock,byref(numpix))
         self.pixel_number = numpix.value
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     def ShamrockSetNumberPixels(self,pixels):
         error = self.dll.ShamrockSetNumberPixels(self.current_shamrock,pixels)
         self.pixel_number = pixels
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
     
     def ShamrockGetCalibration(self):
         self.ShamrockGetNumberPixels()
         ccalib = c_float*self.pixel_number
         ccalib_array = ccalib()
-        error = self.dll.ShamrockGetCalibration(self.current_shamrock,pointer(ccalib_array),self.pixel_number)
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
+        error = self.dll.ShamrockGetCalibration(self.current_shamrock,ccalib_array,self.pixel_number)
         calib = []        
         
         for i in range(len(ccalib_array)):
@@ -289,7 +316,7 @@ class Shamrock:
 
         self.wl_calibration = calib[:]        
         
-        return ERROR_CODE[error]        
+        return error        
     
     def ShamrockGetPixelCalibrationCoefficients(self):
         self.ca = c_float()
@@ -297,8 +324,7 @@ class Shamrock:
         self.cc = c_float()
         self.cd = c_float()
         error = self.dll.ShamrockGetPixelCalibrationCoefficients(self.current_shamrock,byref(self.ca),byref(self.cb),byref(self.cc),byref(self.cd))
-        self.verbose(ERROR_CODE[error], sys._getframe().f_code.co_name)
-        return ERROR_CODE[error]
+        return error
         
 ERROR_CODE = {
     20201: "SHAMROCK_COMMUNICATION_ERROR",